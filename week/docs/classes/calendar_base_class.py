@@ -1,13 +1,18 @@
-from copy import deepcopy
+from bisect import bisect_left
+from itertools import count
 from datetime import date, timedelta, datetime
-from collections import namedtuple, defaultdict
+from collections import defaultdict
 
-from docs.database import Serialize, get_table_data
+from docs.database import Serialize, iter_table_rows
 from docs.classes.singleton_meta_class import SingletonMeta
+from docs.classes.occupancy_bitmap import OccupancyBitmap
+from docs.classes.lazy_calendar import LazyCalendar
+from docs.classes.usage_store import UsageStore, from_micros, machine_usage_tuple, to_micros
 from docs.utils import print_red
 
 
-machine_usage_tuple = namedtuple("machine_usage_tuple","start end boots_id position_id string_color")
+"Версии смен берутся из общего счетчика, чтобы номер версии никогда не повторялся для разных состояний смены"
+_version_counter = count(1)
 
 
 class CalendarBase(metaclass=SingletonMeta):
@@ -18,7 +23,8 @@ class CalendarBase(metaclass=SingletonMeta):
         self.total_work_hours = None
         self.max_shift = None
         self.max_date = Serialize.start_date + timedelta(days=self.period)
-        self.calendar_copy = None
+        self.undo_log = None
+        self.changed_shifts = set()
         self.calendar = None
         self.name = None
 
@@ -35,7 +41,8 @@ class CalendarBase(metaclass=SingletonMeta):
 
     def reset_calendar(self):
         self.calendar = {}
-        self.calendar_copy = self.calendar.copy()
+        self.undo_log = None
+        self.changed_shifts = set()
         self.max_date = Serialize.start_date + timedelta(days=self.period)
         self.max_shift = {}
         self.total_work_hours = 0.0
@@ -44,39 +51,48 @@ class CalendarBase(metaclass=SingletonMeta):
 
     @staticmethod
     def _get_cal_dict(cls):
-        obj_cal_list: list = get_table_data(cls, cls.id > 0)
+        obj_cal_rows = iter_table_rows(cls, (cls.calendar_id, cls.date_start, cls.date_end, cls.duration, cls.shift),
+                                       cls.id > 0)
         obj_cal_dict = defaultdict(dict)
 
-        for c_obj in obj_cal_list:
+        for c_obj in obj_cal_rows:
             if not c_obj.duration or c_obj.duration <= 0.0:
                 continue
-            duration = (c_obj.date_end - c_obj.date_start).total_seconds()
             obj_cal_dict[c_obj.calendar_id][(c_obj.date_start.date(), c_obj.shift)] = \
-                {
-                    "time_total": duration,
-                    "time_usage": 0.0,
-                    "period": (c_obj.date_start, c_obj.date_end),
-                    "machine_usage": [],
-                    "free_time": [(c_obj.date_start,
-                                   c_obj.date_end,
-                                   duration)],
-                }
+                CalendarBase._shift_data(c_obj.date_start, c_obj.date_end)
 
         return obj_cal_dict
 
-    def _calendar_expansion(self):
+    @staticmethod
+    def _shift_data(date_start: datetime, date_end: datetime) -> dict:
+        """
+        Возвращает данные пустой смены с заданным периодом
+        :param date_start: Начало смены
+        :type date_start: datetime
+        :param date_end: Конец смены
+        :type date_end: datetime
+        """
+        day_shift = {
+            "time_total": (date_end - date_start).total_seconds(),
+            "time_usage": 0.0,
+            "period": (date_start, date_end),
+            "machine_usage": UsageStore(),
+            "free_time": [(to_micros(date_start), to_micros(date_end))],
+            "free_micros": to_micros(date_end) - to_micros(date_start),
+        }
+        if Serialize.is_bitmap_calendar:
+            day_shift["occupancy"] = OccupancyBitmap(date_start, date_end)
+        return day_shift
+
+    def _object_calendar(self, template: dict) -> LazyCalendar:
+        """
+        Создает календарь объекта по общему шаблону его календаря.
+        Данные смен копируются из шаблона только при первой записи
+        """
+        last_date = None
         if self.period is not None:
-            for id_obj, value in self.calendar.items():
-                max_date = max(value)[0]
-                while (max_date - Serialize.start_date.date()).days + 1 < self.period:
-                    max_date += timedelta(days=1)
-                    date_for_copy = max_date - timedelta(days=7)
-                    shift = 1
-                    while self.calendar[id_obj].get((date_for_copy, shift)):
-                        self.calendar[id_obj][max_date, shift] = (
-                            deepcopy(self.calendar[id_obj][date_for_copy, shift]))
-                        shift += 1
-        return
+            last_date = Serialize.start_date.date() + timedelta(days=self.period - 1)
+        return LazyCalendar(template, last_date)
 
     def _get_element(self, id_obj, cal_date, shift, element):
         """
@@ -113,7 +129,84 @@ class CalendarBase(metaclass=SingletonMeta):
         """
         if self.calendar.get(id_obj) is None or self.calendar[id_obj].get((cal_date, shift)) is None:
             return []
-        return self._get_element(id_obj, cal_date, shift, "free_time")
+        occupancy = self.get_occupancy(id_obj, cal_date, shift)
+        if occupancy is not None:
+            return occupancy.free_time()
+        return [(from_micros(start), from_micros(end), (end - start) / 10 ** 6)
+                for start, end in self._get_element(id_obj, cal_date, shift, "free_time")]
+
+    def get_free_spans(self, id_obj, cal_date, shift) -> list[tuple[int, int]]:
+        """
+        Возвращает свободные промежутки смены в целых микросекундах от ``EPOCH``, не создавая ``datetime``
+        :param id_obj: Индекс соответствующего объекта
+        :type id_obj: int
+        :param cal_date: Дата формата ``date``
+        :type cal_date: date
+        :param shift: Рабочая смена
+        :type shift: int
+        :returns: Возвращает список следующего формата: [(``start_micros``, ``end_micros``),]
+        """
+        calendar = self.calendar.get(id_obj)
+        day_shift = calendar.get((cal_date, shift)) if calendar is not None else None
+        if day_shift is None:
+            return []
+        occupancy = day_shift.get("occupancy")
+        if occupancy is not None:
+            return occupancy.free_spans()
+        return day_shift["free_time"]
+
+    def get_free_micros(self, id_obj, cal_date, shift) -> int:
+        """Возвращает суммарное свободное время смены в микросекундах (0, если смены нет)"""
+        calendar = self.calendar.get(id_obj)
+        day_shift = calendar.get((cal_date, shift)) if calendar is not None else None
+        if day_shift is None:
+            return 0
+        occupancy = day_shift.get("occupancy")
+        if occupancy is not None:
+            return sum(end - start for start, end in occupancy.free_spans())
+        return day_shift["free_micros"]
+
+    def get_version(self, id_obj, cal_date, shift) -> int:
+        """
+        Возвращает версию смены: уникальный номер ее состояния, меняющийся при каждой записи в смену
+        и возвращающийся к прежнему значению при откате. Смена без записей и отсутствующая смена имеют версию 0
+        :param id_obj: Индекс соответствующего объекта
+        :type id_obj: int
+        :param cal_date: Дата формата ``date``
+        :type cal_date: date
+        :param shift: Рабочая смена
+        :type shift: int
+        """
+        calendar = self.calendar.get(id_obj)
+        day_shift = calendar.get((cal_date, shift)) if calendar is not None else None
+        if day_shift is None:
+            return 0
+        return day_shift.get("version", 0)
+
+    def pop_changed_shifts(self) -> set[tuple[int, date, int]]:
+        """
+        Возвращает смены (``id_obj``, ``дата``, ``смена``), изменившиеся с прошлого вызова
+        (вставка использования или ее откат), и очищает этот список
+        """
+        if not self.changed_shifts:
+            return set()
+        changed_shifts, self.changed_shifts = self.changed_shifts, set()
+        return changed_shifts
+
+    def get_occupancy(self, id_obj, cal_date, shift) -> OccupancyBitmap | None:
+        """
+        Возвращает битовую карту занятости смены, если календарь построен с ``Serialize.calendar_backend = "bitmap"``
+        :param id_obj: Индекс соответствующего объекта
+        :type id_obj: int
+        :param cal_date: Дата формата ``date``
+        :type cal_date: date
+        :param shift: Рабочая смена
+        :type shift: int
+        :returns: ``OccupancyBitmap`` или ``None``
+        """
+        if self.calendar.get(id_obj) is None or self.calendar[id_obj].get((cal_date, shift)) is None:
+            return None
+        return self.calendar[id_obj][(cal_date, shift)].get("occupancy")
 
     def get_time_total(self, id_obj, cal_date, shift) -> float:
         """
@@ -154,8 +247,7 @@ class CalendarBase(metaclass=SingletonMeta):
         """
         return self._get_element(id_obj, cal_date, shift, "period")
 
-    def get_machine_usage(self, id_obj, cal_date, shift) \
-            -> list[machine_usage_tuple[datetime, datetime, int, int, str]]:
+    def get_machine_usage(self, id_obj, cal_date, shift) -> UsageStore:
         """
         Возвращает занятые промежутки времени работы машины заданного дня
         :param id_obj: Индекс соответствующего объекта
@@ -164,7 +256,7 @@ class CalendarBase(metaclass=SingletonMeta):
         :type cal_date: date
         :param shift: Рабочая смена
         :type shift: int
-        :returns: Возвращает список следующего формата:
+        :returns: Возвращает хранилище, которое ведет себя как список следующего формата:
         [(``start end boots_id position_id string_color``),]
         """
         return self._get_element(id_obj, cal_date, shift, "machine_usage")
@@ -181,32 +273,23 @@ class CalendarBase(metaclass=SingletonMeta):
         else:
             return []
 
-    def __free_time(self, id_obj, cal_date, shift) -> list[tuple[datetime, datetime, float]]:
-        """Возвращает свободные промежутки использования машины в заданный день
-        :param id_obj: Индекс соответствующего объекта
-        :type id_obj: int
-        :param cal_date: Дата формата ``date``
-        :type cal_date: date
-        :param shift: Рабочая смена
-        :type shift: int
-        """
-        free_time = []
-        free_end = self.calendar[id_obj][(cal_date, shift)]["period"][0]
-        end_shift = self.calendar[id_obj][(cal_date, shift)]["period"][1]
-
-        for start_usage, end_usage, _, _, _ in self.calendar[id_obj][(cal_date, shift)]["machine_usage"]:
-            if start_usage == free_end:
-                free_end = end_usage
-            else:
-                duration = (start_usage - free_end).total_seconds()
-                free_time.append((free_end, start_usage, duration))
-                free_end = end_usage
+    @staticmethod
+    def _free_spans(day_shift) -> list[tuple[int, int]]:
+        """Строит свободные промежутки смены по колонкам ``machine_usage`` в микросекундах от ``EPOCH``"""
+        usages = day_shift["machine_usage"]
+        free_spans = []
+        free_end = to_micros(day_shift["period"][0])
+        end_shift = to_micros(day_shift["period"][1])
+
+        for start_usage, end_usage in zip(usages.starts, usages.ends):
+            if start_usage != free_end:
+                free_spans.append((free_end, start_usage))
+            free_end = end_usage
 
         if free_end < end_shift:
-            duration = (end_shift - free_end).total_seconds()
-            free_time.append((free_end, end_shift, duration))
+            free_spans.append((free_end, end_shift))
 
-        return free_time
+        return free_spans
 
     def add_time_usage(self,
                        id_obj: int,
@@ -215,7 +298,7 @@ class CalendarBase(metaclass=SingletonMeta):
                        hours: float
                        ) -> None:
         """Добавляет параметр ``hours`` к ``time_usage`` заданного дня"""
-        self.calendar[id_obj][(cal_date, shift)]["time_usage"] += hours
+        self.calendar[id_obj].writable((cal_date, shift))["time_usage"] += hours
 
     def add_machine_usage(self,
                           id_obj: int,
@@ -235,15 +318,128 @@ class CalendarBase(metaclass=SingletonMeta):
          цвет используемых нитей формата ``str``)
         """
         machine_usage = machine_usage_tuple(*machine_usage)
-        self.calendar[id_obj][(cal_date, shift)]["machine_usage"].append(machine_usage)
-        "Сортируем, чтобы все шло по порядку"
-        self.calendar[id_obj][(cal_date, shift)]["machine_usage"] = (
-            sorted(self.calendar[id_obj][(cal_date, shift)]["machine_usage"], key=lambda x: (x.start, x.end)))
+        day_shift = self.calendar[id_obj].writable((cal_date, shift))
+        usages = day_shift["machine_usage"]
+
+        "Вставляем бинарным поиском, чтобы все шло по порядку"
+        idx = usages.insert(machine_usage)
+
+        time_usage = day_shift["time_usage"]
+        free_micros = day_shift["free_micros"]
+        version = day_shift.get("version", 0)
+        day_shift["version"] = next(_version_counter)
         duration: float = (machine_usage.end - machine_usage.start).total_seconds()
         self.add_time_usage(id_obj, cal_date, shift, duration)
-        self.calendar[id_obj][(cal_date, shift)]["free_time"] = self.__free_time(id_obj, cal_date, shift)
+
+        if "occupancy" in day_shift:
+            replaced = day_shift["occupancy"].occupy(machine_usage.start, machine_usage.end)
+        else:
+            replaced = self.__split_free_time(day_shift, idx)
+        if replaced is None:
+            old_free_time = day_shift["free_time"]
+            day_shift["free_time"] = self._free_spans(day_shift)
+            replaced = (0, len(day_shift["free_time"]), old_free_time)
+        if "occupancy" not in day_shift:
+            lo, hi, old_free_time = replaced
+            day_shift["free_micros"] += (sum(end - start for start, end in day_shift["free_time"][lo:hi])
+                                         - sum(end - start for start, end in old_free_time))
+
+        self.changed_shifts.add((id_obj, cal_date, shift))
+        if self.undo_log is not None:
+            self.undo_log.append((self._undo_machine_usage,
+                                  (id_obj, cal_date, shift, day_shift, idx, time_usage, version, free_micros,
+                                   *replaced)))
         return
 
+    def remove_position_usage(self, id_obj: int, cal_date: date, shift: int, id_position: int) -> bool:
+        """
+        Убирает из смены все использования заданной позиции вместе с ее переналадками
+        и пересчитывает свободное время смены. В транзакции прежнее состояние смены записывается в журнал отмены
+        :param id_obj: Индекс объекта
+        :param cal_date: Дата формата ``date``
+        :param shift: Смена
+        :param id_position: Индекс позиции
+        :returns: ``True``, если в смене были использования позиции
+        """
+        calendar = self.calendar.get(id_obj)
+        day_shift = calendar.get((cal_date, shift)) if calendar is not None else None
+        code = UsageStore._codes.get(id_position)
+        if day_shift is None or code is None or code not in day_shift["machine_usage"].positions:
+            return False
+
+        day_shift = calendar.writable((cal_date, shift))
+        usages = day_shift["machine_usage"]
+        saved = (usages, day_shift["free_time"], day_shift.get("occupancy"), day_shift["time_usage"],
+                 day_shift.get("version", 0), day_shift["free_micros"])
+
+        "Собираем новое хранилище без использований позиции, старое остается в журнале отмены как есть"
+        new_usages = usages.without_position(id_position)
+        removed_micros = (sum(usages.ends) - sum(usages.starts)) - (sum(new_usages.ends) - sum(new_usages.starts))
+
+        day_shift["machine_usage"] = new_usages
+        day_shift["time_usage"] -= removed_micros / 10 ** 6
+        day_shift["version"] = next(_version_counter)
+        day_shift["free_time"] = self._free_spans(day_shift)
+        day_shift["free_micros"] = sum(end - start for start, end in day_shift["free_time"])
+        if "occupancy" in day_shift:
+            occupancy = OccupancyBitmap(*day_shift["period"])
+            for start, end in new_usages.intervals():
+                occupancy.occupy(start, end)
+            day_shift["occupancy"] = occupancy
+
+        self.changed_shifts.add((id_obj, cal_date, shift))
+        if self.undo_log is not None:
+            self.undo_log.append((self._undo_remove_usage, (id_obj, cal_date, shift, day_shift, saved)))
+        return True
+
+    def _undo_remove_usage(self, id_obj, cal_date, shift, day_shift, saved) -> None:
+        """Возвращает смене использования, убранные ``remove_position_usage``"""
+        self.changed_shifts.add((id_obj, cal_date, shift))
+        (day_shift["machine_usage"], day_shift["free_time"], occupancy, day_shift["time_usage"],
+         day_shift["version"], day_shift["free_micros"]) = saved
+        if occupancy is not None:
+            day_shift["occupancy"] = occupancy
+
+    @staticmethod
+    def __split_free_time(day_shift: dict, idx: int) -> tuple[int, int, list] | None:
+        """
+        Вырезает вставленное использование из свободного промежутка, в который оно попало
+        :param day_shift: Данные календаря заданного дня и смены
+        :param idx: Позиция вставленного использования в ``machine_usage``
+        :returns: Кортеж (``индекс промежутка``, ``индекс после новых промежутков``, ``замененные промежутки``)
+         или ``None``, если использование пересекается с соседними и свободное время нужно пересчитать целиком
+        """
+        usages = day_shift["machine_usage"]
+        free_time = day_shift["free_time"]
+        start_usage, end_usage = usages.starts[idx], usages.ends[idx]
+        is_last = idx == len(usages) - 1
+
+        gap_start = usages.ends[idx - 1] if idx else to_micros(day_shift["period"][0])
+        gap_end = to_micros(day_shift["period"][1]) if is_last else usages.starts[idx + 1]
+
+        if not gap_start <= start_usage <= end_usage <= gap_end:
+            return None
+        if gap_start == gap_end:
+            return 0, 0, []
+
+        "Концы промежутков совпадают с началами использований, поэтому отсортированы"
+        gap_idx = bisect_left(free_time, gap_end, key=lambda x: x[1])
+        while gap_idx < len(free_time) and free_time[gap_idx][1] == gap_end:
+            if free_time[gap_idx][0] == gap_start:
+                break
+            gap_idx += 1
+        else:
+            return None
+
+        new_gaps = []
+        if gap_start < start_usage:
+            new_gaps.append((gap_start, start_usage))
+        if end_usage < gap_end:
+            new_gaps.append((end_usage, gap_end))
+        old_gaps = free_time[gap_idx:gap_idx + 1]
+        free_time[gap_idx:gap_idx + 1] = new_gaps
+        return gap_idx, gap_idx + len(new_gaps), old_gaps
+
     def add_frozen(self, id_machine, cal_date, shift, machine_usage):
         """
         Разрешает проблемы, которые могут возникнуть в процессе заморозки шагов и закрепляет их в календаре
@@ -279,7 +475,7 @@ class CalendarBase(metaclass=SingletonMeta):
         # На случай, если придется разбивать это время на несколько частей
         freeze_list = [(start_freeze, end_freeze)]
 
-        for start_usage, end_usage, _, _ in self.calendar[id_machine][(cal_date, shift)].get("machine_usage"):
+        for start_usage, end_usage in self.calendar[id_machine][(cal_date, shift)].get("machine_usage").intervals():
             for start_freeze, end_freeze in freeze_list.copy():
                 # Замороженное время уже полностью занято -> убираем из списка
                 if start_usage <= start_freeze < end_freeze <= end_usage:
@@ -338,24 +534,43 @@ class CalendarBase(metaclass=SingletonMeta):
     #
     #     return new_days_shifts
 
-    def copy_nested_dict(self, obj):
+    def begin(self) -> None:
         """
-        Рекурсивно создает глубокую копию вложенных словарей, списков и множеств.
+        Начинает транзакцию: все последующие вставки в календарь записываются в журнал отмены
+        в виде пар (``функция отмены``, ``аргументы``).
+        Незафиксированная предыдущая транзакция при этом фиксируется
         """
-        if isinstance(obj, dict):
-            return {key: self.copy_nested_dict(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [self.copy_nested_dict(item) for item in obj]
-        elif isinstance(obj, set):
-            return {self.copy_nested_dict(item) for item in obj}
-        return obj
+        self.undo_log = []
+
+    def commit(self) -> None:
+        """Фиксирует изменения календаря, сделанные с начала транзакции"""
+        self.undo_log = None
 
+    def rollback(self) -> None:
+        """Отменяет изменения календаря, сделанные с начала транзакции, в обратном порядке"""
+        if self.undo_log is None:
+            return
+        for undo, args in reversed(self.undo_log):
+            undo(*args)
+        self.undo_log = None
+
+    def _undo_machine_usage(self, id_obj, cal_date, shift, day_shift, idx, time_usage, version, free_micros,
+                            lo, hi, old) -> None:
+        """Убирает использование, вставленное ``add_machine_usage``, и возвращает свободное время и версию смены"""
+        self.changed_shifts.add((id_obj, cal_date, shift))
+        del day_shift["machine_usage"][idx]
+        day_shift["time_usage"] = time_usage
+        day_shift["version"] = version
+        day_shift["free_micros"] = free_micros
+        if "occupancy" in day_shift:
+            day_shift["occupancy"].restore(lo, hi, old)
+        else:
+            day_shift["free_time"][lo:hi] = old
 
     def set_calendar_copy(self) -> None:
-        """Снимает копию с календаря и записывает в соответствущую переменную"""
-        #self.calendar_copy = deepcopy(self.calendar)
-        self.calendar_copy = self.copy_nested_dict(self.calendar)
+        """Запоминает состояние календаря, к которому можно вернуться через ``calendar_rollback``"""
+        self.begin()
 
     def calendar_rollback(self) -> None:
-        """Возвращает календарь к состоянию на момент снятия копии календаря"""
-        self.calendar = self.calendar_copy
+        """Возвращает календарь к состоянию на момент вызова ``set_calendar_copy``"""
+        self.rollback()
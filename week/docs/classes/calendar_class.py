@@ -1,9 +1,10 @@
-from copy import deepcopy
-from datetime import timedelta, date, datetime
+from collections import defaultdict
+from datetime import date, datetime
 
 from docs.database import get_table_data, MachineDB, MachineCalendarDB, Serialize
 from docs.classes.machine_groups_class import machine_groups
 from docs.classes.calendar_base_class import CalendarBase
+from docs.classes.usage_store import UsageStore
 from docs.utils import print_red, print_green, print_lblue
 
 
@@ -15,15 +16,19 @@ class MachineCalendar(CalendarBase):
           ``time_usage``: ``k_hours``,\n
           ``period``: (``datetime``, ``datetime``),\n
           ``machines_usage``: [(``start, end, boots_id, position_id``)],\n
-          ``free_time``: [(``start``, ``end``, ``duration``)]}}}"""
+          ``free_time``: [(``start_micros``, ``end_micros``)]}}}"""
+
+    machine_shift = 1
 
     def __init__(self):
         super().__init__()
         self.name = "КАЛЕНДАРЬ ОБОРУДОВАНИЯ"
+        self.color_timeline = defaultdict(UsageStore)
 
     def reset_calendar(self):
         print_lblue("НАЧИНАЮ ФОРМИРОВАНИЕ КАЛЕНДАРЯ ОБОРУДОВАНИЯ")
         super().reset_calendar()
+        self.color_timeline = defaultdict(UsageStore)
         self.__set_calendar()
         print_green("КАЛЕНДАРЬ ОБОРУДОВАНИЯ УСПЕШНО СФОРМИРОВАН")
 
@@ -38,18 +43,15 @@ class MachineCalendar(CalendarBase):
                 print_red(f"НЕТ ТАКОГО КАЛЕНДАРЯ МАШИН - {machine.machine_calendar_id}\n"
                           f"ПРОБЛЕМА С МАШИНОЙ - {machine.id}")
             else:
-                self.calendar[machine.id] = deepcopy(mc_dict.get(machine.machine_calendar_id))
+                self.calendar[machine.id] = self._object_calendar(mc_dict.get(machine.machine_calendar_id))
 
                 """Поиск суммарного количества часов работы всех машин"""
-                self.total_work_hours += sum(x["time_total"] for x in self.calendar[machine.id].values())
-
-        """РАСТЯГИВАНИЕ КАЛЕНДАРЯ"""
-        self._calendar_expansion()
+                self.total_work_hours += sum(x["time_total"] for x in self.calendar[machine.id].template.values())
 
         for id_machine in self.calendar:
             for machine_group in machine_groups.get_machine_groups(id_machine):
                 """Поиск количества смен и их порядок для групп оборудования на каждый день"""
-                for (c_date, shift), value in self.calendar.get(id_machine).items():
+                for (c_date, shift), value in self.calendar.get(id_machine).template_items():
                     self.max_shift[machine_group, c_date] = (
                         self.max_shift.get((machine_group, c_date), []))
                     if shift not in [x[0] for x in self.max_shift[machine_group, c_date]]:
@@ -57,30 +59,67 @@ class MachineCalendar(CalendarBase):
                         self.max_shift[machine_group, c_date] = sorted(
                             self.max_shift[machine_group, c_date], key=lambda x: x[1])
 
-    def get_last_color(self, id_machine: int, cal_date: date, date_and_time: datetime):
+    def add_machine_usage(self,
+                          id_obj: int,
+                          cal_date: date,
+                          shift: int,
+                          machine_usage: tuple[datetime, datetime, int|str|None, int|None, str|None]) -> None:
+        """
+        Добавление использования машины, в заданный день.
+        Использования смены оборудования начиная с ``Serialize.start_date`` также попадают в ``color_timeline``
+        """
+        super().add_machine_usage(id_obj, cal_date, shift, machine_usage)
+        if shift != self.machine_shift or cal_date < Serialize.start_date.date():
+            return
+
+        timeline = self.color_timeline[id_obj]
+        idx = timeline.insert(machine_usage)
+        if self.undo_log is not None:
+            self.undo_log.append((self._undo_color, (timeline, idx)))
+
+    @staticmethod
+    def _undo_color(timeline, idx) -> None:
+        """Убирает использование из ``color_timeline``"""
+        del timeline[idx]
+
+    def remove_position_usage(self, id_obj: int, cal_date: date, shift: int, id_position: int) -> bool:
+        """
+        Убирает из смены все использования заданной позиции, а для смены оборудования - еще и из ``color_timeline``,
+        чтобы убранные шаги не влияли на цвет нитки следующих. В транзакции прежняя лента цветов
+        записывается в журнал отмены
+        """
+        if not super().remove_position_usage(id_obj, cal_date, shift, id_position):
+            return False
+        timeline = self.color_timeline.get(id_obj)
+        if shift != self.machine_shift or not timeline:
+            return True
+
+        "Убираем использования позиции только в пределах периода смены"
+        start_shift, end_shift = self.get_period(id_obj, cal_date, shift)
+        self.color_timeline[id_obj] = timeline.without_position(id_position,
+                                                                timeline.bisect(start_shift, start_shift),
+                                                                timeline.bisect(end_shift, end_shift))
+        if self.undo_log is not None:
+            self.undo_log.append((self._undo_remove_color, (id_obj, timeline)))
+        return True
+
+    def _undo_remove_color(self, id_obj, timeline) -> None:
+        """Возвращает ``color_timeline`` оборудования, из которой ``remove_position_usage`` убрал использования"""
+        self.color_timeline[id_obj] = timeline
+
+    def get_last_color(self, id_machine: int, date_and_time: datetime):
         """
         Функция возвращает цвет нитки по заданным параметрам
         :param id_machine: Индекс оборудования в котором необходимо искать цвет нитки.
-        :param cal_date: Дата в которую планируется вставить шаг.
         :param date_and_time: Время и дата формата ``datetime`` куда планируется вставить шаг.
-        :return: Последний цвет использовавшийся на данной машине до ``date_and_time``
+        :return: Цвет последнего использования данной машины, закончившегося до ``date_and_time``,
         или ``None`` в случае если не использовались нитки на данном оборудовании до заданного момента.
         """
-
-        machine_shift = 1
-        nothing = "Ничего"
-        string_color = nothing
-
-        def find_color(id, c_date):
-            color = nothing
-            for machine_usage in self.get_machine_usage(id, c_date, machine_shift):
-                if machine_usage.end > date_and_time:
-                    break
-                color = machine_usage.string_color
-            return color
-
-        while string_color == nothing and cal_date >= Serialize.start_date.date():
-            string_color = find_color(id_machine, cal_date)
-            cal_date -= timedelta(days=1)
-
-        return None if string_color == nothing else string_color
+        timeline = self.color_timeline.get(id_machine)
+        if not timeline:
+            return None
+
+        idx = timeline.bisect(date_and_time, date_and_time) - 1
+        if idx >= 0 and timeline[idx].end > date_and_time:
+            idx -= 1
+        return timeline[idx].string_color if idx >= 0 else None
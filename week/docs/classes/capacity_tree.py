@@ -0,0 +1,57 @@
+class CapacityTree:
+    """
+    Дерево отрезков максимумов над слотами (``день``, ``смена``) горизонта планирования.\n
+    В листе хранится свободное время слота в микросекундах, в узле - максимум по его поддереву,
+    поэтому первый слот не раньше заданного со свободным временем не меньше ``at_least``
+    находится за логарифм от числа слотов
+    """
+
+    def __init__(self, values: list[int]):
+        self.count = len(values)
+        self.size = 1
+        while self.size < max(self.count, 1):
+            self.size *= 2
+        self.tree = [0] * (2 * self.size)
+        self.tree[self.size:self.size + self.count] = values
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def value(self, slot: int) -> int:
+        """Возвращает свободное время слота"""
+        return self.tree[self.size + slot]
+
+    def update(self, slot: int, value: int) -> None:
+        """Записывает свободное время слота и пересчитывает максимумы до корня"""
+        node = self.size + slot
+        self.tree[node] = value
+        node //= 2
+        while node:
+            node_max = max(self.tree[2 * node], self.tree[2 * node + 1])
+            if self.tree[node] == node_max:
+                break
+            self.tree[node] = node_max
+            node //= 2
+
+    def find_first(self, slot: int, at_least: int) -> int | None:
+        """
+        Возвращает первый слот не раньше ``slot`` со свободным временем не меньше ``at_least``
+        или ``None``, если такого слота нет
+        """
+        if slot >= self.count:
+            return None
+        node = self.size + slot
+        if self.tree[node] >= at_least:
+            return slot
+        # Поднимаемся, пока не найдем правого соседа с подходящим максимумом
+        while node > 1:
+            if node % 2 == 0 and self.tree[node + 1] >= at_least:
+                node += 1
+                break
+            node //= 2
+        else:
+            return None
+        # Спускаемся к самому левому подходящему листу
+        while node < self.size:
+            node = 2 * node if self.tree[2 * node] >= at_least else 2 * node + 1
+        slot = node - self.size
+        return slot if slot < self.count else None
@@ -0,0 +1,84 @@
+from copy import copy
+from datetime import date, timedelta
+
+
+class LazyCalendar(dict):
+    """
+    Календарь одного объекта формата {(``дата``, ``смена``): ``данные смены``}.\n
+    Шаблон календаря общий для всех объектов с одним ``calendar_id``. Пока в смену ничего не записано,
+    календарь отдает данные смены шаблона, а дни после последнего дня шаблона (до ``last_date`` включительно) -
+    данные того же дня недели из шаблона. Изменяемая часть смены копируется при первой записи (``writable``),
+    поэтому данные, полученные чтением, изменять нельзя.
+    Обычный обход словаря возвращает только уже запрошенные дни, все дни горизонта возвращает ``template_items``
+    """
+
+    def __init__(self, template: dict, last_date: date | None):
+        super().__init__()
+        self.template = template
+        self.max_template_date = max(template)[0]
+        self.last_date = last_date
+        self.owned = set()
+
+    def _source_key(self, key) -> tuple[date, int] | None:
+        """
+        Возвращает ключ дня шаблона, по которому строится заданный день, или ``None``,
+        если такого дня в календаре нет.
+        День после шаблона строится, только если в дне шаблона есть все смены с первой по заданную
+        """
+        if key in self.template:
+            return key
+        cal_date, shift = key
+        if self.last_date is None or not self.max_template_date < cal_date <= self.last_date:
+            return None
+        weeks = -(-(cal_date - self.max_template_date).days // 7)
+        source_date = cal_date - timedelta(days=7 * weeks)
+        if not all((source_date, i) in self.template for i in range(1, shift + 1)):
+            return None
+        return source_date, shift
+
+    def __missing__(self, key):
+        source_key = self._source_key(key)
+        if source_key is None:
+            raise KeyError(key)
+        day_shift = self.template[source_key]
+        self[key] = day_shift
+        return day_shift
+
+    def writable(self, key) -> dict:
+        """Возвращает данные смены, принадлежащие только этому объекту, копируя их при первой записи"""
+        if key in self.owned:
+            return dict.__getitem__(self, key)
+        day_shift = copy(self[key])
+        day_shift["machine_usage"] = day_shift["machine_usage"].copy()
+        day_shift["free_time"] = list(day_shift["free_time"])
+        if "occupancy" in day_shift:
+            day_shift["occupancy"] = day_shift["occupancy"].copy()
+        self[key] = day_shift
+        self.owned.add(key)
+        return day_shift
+
+    def __contains__(self, key) -> bool:
+        return dict.__contains__(self, key) or self._source_key(key) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def template_items(self):
+        """Возвращает все дни горизонта планирования, не создавая их: созданные дни и дни шаблона"""
+        for key, value in self.template.items():
+            yield key, dict.get(self, key, value)
+
+        if self.last_date is None:
+            return
+        cal_date = self.max_template_date + timedelta(days=1)
+        while cal_date <= self.last_date:
+            shift = 1
+            source_key = self._source_key((cal_date, shift))
+            while source_key is not None:
+                yield (cal_date, shift), dict.get(self, (cal_date, shift), self.template[source_key])
+                shift += 1
+                source_key = self._source_key((cal_date, shift))
+            cal_date += timedelta(days=1)
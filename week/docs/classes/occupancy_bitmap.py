@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+from math import ceil
+
+import numpy as np
+
+from docs.classes.usage_store import to_micros
+
+
+SLOT_SECONDS = 60
+
+
+class OccupancyBitmap:
+    """
+    Битовая карта занятости одной смены: один слот на ``SLOT_SECONDS`` секунд, ``True`` - слот занят.
+    Использование, захватившее часть слота, занимает слот целиком
+    """
+
+    def __init__(self, start: datetime, end: datetime):
+        self.start = start
+        self.end = end
+        slots_count = ceil((end - start).total_seconds() / SLOT_SECONDS)
+        self.slots = np.zeros(max(slots_count, 0), dtype=bool)
+
+    def copy(self) -> "OccupancyBitmap":
+        """Возвращает независимую копию битовой карты"""
+        bitmap_copy = OccupancyBitmap(self.start, self.start)
+        bitmap_copy.end = self.end
+        bitmap_copy.slots = self.slots.copy()
+        return bitmap_copy
+
+    def _slot(self, moment: datetime, round_up: bool) -> int:
+        """Возвращает номер слота для заданного момента, ограниченный границами смены"""
+        slot = (moment - self.start).total_seconds() / SLOT_SECONDS
+        slot = ceil(slot) if round_up else int(slot // 1)
+        return min(max(slot, 0), len(self.slots))
+
+    def _slot_time(self, slot: int) -> datetime:
+        """Возвращает начало слота, но не позже конца смены"""
+        return min(self.start + timedelta(seconds=int(slot) * SLOT_SECONDS), self.end)
+
+    def occupy(self, start: datetime, end: datetime) -> tuple[int, int, np.ndarray]:
+        """
+        Помечает промежуток занятым
+        :returns: Кортеж (``первый слот``, ``слот после последнего``, ``прежние значения слотов``) для отката
+        """
+        lo = self._slot(start, round_up=False)
+        hi = self._slot(end, round_up=True)
+        old_slots = self.slots[lo:hi].copy()
+        self.slots[lo:hi] = True
+        return lo, hi, old_slots
+
+    def restore(self, lo: int, hi: int, old_slots: np.ndarray) -> None:
+        """Возвращает слотам значения, сохраненные в ``occupy``"""
+        self.slots[lo:hi] = old_slots
+
+    @staticmethod
+    def _free_runs(free: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Возвращает начала и концы (не включительно) непрерывных свободных участков"""
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], free, [False])).astype(np.int8)))
+        return edges[0::2], edges[1::2]
+
+    def free_time(self) -> list[tuple[datetime, datetime, float]]:
+        """Возвращает свободные промежутки в формате [(``start``, ``end``, ``duration``),]"""
+        free_time = []
+        for lo, hi in zip(*self._free_runs(~self.slots)):
+            start, end = self._slot_time(lo), self._slot_time(hi)
+            free_time.append((start, end, (end - start).total_seconds()))
+        return free_time
+
+    def free_spans(self) -> list[tuple[int, int]]:
+        """Возвращает свободные промежутки в целых микросекундах от ``EPOCH``: [(``start``, ``end``),]"""
+        start, end = to_micros(self.start), to_micros(self.end)
+        slot_micros = SLOT_SECONDS * 10 ** 6
+        return [(min(start + int(lo) * slot_micros, end), min(start + int(hi) * slot_micros, end))
+                for lo, hi in zip(*self._free_runs(~self.slots))]
+
+    def first_free_run(self, after: datetime, duration: float) -> datetime | None:
+        """
+        Векторно ищет первый непрерывный свободный участок длительностью не меньше ``duration`` секунд,
+        начинающийся не раньше слота, в который попадает ``after``
+        :returns: Начало участка или ``None``, если такого участка нет
+        """
+        lo = self._slot(after, round_up=False)
+        need = max(ceil(duration / SLOT_SECONDS), 1)
+        free = ~self.slots[lo:]
+        if len(free) < need:
+            return None
+        filled = np.concatenate(([0], np.cumsum(free)))
+        fits = np.flatnonzero(filled[need:] - filled[:-need] == need)
+        if not len(fits):
+            return None
+        return max(self._slot_time(lo + fits[0]), after)
+
+    def intersect(self, other: "OccupancyBitmap") -> "OccupancyBitmap | None":
+        """
+        Пересекает две смены побитовым ИЛИ занятости: свободен только слот, свободный в обеих сменах
+        :returns: Битовая карта общего периода смен или ``None``, если сетки слотов смен не совпадают
+        """
+        if (other.start - self.start).total_seconds() % SLOT_SECONDS:
+            return None
+        start, end = max(self.start, other.start), min(self.end, other.end)
+        common = OccupancyBitmap(start, max(start, end))
+        self_lo, other_lo = self._slot(start, round_up=False), other._slot(start, round_up=False)
+        count = len(common.slots)
+        common.slots = self.slots[self_lo:self_lo + count] | other.slots[other_lo:other_lo + count]
+        return common
@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from docs.utils import copy_all_same_attrs
 
 
@@ -10,6 +12,7 @@ class Pairs:
         self.id_position = None
         self.current_step = None
         self.steps = None
+        self.lot = None
 
     def __repr__(self):
         return f"{self.id}"
@@ -31,6 +34,13 @@ class Pairs:
                         step.finished = True
         self.set_pair_id()
 
+    def reset_steps(self, steps):
+        """Функция заново присваивает паре (или партии) не поставленные шаги позиции перед повторной расстановкой"""
+        self.set_steps(steps)
+        if self.lot:
+            for step in self.steps:
+                step.duration *= len(self.lot)
+
     def set_pair_attrs(self, position, pair_id):
         """Функция установки некоторых параметров пар ботинок"""
         self.id_boots = position.model_name
@@ -50,3 +60,72 @@ class Pairs:
         copy_all_same_attrs(pair_copy, self)
         pair_copy.steps = [step.get_deepcopy() for step in self.steps]
         return pair_copy
+
+    @classmethod
+    def make_lot(cls, pairs):
+        """
+        Функция собирает пары с одинаковыми шагами в одну партию: партия ставится как одна пара,
+        длительность каждого шага которой умножена на количество пар
+        :param pairs: Пары одной позиции с одинаковыми незаконченными шагами
+        :type pairs: list[Pairs]
+        :return: Пара-партия, в ``lot`` которой лежат индексы собранных пар
+        :rtype: Pairs
+        """
+        lot = pairs[0].get_copy()
+        lot.lot = [pair.id for pair in pairs]
+        for step in lot.steps:
+            step.duration *= len(pairs)
+        return lot
+
+    def expand_lot(self):
+        """
+        Функция раскладывает шаги партии обратно по парам: время каждого шага партии делится между парами
+        поровну и по порядку, поэтому пара может получить несколько частей шага, как при разбиении по сменам
+        :return: Список (``id_pair``, ``step``) для каждой пары партии, для обычной пары - ее шаги
+        :rtype: list[tuple[int, Steps]]
+        """
+        if not self.lot:
+            return [(self.id, step) for step in self.steps]
+
+        steps_by_num = {}
+        for step in self.steps:
+            steps_by_num.setdefault(step.step_num, []).append(step)
+
+        size = len(self.lot)
+        pair_steps = {id_pair: [] for id_pair in self.lot}
+        for pieces in steps_by_num.values():
+            # Не поставленный шаг просто делим по длительности
+            if pieces[0].start_date is None:
+                for id_pair in self.lot:
+                    step = pieces[0].get_deepcopy()
+                    step.duration = pieces[0].duration / size
+                    pair_steps[id_pair].append(step)
+                continue
+
+            share = sum(piece.duration for piece in pieces) / size
+            idx, offset = 0, 0.0
+            for num, id_pair in enumerate(self.lot):
+                need = share
+                parts = []
+                while idx < len(pieces) and (need > 1e-6 or num == size - 1):
+                    piece = pieces[idx]
+                    take = piece.duration - offset
+                    if num < size - 1 and need < take:
+                        take = need
+                    part = piece.get_deepcopy()
+                    part.start_date = piece.start_date + timedelta(seconds=offset)
+                    part.duration = take
+                    offset += take
+                    need -= take
+                    if offset >= piece.duration:
+                        part.end_date = piece.end_date
+                        idx, offset = idx + 1, 0.0
+                    else:
+                        part.end_date = part.start_date + timedelta(seconds=take)
+                    parts.append(part)
+                if len(parts) > 1:
+                    for part in parts:
+                        part.splited = True
+                pair_steps[id_pair].extend(parts)
+
+        return [(id_pair, step) for id_pair, steps in pair_steps.items() for step in steps]
@@ -1,8 +1,10 @@
 from collections import defaultdict, Counter, namedtuple
 from datetime import timedelta, time, datetime
 
+from sqlalchemy import and_
+
 from docs.classes.workplace_class import WorkPlaces
-from docs.database import ProdOrder, ClientOrder, get_table_data, Serialize
+from docs.database import ProdOrder, ClientOrder, get_table_rows, iter_table_rows, Serialize
 from docs.classes.steps_class import Steps
 from docs.database.model import PairsKS, PosStrings
 from docs.classes.pairs import Pairs
@@ -40,6 +42,7 @@ class Positions:
         self.top = None
         self.bot = None
         self.sole = None
+        self.from_plan = False
 
     def __repr__(self):
         return f"{self.id}"
@@ -118,29 +121,54 @@ class Positions:
     @classmethod
     def set_pairs(cls):
         """Устанавливает пары для каждой позиции"""
-        pairs_ks: list[PairsKS] = get_table_data(PairsKS)
+        finished = Serialize.get_status("Закончен")
+        position_ids = [position.id for position in cls.positions]
+        # Законченные пары не расставляются, поэтому из БД берем только их количество по позициям
+        finished_pairs = Counter(pair.id_position for pair in iter_table_rows(
+            PairsKS, (PairsKS.id_position,), and_(PairsKS.id_position.in_(position_ids), PairsKS.status == finished)))
+        pairs_ks = iter_table_rows(PairsKS, (PairsKS.id, PairsKS.id_position, PairsKS.current_step),
+                                   and_(PairsKS.id_position.in_(position_ids), PairsKS.status.is_distinct_from(finished)))
         positions_pairs_id = defaultdict(list)
         for pair in pairs_ks:
-            positions_pairs_id[pair.id_position].append((pair.id, pair.status, pair.current_step))
+            positions_pairs_id[pair.id_position].append((pair.id, pair.current_step))
         for position in cls.positions:
             pairs = []
             # чтобы пары шли по порядку
             positions_pairs_id[position.id] = sorted(positions_pairs_id[position.id], key=lambda x: x[0], reverse=True)
-            for _ in range(position.quantity):
+            to_place = position.quantity - finished_pairs[position.id]
+            for _ in range(to_place):
                 try:
-                    id_pair, status, current_step = positions_pairs_id[position.id].pop()
-                    if status != Serialize.get_status("Закончен"):
-                        pair = Pairs()
-                        pair.set_pair_attrs(position, id_pair)
-                        pair.current_step = current_step
-                        pair.set_steps(position.steps)
-                        pairs.append(pair)
+                    id_pair, current_step = positions_pairs_id[position.id].pop()
+                    pair = Pairs()
+                    pair.set_pair_attrs(position, id_pair)
+                    pair.current_step = current_step
+                    pair.set_steps(position.steps)
+                    pairs.append(pair)
                 except IndexError:
                     print_red(f"В БД НЕ ХВАТАЕТ ПАР ДЛЯ ПОЗИЦИИ - {position.id}\n"
-                              f"КОЛИЧЕСТВО НЕДОСТАЮЩИХ ПАР - {position.quantity - _}")
+                              f"КОЛИЧЕСТВО НЕДОСТАЮЩИХ ПАР - {to_place - _}")
                     break
             position.pairs = pairs
 
+    @classmethod
+    def set_lots(cls, lot_size):
+        """
+        Собирает подряд идущие пары каждой позиции в партии по ``lot_size`` пар.
+        В партию попадают только пары на одном и том же шаге, замороженные позиции не трогаются
+        """
+        for position in cls.positions:
+            if position.freeze or not position.pairs:
+                continue
+            lots = []
+            block = []
+            for pair in position.pairs:
+                if block and (len(block) == lot_size or block[0].current_step != pair.current_step):
+                    lots.append(Pairs.make_lot(block))
+                    block = []
+                block.append(pair)
+            lots.append(Pairs.make_lot(block))
+            position.pairs = lots
+
     @classmethod
     def _set_positions(cls, plan_id, ids=None):
         """Скачивает позиции"""
@@ -149,19 +177,22 @@ class Positions:
         cls.percent_success = 0
         cls.count_prod_order = 0
 
-        all_positions = get_table_data(ProdOrder)
-        db_positions = []
+        conditions = ProdOrder.plan_id == plan_id
+        if ids:
+            conditions = and_(conditions, ProdOrder.id.in_(ids))
+        db_positions = get_table_rows(ProdOrder, conditions=conditions)
+
+        # Тип подошвы и задника берем только из заказов-шаблонов, на которые ссылаются позиции плана
+        template_ids = {pos.prod_order_id for pos in db_positions}
         pos_tie_sole = {}
-        for pos in all_positions:
+        for pos in get_table_rows(ProdOrder, (ProdOrder.id, ProdOrder.prod_order_id, ProdOrder.plan_id,
+                                              ProdOrder.tie, ProdOrder.sole), ProdOrder.id.in_(template_ids)):
             if not pos.prod_order_id and not pos.plan_id:
                 pos_tie_sole[pos.id] = (pos.tie, pos.sole)
 
-        for pos in all_positions:
-            if pos.plan_id == plan_id and (not ids or pos.id in ids):
-                pos.tie, pos.sole = pos_tie_sole[pos.prod_order_id]
-                db_positions.append(pos)
-
-        db_client_order = get_table_data(ClientOrder)
+        client_order_ids = {pos.client_order_id for pos in db_positions}
+        db_client_order = get_table_rows(ClientOrder, (ClientOrder.id, ClientOrder.deadline),
+                                         ClientOrder.id.in_(client_order_ids))
 
         client_deadline = {}
 
@@ -174,6 +205,8 @@ class Positions:
 
             copy_all_same_attrs(new_position, position)
 
+            # Строки только читаются, поэтому тип подошвы и задника берем из заказа-шаблона уже в позиции
+            new_position.tie, new_position.sole = pos_tie_sole[position.prod_order_id]
             new_position.id = position.prod_order_id
             new_position.deadline = client_deadline.get(position.client_order_id)
             new_position.number_of_stars = position.priority
@@ -197,12 +230,17 @@ class Positions:
             if Serialize.is_week:
                 position._calculate_colors()
         cls.set_pairs()
+        # Трехмесячному плану точность до пары не нужна, поэтому пары можно ставить партиями
+        if not Serialize.is_week and (optimize_params.lot_size or 1) > 1:
+            cls.set_lots(optimize_params.lot_size)
         return cls.positions
 
     @classmethod
     def _set_pos_steps(cls):
         pos_ids = {}
-        pos_steps_category_colors = get_table_data(PosStrings)
+        pos_steps_category_colors = get_table_rows(
+            PosStrings, (PosStrings.prod_order_id, PosStrings.category, PosStrings.color),
+            PosStrings.prod_order_id.in_([position.id for position in cls.positions]))
         for row in pos_steps_category_colors:
             pos_ids[row.prod_order_id] = pos_ids.get(row.prod_order_id, {})
             pos_ids[row.prod_order_id][row.category] = row.color
@@ -266,6 +304,14 @@ class Positions:
             elif step.string_mat_cat == "Подошва":
                 step.color = sole_color.color
 
+    def reset_pairs(self):
+        """Функция снимает позицию с расстановки: пары получают исходные шаги, статус и даты сбрасываются"""
+        for pair in self.pairs:
+            pair.reset_steps(self.steps)
+        self.status = None
+        self.start_date = None
+        self.end_date = None
+
     def get_copy(self):
         position_copy = Positions()
         copy_all_same_attrs(position_copy, self)
@@ -1,7 +1,7 @@
 from collections import defaultdict
 from sqlalchemy import and_
 
-from docs.database import get_table_data, TechCard
+from docs.database import get_table_rows, TechCard
 from docs.utils import copy_all_same_attrs
 
 
@@ -38,7 +38,7 @@ class Steps:
     @classmethod
     def setup_steps(cls):
         cls.steps = defaultdict(list)
-        tech_cards: list[TechCard] = get_table_data(TechCard, and_(TechCard.id > 0, TechCard.id_group_machine > 0))
+        tech_cards = get_table_rows(TechCard, conditions=and_(TechCard.id > 0, TechCard.id_group_machine > 0))
         for tech_card in tech_cards:
             step = Steps()
             copy_all_same_attrs(step, tech_card)
@@ -0,0 +1,134 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+
+machine_usage_tuple = namedtuple("machine_usage_tuple","start end boots_id position_id string_color")
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_micros(moment: datetime) -> int:
+    """Переводит ``datetime`` в целое число микросекунд от ``EPOCH``"""
+    return (moment - EPOCH) // MICROSECOND
+
+
+def from_micros(micros: int) -> datetime:
+    """Переводит целое число микросекунд от ``EPOCH`` обратно в ``datetime``"""
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def secs_to_micros(secs: float) -> int:
+    """Переводит длительность в секундах в целое число микросекунд с тем же округлением, что и ``timedelta``"""
+    return timedelta(seconds=secs) // MICROSECOND
+
+
+class UsageStore:
+    """
+    Компактное хранилище использований машины, отсортированных по (``start``, ``end``).\n
+    Время хранится в колонках ``array`` целыми микросекундами, а индексы ботинок, позиций и цвета ниток -
+    кодами из общей таблицы. Снаружи хранилище ведет себя как список ``machine_usage_tuple``
+    """
+
+    _values = [None]
+    _codes = {None: 0}
+
+    __slots__ = ("starts", "ends", "boots", "positions", "colors")
+
+    def __init__(self):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.boots = array("q")
+        self.positions = array("q")
+        self.colors = array("q")
+
+    @classmethod
+    def _code(cls, value) -> int:
+        """Возвращает код значения, добавляя его в таблицу кодов при первой встрече"""
+        code = cls._codes.get(value)
+        if code is None:
+            code = len(cls._values)
+            cls._codes[value] = code
+            cls._values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, idx: int) -> machine_usage_tuple:
+        return machine_usage_tuple(
+            from_micros(self.starts[idx]),
+            from_micros(self.ends[idx]),
+            self._values[self.boots[idx]],
+            self._values[self.positions[idx]],
+            self._values[self.colors[idx]],
+        )
+
+    def start_at(self, idx: int) -> datetime:
+        """Возвращает начало использования с заданной позицией"""
+        return from_micros(self.starts[idx])
+
+    def end_at(self, idx: int) -> datetime:
+        """Возвращает конец использования с заданной позицией"""
+        return from_micros(self.ends[idx])
+
+    def intervals(self):
+        """Возвращает пары (``start``, ``end``) всех использований, не собирая остальные поля"""
+        for start, end in zip(self.starts, self.ends):
+            yield from_micros(start), from_micros(end)
+
+    def __iter__(self):
+        for idx in range(len(self.starts)):
+            yield self[idx]
+
+    def __delitem__(self, idx: int) -> None:
+        for column in (self.starts, self.ends, self.boots, self.positions, self.colors):
+            del column[idx]
+
+    def copy(self) -> "UsageStore":
+        """Возвращает независимую копию хранилища"""
+        store_copy = UsageStore()
+        for name in self.__slots__:
+            setattr(store_copy, name, getattr(self, name)[:])
+        return store_copy
+
+    def without_position(self, id_position, lo: int = 0, hi: int | None = None) -> "UsageStore":
+        """
+        Возвращает новое хранилище без использований позиции с номерами от ``lo`` до ``hi``,
+        само хранилище не меняется
+        :param id_position: Индекс позиции
+        :param lo: Первый номер, с которого убираются использования
+        :param hi: Номер, до которого убираются использования, по умолчанию - до конца
+        """
+        code = self._codes.get(id_position)
+        hi = len(self) if hi is None else hi
+        kept = [idx for idx in range(len(self)) if not lo <= idx < hi or self.positions[idx] != code]
+        store = UsageStore()
+        for name in self.__slots__:
+            column = getattr(self, name)
+            getattr(store, name).extend(column[idx] for idx in kept)
+        return store
+
+    def bisect(self, start: datetime, end: datetime) -> int:
+        """Возвращает позицию после всех использований с ключом (``start``, ``end``) не больше заданного"""
+        start, end = to_micros(start), to_micros(end)
+        lo = bisect_left(self.starts, start)
+        hi = bisect_right(self.starts, start, lo)
+        return bisect_right(self.ends, end, lo, hi)
+
+    def insert(self, machine_usage) -> int:
+        """
+        Вставляет использование машины с сохранением порядка
+        :param machine_usage: (``start``, ``end``, ``boots_id``, ``position_id``, ``string_color``)
+        :returns: Позиция вставленного использования
+        """
+        start, end, boots_id, position_id, string_color = machine_usage
+        idx = self.bisect(start, end)
+        self.starts.insert(idx, to_micros(start))
+        self.ends.insert(idx, to_micros(end))
+        self.boots.insert(idx, self._code(boots_id))
+        self.positions.insert(idx, self._code(position_id))
+        self.colors.insert(idx, self._code(string_color))
+        return idx
@@ -1,5 +1,3 @@
-from copy import deepcopy
-
 from docs.database import get_table_data, WorkerDB, WorkerCalendarDB
 from docs.classes.calendar_base_class import CalendarBase
 from docs.utils import print_red, print_green, print_lblue
@@ -29,16 +27,13 @@ class WorkersCalendar(CalendarBase):
                 print_red(f"НЕТ ТАКОГО КАЛЕНДАРЯ РАБОТНИКА - {worker.worker_calendar_id}\n"
                           f"ПРОБЛЕМА С РАБОТНИКОМ - {worker.id}")
             else:
-                self.calendar[worker.id] = deepcopy(wc_dict.get(worker.worker_calendar_id))
+                self.calendar[worker.id] = self._object_calendar(wc_dict.get(worker.worker_calendar_id))
 
                 """Поиск суммарного количества часов работы всех рабочих"""
-                self.total_work_hours += sum(x["time_total"] for x in self.calendar[worker.id].values())
+                self.total_work_hours += sum(x["time_total"] for x in self.calendar[worker.id].template.values())
 
             """Заполнение словаря именами работников"""
             self.workers_names[worker.id] = worker.name
 
-        """РАСТЯГИВАНИЕ КАЛЕНДАРЯ"""
-        self._calendar_expansion()
-
     def get_workers_name(self, id_worker):
         return self.workers_names.get(id_worker)
@@ -1,10 +1,14 @@
 from collections import defaultdict
 from datetime import date, datetime, timedelta
+from itertools import accumulate
 from sqlalchemy import and_
 
 from docs.classes.calendar_class import MachineCalendar
 from docs.classes.workers_class import WorkersCalendar
-from docs.database import get_table_data, WorkplaceDB, EmergencyDB
+from docs.classes.occupancy_bitmap import OccupancyBitmap
+from docs.classes.usage_store import from_micros, to_micros
+from docs.classes.capacity_tree import CapacityTree
+from docs.database import get_table_data, WorkplaceDB, EmergencyDB, Serialize
 from docs.classes.machine_groups_class import machine_groups
 from docs.classes.singleton_meta_class import SingletonMeta
 from docs.utils import print_lblue
@@ -23,10 +27,18 @@ class WorkPlaces(metaclass=SingletonMeta):
         self.machine_calendar = MachineCalendar()
         self.workplaces = {}
         self.wp_by_machines = defaultdict(list)
-        self.m_req_ft = {} # machine required free time
-        self.w_req_ft = {} # worker required free time
-        self.free_time = {}
+        self.free_time = {} # {(workplace, date, shift): (machine_version, worker_version, free_spans)}
+        self.wp_by_group = {}
+        self.wp_by_group_worker = {}
+        self.groups_by_worker = defaultdict(set)
+        self.capacity = {} # {id_группы: CapacityTree}
+        self.capacity_dirty = {} # {id_группы: {слот, ожидающий пересчета: сколько раз поиск до него доходил}}
+        self.capacity_log = None # [(id_группы, слот, прежнее значение, был ли слот помечен)]
+        self.capacity_logged = set()
+        self.period_capacity = {} # {id_группы: (свободное время по дням горизонта, префиксные суммы)}
+        self.period_dirty = defaultdict(set) # {id_группы: {дни, изменившиеся после прошлого пересчета сумм}}
         self.__setup_workplaces()
+        self.__setup_group_index()
 
     def __setup_workplaces(self) -> None:
         """
@@ -42,15 +54,43 @@ class WorkPlaces(metaclass=SingletonMeta):
 
             self.wp_by_machines[workplace.machine_id].append(workplace.id)
 
+    def __setup_group_index(self) -> None:
+        """
+        Строит неизменяемые индексы рабочих мест по группам оборудования:\n
+        ``wp_by_group`` - {``id_группы``: (``id_workplace``, ...)}\n
+        ``wp_by_group_worker`` - {(``id_группы``, ``id_worker``): (рабочие места работника, остальные рабочие места)}\n
+        ``groups_by_worker`` - {``id_worker``: {``id_группы``, ...}}
+        """
+        self.wp_by_group = {}
+        self.wp_by_group_worker = {}
+        self.groups_by_worker = defaultdict(set)
+        for id_machine_group in machine_groups.machine_groups:
+            wp_list = []
+            for machine in machine_groups.get_machines(id_machine_group):
+                wp_list.extend(self.wp_by_machines.get(machine, []))
+            self.wp_by_group[id_machine_group] = tuple(wp_list)
+            for wp in wp_list:
+                self.groups_by_worker[self.workplaces[wp]["worker"]].add(id_machine_group)
+
+            for id_worker in {self.workplaces[wp]["worker"] for wp in wp_list}:
+                preferred = [wp for wp in wp_list if self.workplaces[wp]["worker"] == id_worker]
+                remaining = [wp for wp in wp_list if self.workplaces[wp]["worker"] != id_worker]
+                self.wp_by_group_worker[id_machine_group, id_worker] = tuple(preferred + remaining)
+
     def reset_calendar(self) -> None:
         self.worker_calendar.reset_calendar()
         self.machine_calendar.reset_calendar()
         self.workplaces = {}
         self.wp_by_machines = defaultdict(list)
-        self.m_req_ft = {}  # machine required free time
-        self.w_req_ft = {}  # worker required free time
-        self.free_time = {}
+        self.free_time = {}  # {(workplace, date, shift): (machine_version, worker_version, free_spans)}
+        self.capacity = {}
+        self.capacity_dirty = {}
+        self.capacity_log = None
+        self.capacity_logged = set()
+        self.period_capacity = {}
+        self.period_dirty = defaultdict(set)
         self.__setup_workplaces()
+        self.__setup_group_index()
         self.__emergency_accounting()
         return
 
@@ -81,6 +121,71 @@ class WorkPlaces(metaclass=SingletonMeta):
                 self.machine_calendar.add_frozen(id_machine, cal_date, shift_for_machines, machine_usage)
                 self.worker_calendar.add_frozen(id_worker, cal_date, shift, machine_usage)
 
+    def is_free_for_step(self, step) -> bool:
+        """
+        Проверяет, что шаг можно закрепить там, где он уже стоит: его рабочее место существует, а промежуток шага
+        целиком свободен у оборудования и работника в той смене, к которой шаг отнесет ``freeze_position``.
+        Учитываются текущие календари вместе с авариями и уже занятым временем
+        :param step: Шаг с ``id_workplace``, ``start_date``, ``end_date`` и ``shift``
+        :type step: Steps
+        :rtype: bool
+        """
+        if step.id_workplace not in self.workplaces or step.start_date >= step.end_date:
+            return False
+        id_machine = self.workplaces[step.id_workplace]['machine']
+        cal_date = step.start_date.date()
+        if (cal_date, shift_for_machines) not in self.machine_calendar.calendar.get(id_machine, {}):
+            return False
+        if step.start_date < self.machine_calendar.get_period(id_machine, cal_date, shift_for_machines)[0]:
+            cal_date -= timedelta(days=1)
+        start, end = to_micros(step.start_date), to_micros(step.end_date)
+        return any(space_start <= start and end <= space_end
+                   for space_start, space_end in self.get_free_spans(step.id_workplace, cal_date, step.shift))
+
+    def release_position(self, position):
+        """
+        Убирает позицию из календарей работников и оборудования.
+        Внутри ``set_calendar_copy`` удаление откатывается вместе с остальными изменениями
+        :param position: Поставленная позиция
+        :type position: Positions
+        :rtype: None
+        """
+        released = set()
+        changed_slots = set()
+        for pair in position.pairs:
+            for step in pair.steps:
+                if step.start_date is None or step.id_workplace is None:
+                    continue
+                id_machine = self.workplaces[step.id_workplace]['machine']
+                id_worker = self.workplaces[step.id_workplace]['worker']
+                # Смена, начавшаяся накануне, записана в календаре под предыдущей датой
+                for cal_date in (step.start_date.date() - timedelta(days=1), step.start_date.date()):
+                    if (id_machine, cal_date) not in released:
+                        released.add((id_machine, cal_date))
+                        if self.machine_calendar.remove_position_usage(id_machine, cal_date, shift_for_machines,
+                                                                       position.id):
+                            for id_machine_group in machine_groups.get_machine_groups(id_machine):
+                                for shift in self.get_shifts():
+                                    changed_slots.add((id_machine_group, cal_date, shift))
+                    if (id_worker, cal_date, step.shift) not in released:
+                        released.add((id_worker, cal_date, step.shift))
+                        if self.worker_calendar.remove_position_usage(id_worker, cal_date, step.shift, position.id):
+                            for id_machine_group in self.groups_by_worker.get(id_worker, ()):
+                                changed_slots.add((id_machine_group, cal_date, step.shift))
+
+        # Удаление увеличивает свободное время, и прежнее значение слота сводки перестает быть оценкой сверху,
+        # поэтому слоты освобожденных смен пересчитываются сразу
+        self.__flush_capacity()
+        for id_machine_group, cal_date, shift in changed_slots:
+            tree = self.capacity.get(id_machine_group)
+            if tree is None:
+                continue
+            slot = self.__capacity_slot(cal_date, shift)
+            if 0 <= slot < tree.count:
+                self.__log_capacity(id_machine_group, slot)
+                self.capacity_dirty[id_machine_group].pop(slot, None)
+                tree.update(slot, self.__slot_capacity(id_machine_group, cal_date, shift))
+
     def __emergency_change_date_shift(self, obj_calendar, id_obj, cal_date, shift, duration_tuple):
         """
         Функция сдвига даты или смены для вставки аварийных ситуаций
@@ -208,14 +313,45 @@ class WorkPlaces(metaclass=SingletonMeta):
         self.__emergency_workers()
 
     def set_calendar_copy(self) -> None:
-        """Снимает копию с календаря и записывает в соответствущую переменную"""
+        """Начинает транзакцию в календарях работников и оборудования и в сводках свободного времени групп"""
+        self.__flush_capacity()
+        self.capacity_log = []
+        self.capacity_logged = set()
         self.worker_calendar.set_calendar_copy()
         self.machine_calendar.set_calendar_copy()
 
+    def calendar_commit(self) -> None:
+        """Фиксирует изменения календарей, сделанные с момента ``set_calendar_copy``"""
+        self.worker_calendar.commit()
+        self.machine_calendar.commit()
+        self.capacity_log = None
+
     def calendar_rollback(self) -> None:
-        """Возвращает календари к состоянию на момент снятия копии календарей"""
+        """
+        Возвращает календари к состоянию на момент ``set_calendar_copy``.
+        Слоты сводок получают прежние значения из журнала, а еще не учтенные изменения смен отбрасываются -
+        после отката календарей они ничего не меняют
+        """
         self.worker_calendar.calendar_rollback()
         self.machine_calendar.calendar_rollback()
+        if self.capacity_log is None:
+            return
+        # Суммы по дням могли пересчитаться внутри транзакции, поэтому откаченные дни пересчитаются заново
+        for id_worker, cal_date, _ in self.worker_calendar.pop_changed_shifts():
+            for id_machine_group in self.groups_by_worker.get(id_worker, ()):
+                if id_machine_group in self.period_capacity:
+                    self.period_dirty[id_machine_group].add(cal_date)
+        for id_machine, cal_date, _ in self.machine_calendar.pop_changed_shifts():
+            for id_machine_group in machine_groups.get_machine_groups(id_machine):
+                if id_machine_group in self.period_capacity:
+                    self.period_dirty[id_machine_group].add(cal_date)
+        for id_machine_group, slot, value, hits in reversed(self.capacity_log):
+            self.capacity[id_machine_group].update(slot, value)
+            if hits is None:
+                self.capacity_dirty[id_machine_group].pop(slot, None)
+            else:
+                self.capacity_dirty[id_machine_group][slot] = hits
+        self.capacity_log = None
 
     def max_date(self) -> date:
         """Возвращает максимальную дату календарей"""
@@ -226,13 +362,184 @@ class WorkPlaces(metaclass=SingletonMeta):
         """ДОДЕЛАНО"""
         return [1, 2]
 
-    def get_workplaces(self, id_machine_group) -> list[int]:
-        """Возвращает список всех индексов рабочих мест,
+    def get_workplaces(self, id_machine_group) -> tuple[int, ...]:
+        """Возвращает кортеж всех индексов рабочих мест,
         машины в которых входят в заданный индекс группы машин"""
-        wp_list = list()
-        for machine in machine_groups.get_machines(id_machine_group):
-            wp_list.extend(self.wp_by_machines.get(machine, []))
-        return wp_list
+        return self.wp_by_group[id_machine_group]
+
+    def get_prioritized_workplaces(self, id_machine_group, preferred_worker) -> tuple[int, ...]:
+        """Возвращает рабочие места группы машин: сначала места предпочтительного работника, затем остальные"""
+        if preferred_worker is None:
+            return self.wp_by_group[id_machine_group]
+        return self.wp_by_group_worker.get((id_machine_group, preferred_worker), self.wp_by_group[id_machine_group])
+
+    def __capacity_slot(self, cal_date, shift) -> int:
+        """Возвращает номер слота (``день``, ``смена``) от начала горизонта планирования"""
+        shifts = self.get_shifts()
+        return (cal_date - Serialize.start_date.date()).days * len(shifts) + shifts.index(shift)
+
+    def __slot_capacity(self, id_machine_group, cal_date, shift) -> int:
+        """
+        Возвращает оценку сверху наибольшего свободного времени рабочего места группы в смене в микросекундах:
+        свободное время рабочего места не больше свободного времени его оборудования и его работника
+        """
+        capacity = 0
+        for wp in self.wp_by_group[id_machine_group]:
+            worker_free = self.worker_calendar.get_free_micros(self.workplaces[wp]["worker"], cal_date, shift)
+            if worker_free <= capacity:
+                continue
+            machine_free = self.machine_calendar.get_free_micros(self.workplaces[wp]["machine"], cal_date,
+                                                                 shift_for_machines)
+            capacity = max(capacity, min(worker_free, machine_free))
+        return capacity
+
+    def __flush_capacity(self) -> None:
+        """
+        Помечает в построенных сводках слоты смен, изменившихся в календарях после прошлого вызова.
+        Вне отката календарь меняется только вставками, которые свободное время лишь уменьшают, поэтому старое
+        значение помеченного слота остается оценкой сверху. Точное значение пересчитывается в ``next_free_shift``,
+        только когда поиск дошел до этого слота повторно
+        """
+        if not self.machine_calendar.changed_shifts and not self.worker_calendar.changed_shifts:
+            return
+        changed_slots = set()
+        for id_machine, cal_date, _ in self.machine_calendar.pop_changed_shifts():
+            for id_machine_group in machine_groups.get_machine_groups(id_machine):
+                for shift in self.get_shifts():
+                    changed_slots.add((id_machine_group, cal_date, shift))
+        for id_worker, cal_date, shift in self.worker_calendar.pop_changed_shifts():
+            for id_machine_group in self.groups_by_worker.get(id_worker, ()):
+                changed_slots.add((id_machine_group, cal_date, shift))
+
+        for id_machine_group, cal_date, shift in changed_slots:
+            if id_machine_group in self.period_capacity:
+                self.period_dirty[id_machine_group].add(cal_date)
+            tree = self.capacity.get(id_machine_group)
+            if tree is None:
+                continue
+            slot = self.__capacity_slot(cal_date, shift)
+            if 0 <= slot < tree.count and self.capacity_dirty[id_machine_group].get(slot) != 0:
+                self.__log_capacity(id_machine_group, slot)
+                self.capacity_dirty[id_machine_group][slot] = 0
+
+    def __log_capacity(self, id_machine_group, slot) -> None:
+        """Сохраняет в журнал транзакции значение и пометку слота сводки перед первым изменением в транзакции"""
+        if self.capacity_log is None or (id_machine_group, slot) in self.capacity_logged:
+            return
+        self.capacity_logged.add((id_machine_group, slot))
+        self.capacity_log.append((id_machine_group, slot, self.capacity[id_machine_group].value(slot),
+                                  self.capacity_dirty[id_machine_group].get(slot)))
+
+    def __group_capacity(self, id_machine_group) -> CapacityTree:
+        """
+        Возвращает сводку свободного времени группы оборудования по слотам (``день``, ``смена``) горизонта.
+        Сводка строится при первом обращении и дальше обновляется только по изменившимся сменам
+        """
+        self.__flush_capacity()
+        tree = self.capacity.get(id_machine_group)
+        if tree is None:
+            start_day = Serialize.start_date.date()
+            values = []
+            for day in range((self.max_date() - start_day).days + 1):
+                for shift in self.get_shifts():
+                    values.append(self.__slot_capacity(id_machine_group, start_day + timedelta(days=day), shift))
+            tree = CapacityTree(values)
+            self.capacity[id_machine_group] = tree
+            self.capacity_dirty[id_machine_group] = {}
+        return tree
+
+    def next_free_shift(self, id_machine_group, cal_date, shift, at_least) -> tuple[date, int] | None:
+        """
+        Возвращает первую смену не раньше (``cal_date``, ``shift``), в которой у какого-нибудь рабочего места
+        группы есть не меньше ``at_least`` микросекунд свободного времени, или ``None``, если до конца горизонта
+        таких смен нет. Смены до начала горизонта не пропускаются
+
+        :param id_machine_group: Индекс группы оборудования
+        :param cal_date: Дата формата ``date``
+        :param shift: Номер смены
+        :param at_least: Необходимое свободное время в микросекундах
+        """
+        tree = self.__group_capacity(id_machine_group)
+        dirty = self.capacity_dirty[id_machine_group]
+        slot = self.__capacity_slot(cal_date, shift)
+        if slot < 0:
+            return cal_date, shift
+        shifts = self.get_shifts()
+        while True:
+            slot = tree.find_first(slot, at_least)
+            if slot is None:
+                return None
+            day, shift_index = divmod(slot, len(shifts))
+            cal_date, shift = Serialize.start_date.date() + timedelta(days=day), shifts[shift_index]
+            hits = dirty.get(slot)
+            if hits is None:
+                return cal_date, shift
+            self.__log_capacity(id_machine_group, slot)
+            # Смена, изменившаяся после прошлого обхода, обычно на переднем крае плана и еще свободна:
+            # в первый раз отдаем ее без пересчета, пересчитываем, если поиск вернулся к ней без изменений
+            if not hits:
+                dirty[slot] = 1
+                return cal_date, shift
+            del dirty[slot]
+            tree.update(slot, self.__slot_capacity(id_machine_group, cal_date, shift))
+
+    def __day_capacity(self, id_machine_group, cal_date) -> int:
+        """
+        Возвращает оценку сверху суммарного свободного времени группы оборудования за день в микросекундах:
+        шаг занимает и оборудование, и работника, поэтому берется меньшая из сумм по машинам и по работникам группы
+        """
+        machines = {self.workplaces[wp]["machine"] for wp in self.wp_by_group[id_machine_group]}
+        workers = {self.workplaces[wp]["worker"] for wp in self.wp_by_group[id_machine_group]}
+        machine_free = sum(self.machine_calendar.get_free_micros(id_machine, cal_date, shift_for_machines)
+                           for id_machine in machines)
+        worker_free = sum(self.worker_calendar.get_free_micros(id_worker, cal_date, shift)
+                          for id_worker in workers for shift in self.get_shifts())
+        return min(machine_free, worker_free)
+
+    def __group_period_capacity(self, id_machine_group) -> list[int]:
+        """
+        Возвращает префиксные суммы свободного времени группы оборудования по дням горизонта.
+        Суммы строятся при первом обращении, дальше пересчитываются только дни, изменившиеся в календарях
+        """
+        self.__flush_capacity()
+        start_day = Serialize.start_date.date()
+        if id_machine_group not in self.period_capacity:
+            values = [self.__day_capacity(id_machine_group, start_day + timedelta(days=day))
+                      for day in range((self.max_date() - start_day).days + 1)]
+            self.period_capacity[id_machine_group] = (values, list(accumulate(values, initial=0)))
+            self.period_dirty.pop(id_machine_group, None)
+        values, prefix = self.period_capacity[id_machine_group]
+
+        dirty = self.period_dirty.pop(id_machine_group, None)
+        if dirty:
+            first_day = len(values)
+            for cal_date in dirty:
+                day = (cal_date - start_day).days
+                if 0 <= day < len(values):
+                    values[day] = self.__day_capacity(id_machine_group, cal_date)
+                    first_day = min(first_day, day)
+            for day in range(first_day, len(values)):
+                prefix[day + 1] = prefix[day] + values[day]
+        return prefix
+
+    def period_capacity_micros(self, id_machine_group, first_date, last_date) -> int | None:
+        """
+        Возвращает оценку сверху свободного времени группы оборудования с ``first_date`` по ``last_date``
+        включительно в микросекундах или ``None``, если период начинается до начала горизонта и оценить его нельзя
+
+        :param id_machine_group: Индекс группы оборудования
+        :param first_date: Первый день периода формата ``date``
+        :param last_date: Последний день периода формата ``date``
+        """
+        start_day = Serialize.start_date.date()
+        if first_date < start_day:
+            return None
+        prefix = self.__group_period_capacity(id_machine_group)
+        first_day = (first_date - start_day).days
+        last_day = min((last_date - start_day).days + 1, len(prefix) - 1)
+        if first_day >= last_day:
+            return 0
+        return prefix[last_day] - prefix[first_day]
 
     def get_worker_by_workplace(self, workplace_id):
         """Возвращает id работника указанного рабочего места."""
@@ -247,11 +554,40 @@ class WorkPlaces(metaclass=SingletonMeta):
         id_worker = self.get_worker_by_workplace(workplace_id)
         return self.worker_calendar.get_workers_name(id_worker)
 
+    def __get_occupancy(self, id_workplace, cal_date, shift) -> OccupancyBitmap | None:
+        """Возвращает пересечение битовых карт оборудования и работника рабочего места или ``None``"""
+        id_machine = self.workplaces[id_workplace]["machine"]
+        id_worker = self.workplaces[id_workplace]["worker"]
+        machine_occupancy = self.machine_calendar.get_occupancy(id_machine, cal_date, shift_for_machines)
+        worker_occupancy = self.worker_calendar.get_occupancy(id_worker, cal_date, shift)
+        if machine_occupancy is None or worker_occupancy is None:
+            return None
+        return machine_occupancy.intersect(worker_occupancy)
+
     def get_free_time(self, id_workplace, cal_date, shift) -> list[dict]:
         """
         Возвращает список словарей свободного времени рабочего места следующего формата:\n
         [{``"start"``: ``datetime``, ``"end"``: ``datetime``, ``"dur"``: ``float``},]
 
+        :param id_workplace: Индекс рабочего места
+        :type id_workplace: int
+        :param cal_date: Дата формата ``date``
+        :type cal_date: date
+        :param shift: Номер смены
+        :type shift: int
+        """
+        return [{"start": from_micros(start), "end": from_micros(end), "dur": (end - start) / 10 ** 6}
+                for start, end in self.get_free_spans(id_workplace, cal_date, shift)]
+
+    def get_free_spans(self, id_workplace, cal_date, shift) -> list[tuple[int, int]]:
+        """
+        Возвращает свободное время рабочего места в целых микросекундах от ``EPOCH`` (см. ``usage_store``):\n
+        [(``start_micros``, ``end_micros``),]\n
+        Используется в поиске промежутков для шагов вместо ``get_free_time``, чтобы не создавать
+        ``datetime`` и словари на каждой проверке.
+        Результат кэшируется в ``self.free_time`` вместе с версиями смен оборудования и работника
+        и пересчитывается, только если одна из версий изменилась. Возвращаемый список изменять нельзя
+
         :param id_workplace: Индекс рабочего места
         :type id_workplace: int
         :param cal_date: Дата формата ``date``
@@ -262,58 +598,72 @@ class WorkPlaces(metaclass=SingletonMeta):
         id_machine = self.workplaces[id_workplace]["machine"]
         id_worker = self.workplaces[id_workplace]["worker"]
 
-        # if (not self.m_req_ft.get((id_machine, cal_date), True) and not self.w_req_ft.get((id_worker, cal_date, shift), True)):
-        #     result = self.free_time.get((id_workplace, cal_date, shift))
-        #     if result is not None:
-        #         return result
+        machine_version = self.machine_calendar.get_version(id_machine, cal_date, shift_for_machines)
+        worker_version = self.worker_calendar.get_version(id_worker, cal_date, shift)
+        cached = self.free_time.get((id_workplace, cal_date, shift))
+        if cached is not None and cached[0] == machine_version and cached[1] == worker_version:
+            return cached[2]
+
+        workplace_spans = self.__intersect_free_spans(id_workplace, cal_date, shift)
+        self.free_time[(id_workplace, cal_date, shift)] = (machine_version, worker_version, workplace_spans)
+        return workplace_spans
+
+    def __intersect_free_spans(self, id_workplace, cal_date, shift) -> list[tuple[int, int]]:
+        """Пересекает свободные промежутки оборудования и работника рабочего места"""
+        id_machine = self.workplaces[id_workplace]["machine"]
+        id_worker = self.workplaces[id_workplace]["worker"]
 
-        machine_free_time = self.machine_calendar.get_free_time(
-            id_machine,
-            cal_date,
-            shift_for_machines
-        )
+        if Serialize.is_bitmap_calendar:
+            occupancy = self.__get_occupancy(id_workplace, cal_date, shift)
+            if occupancy is not None:
+                return occupancy.free_spans()
 
-        worker_free_time = self.worker_calendar.get_free_time(
-            id_worker,
-            cal_date,
-            shift
-        )
+        machine_spans = self.machine_calendar.get_free_spans(id_machine, cal_date, shift_for_machines)
+        worker_spans = self.worker_calendar.get_free_spans(id_worker, cal_date, shift)
 
-        workplace_free_time = []
+        workplace_spans = []
         m_idx, w_idx = 0, 0
-        m_len = len(machine_free_time)
-        w_len = len(worker_free_time)
+        m_len = len(machine_spans)
+        w_len = len(worker_spans)
 
         while m_idx < m_len and w_idx < w_len:
-            m_start, m_end, _ = machine_free_time[m_idx]
-            w_start, w_end, _ = worker_free_time[w_idx]
+            m_start, m_end = machine_spans[m_idx]
+            w_start, w_end = worker_spans[w_idx]
 
             # Находим пересечение интервалов
-            start = max(m_start, w_start)
-            end = min(m_end, w_end)
+            start = m_start if m_start > w_start else w_start
+            end = m_end if m_end < w_end else w_end
             if start < end:
-                # Добавляем пересечение в результат
-                workplace_free_time.append({
-                    "start": start,
-                    "end": end,
-                    "dur": (end - start).total_seconds()
-                })
+                workplace_spans.append((start, end))
                 # Перемещаем указатель интервала, который раньше заканчивается
                 if m_end < w_end:
                     m_idx += 1
                 else:
                     w_idx += 1
+            # Перемещаем указатель интервала с более ранним началом
+            elif m_start < w_start:
+                m_idx += 1
             else:
-                # Перемещаем указатель интервала с более ранним началом
-                if m_start < w_start:
-                    m_idx += 1
-                else:
-                    w_idx += 1
+                w_idx += 1
+
+        return workplace_spans
 
-        self.free_time[(id_workplace, cal_date, shift)] = workplace_free_time
-        self.m_req_ft[(id_machine, cal_date)] = False
-        self.w_req_ft[(id_worker, cal_date, shift)] = False
-        return workplace_free_time
+    def first_free_run(self, id_workplace, cal_date, shift, after, duration) -> datetime | None:
+        """
+        Для календарей с битовыми картами возвращает начало первого непрерывного свободного участка
+        рабочего места не короче ``duration`` секунд после ``after``.
+        Для словарных календарей всегда возвращает ``after``, не отсекая рабочее место
+
+        :param id_workplace: Индекс рабочего места
+        :param cal_date: Дата формата ``date``
+        :param shift: Номер смены
+        :param after: Момент, после которого ищется участок
+        :param duration: Длительность участка в секундах
+        """
+        occupancy = self.__get_occupancy(id_workplace, cal_date, shift)
+        if occupancy is None:
+            return after
+        return occupancy.first_free_run(after, duration)
 
     def add_machine_usage(self,
                           id_workplace: int,
@@ -355,8 +705,6 @@ class WorkPlaces(metaclass=SingletonMeta):
 
             self.machine_calendar.add_machine_usage(id_machine, cal_date, shift_for_machines, machine_usage)
             self.worker_calendar.add_machine_usage(id_worker, cal_date, shift, machine_usage)
-            self.m_req_ft[(id_machine, cal_date)] = True
-            self.w_req_ft[(id_worker, cal_date, shift)] = True
         return
 
     def get_nearest_color(self, id_workplace: int, start: datetime) -> str|None:
@@ -368,12 +716,7 @@ class WorkPlaces(metaclass=SingletonMeta):
         """
 
         id_machine = self.workplaces[id_workplace]["machine"]
-        cal_date = start.date()
-
-        if start < self.machine_calendar.get_period(id_machine, cal_date, shift_for_machines)[0]:
-            cal_date -= timedelta(days=1)
-
-        return self.machine_calendar.get_last_color(id_machine, cal_date, start)
+        return self.machine_calendar.get_last_color(id_machine, start)
 
     def print_changeovers(self):
         print_lblue("Информация по переналадкам:")
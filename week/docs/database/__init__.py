@@ -4,10 +4,14 @@ from .model import (Calendar, MachineGroups, MachineEfficiency, PairsSteps, Posi
                     OptimizeParams, OrderRations, MachineGroups, MachineEfficiency, SortCriteria, Demand, Supplies,
                     SupsParams, WorkerCalendarDB, WorkerDB, MachineDB, MachineCalendarDB, WorkplaceDB, EmergencyDB,
                     ProdOrder, ClientOrder, TechCard, Plans, PairsStepsWeek, PositionsOutputWeek, PlansWeek,
-                    ThreeMonthPositions, PosStrings, OptimizeParamsWeek, DailyShiftQuota, Suppliers)
+                    ThreeMonthPositions, PosStrings, OptimizeParamsWeek, DailyShiftQuota, Suppliers,
+                    PositionDurationCache)
 
-from .db_loads import (get_table_data, clear_and_insert_table, save_positions_pairs, get_table_first,
-                       send_duration_to_prod_orders, save_daily_shift_quota_to_db)
+from .db_loads import (get_table_data, get_table_rows, iter_table_rows, clear_and_insert_table, copy_insert_table,
+                       save_positions_pairs, get_table_first, send_duration_to_prod_orders, save_daily_shift_quota_to_db,
+                       get_duration_version_key, load_duration_cache, save_duration_cache, input_snapshot,
+                       get_last_plan_id, reset_forked_connections)
+from .plan_writer import PlanStreamWriter
 
 __all__ = [
     'settings',
@@ -17,7 +21,10 @@ __all__ = [
     'async_session',
     'connect',
     'get_table_data',
+    'get_table_rows',
+    'iter_table_rows',
     'clear_and_insert_table',
+    'copy_insert_table',
     'Calendar',
     'MachineGroups',
     'MachineEfficiency',
@@ -55,4 +62,12 @@ __all__ = [
     "OptimizeParamsWeek",
     "DailyShiftQuota",
     "save_daily_shift_quota_to_db",
+    "PositionDurationCache",
+    "get_duration_version_key",
+    "load_duration_cache",
+    "save_duration_cache",
+    "input_snapshot",
+    "get_last_plan_id",
+    "reset_forked_connections",
+    "PlanStreamWriter",
 ]
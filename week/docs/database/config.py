@@ -15,6 +15,8 @@ class classproperty:
 class Serialize:
     command = "week"
     start_date = datetime(2025, 1, 1, 9)
+    calendar_backend = "dict"
+    output_writer = "copy"
 
     _commands = {
         "three_month": "Трехмесячный оптимизатор",
@@ -47,6 +49,10 @@ class Serialize:
     def is_week(cls):
         return cls.get_command() == "Недельный оптимизатор"
 
+    @classproperty
+    def is_bitmap_calendar(cls):
+        return cls.calendar_backend == "bitmap"
+
 class Settings(BaseSettings):
     DB_HOST: SecretStr
     DB_PORT: SecretStr
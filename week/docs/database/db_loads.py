@@ -1,11 +1,67 @@
+import hashlib
+import io
+from contextlib import contextmanager
 from datetime import datetime
-from sqlalchemy import update, case
+from sqlalchemy import update, case, select, delete, and_
 from sqlalchemy.orm import Session
 
 from docs.database import sync_engine as engine, PairsSteps, PositionsOutput, ProdOrder, PairsStepsWeek, \
-    PositionsOutputWeek, PlansWeek, DailyShiftQuota
+    PositionsOutputWeek, PlansWeek, DailyShiftQuota, PositionDurationCache, MachineCalendarDB, WorkerCalendarDB, \
+    MachineDB, WorkerDB, WorkplaceDB, EmergencyDB, TechCard, MachineGroups
 from docs.database import Plans, Serialize
-from docs.utils import copy_all_same_attrs
+
+
+# Столбцы выходных таблиц в порядке значений строк, которые собирают функции сохранения
+PAIRS_STEPS_COLUMNS = ("id_position", "sequence_num", "id_workplace", "id_pair", "start_date", "end_date", "plan_id",
+                       "step_num", "shift")
+POSITIONS_OUTPUT_COLUMNS = ("prod_position_id", "freeze", "start_date", "end_date", "plan_id", "status")
+DAILY_SHIFT_QUOTA_COLUMNS = ("responsible", "workplace_id", "operation", "quota", "start_date", "end_date",
+                             "id_position")
+
+
+# Сессия открытого ``input_snapshot``: пока она есть, все чтения входных данных идут через нее
+_snapshot_session = None
+
+
+@contextmanager
+def input_snapshot():
+    """
+    Открывает одну транзакцию REPEATABLE READ на всю загрузку входных данных запуска.
+    Все ``get_table_data`` и ``get_table_first`` внутри блока читают в ней, поэтому видят один согласованный
+    снимок БД и не открывают по сессии на каждую таблицу. Внутри блока в БД ничего не пишется
+    :return: сессия снимка
+    """
+    global _snapshot_session
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="REPEATABLE READ")
+        with Session(bind=connection) as session, session.begin():
+            _snapshot_session = session
+            try:
+                yield session
+            finally:
+                _snapshot_session = None
+
+
+def reset_forked_connections():
+    """
+    Инициализатор дочерних процессов, созданных через ``fork``: забывает унаследованные от родителя соединения
+    пула, не закрывая их, чтобы процесс открывал свои, а соединения родителя продолжали работать
+    """
+    engine.dispose(close=False)
+
+
+@contextmanager
+def _read_session():
+    """Возвращает сессию открытого снимка или новую сессию, если снимок не открыт"""
+    if _snapshot_session is not None:
+        try:
+            yield _snapshot_session
+        finally:
+            # Как и после закрытия отдельной сессии, каждый вызов получает свои отсоединенные объекты
+            _snapshot_session.expunge_all()
+        return
+    with Session(engine) as session:
+        yield session
 
 
 def get_table_data(cls, conditions=None):
@@ -16,12 +72,51 @@ def get_table_data(cls, conditions=None):
     :type conditions: bool
     :return: список объектов
     """
-    with Session(engine) as session:
+    with _read_session() as session:
         if conditions is not None:
             return session.query(cls).filter(conditions).all()
         return session.query(cls).all()
 
 
+def get_table_rows(cls, columns=None, conditions=None):
+    """ Выгружает заданные колонки таблицы без построения ORM-объектов. Строки - кортежи
+    с доступом к полям по имени колонки, поэтому их можно читать так же, как объекты ``get_table_data``
+    :param cls: класс
+    :param columns: колонки для выгрузки, по умолчанию - все колонки таблицы
+    :type columns: tuple | None
+    :param conditions: условие для выгрузки
+    :type conditions: bool
+    :return: список строк
+    """
+    with _read_session() as session:
+        return session.execute(_rows_statement(cls, columns, conditions)).all()
+
+
+def iter_table_rows(cls, columns=None, conditions=None, chunk_size=10000):
+    """ Как ``get_table_rows``, но отдает строки потоком порциями по ``chunk_size`` (``yield_per``),
+    не держа в памяти всю таблицу. Итератор нужно дочитать до конца
+    :param cls: класс
+    :param columns: колонки для выгрузки, по умолчанию - все колонки таблицы
+    :type columns: tuple | None
+    :param conditions: условие для выгрузки
+    :type conditions: bool
+    :param chunk_size: размер порции
+    :type chunk_size: int
+    :return: итератор по строкам
+    """
+    stmt = _rows_statement(cls, columns, conditions).execution_options(yield_per=chunk_size)
+    with _read_session() as session:
+        yield from session.execute(stmt)
+
+
+def _rows_statement(cls, columns, conditions):
+    """Собирает ``select`` по колонкам таблицы с условием"""
+    stmt = select(*(columns or cls.__table__.columns))
+    if conditions is not None:
+        stmt = stmt.where(conditions)
+    return stmt
+
+
 def get_table_first(cls, conditions=None):
     """ Принимает класс в качестве аргумента и возвращает первый объект по условию
      или первый объект, который хранится в соответствующей таблице базы данных
@@ -30,7 +125,7 @@ def get_table_first(cls, conditions=None):
     :type conditions: bool
     :return: объект класса ``cls``
     """
-    with Session(engine) as session:
+    with _read_session() as session:
         if conditions is not None:
             return session.query(cls).filter(conditions).first()
         return session.query(cls).first()
@@ -53,6 +148,66 @@ def send_duration_to_prod_orders(positions):
         session.execute(stmt)
         session.commit()
 
+def get_duration_version_key():
+    """Возвращает хэш всего, от чего кроме самой позиции зависит расчет ее длительности:
+    версий календарей оборудования и работников, рабочих мест, групп оборудования, аварий и техкарт
+    :return: шестнадцатеричная строка хэша
+    """
+    statements = (
+        select(MachineCalendarDB.calendar_id, MachineCalendarDB.version).distinct()
+        .order_by(MachineCalendarDB.calendar_id, MachineCalendarDB.version),
+        select(WorkerCalendarDB.calendar_id, WorkerCalendarDB.version).distinct()
+        .order_by(WorkerCalendarDB.calendar_id, WorkerCalendarDB.version),
+        select(MachineDB.id, MachineDB.machine_calendar_id).order_by(MachineDB.id),
+        select(WorkerDB.id, WorkerDB.worker_calendar_id).order_by(WorkerDB.id),
+        select(WorkplaceDB.id, WorkplaceDB.machine_id, WorkplaceDB.worker_id).order_by(WorkplaceDB.id),
+        select(MachineGroups.id_group_machine, MachineGroups.id_machine).order_by(MachineGroups.id),
+        select(EmergencyDB.machine_id, EmergencyDB.worker_id, EmergencyDB.start_date, EmergencyDB.end_date)
+        .order_by(EmergencyDB.id),
+        select(TechCard.id, TechCard.duration, TechCard.id_group_machine, TechCard.sequence_num,
+               TechCard.type_tight, TechCard.type_sole).order_by(TechCard.id),
+    )
+    key = hashlib.sha256()
+    with _read_session() as session:
+        for stmt in statements:
+            for row in session.execute(stmt):
+                key.update(repr(tuple(row)).encode())
+            key.update(b"|")
+    return key.hexdigest()
+
+
+def load_duration_cache(version_key):
+    """Выгружает сохраненные длительности позиций, посчитанные при тех же календарях и техкартах
+    :param version_key: хэш из ``get_duration_version_key``
+    :type version_key: str
+    :return: {``key``: ``duration_h``}
+    """
+    with _read_session() as session:
+        stmt = select(PositionDurationCache.key, PositionDurationCache.duration_h).where(
+            PositionDurationCache.version_key == version_key)
+        return {key: duration_h for key, duration_h in session.execute(stmt)}
+
+
+def save_duration_cache(version_key, durations):
+    """Сохраняет посчитанные длительности позиций и удаляет записи, посчитанные при других календарях или техкартах
+    :param version_key: хэш из ``get_duration_version_key``
+    :type version_key: str
+    :param durations: {``key``: ``duration_h``}
+    :type durations: dict
+    :return: None
+    """
+    with Session(engine) as session:
+        try:
+            session.execute(delete(PositionDurationCache).where(PositionDurationCache.version_key != version_key))
+            session.execute(delete(PositionDurationCache).where(PositionDurationCache.key.in_(durations.keys())))
+            session.add_all(PositionDurationCache(key=key, version_key=version_key, duration_h=duration_h)
+                            for key, duration_h in durations.items())
+            session.commit()
+        except Exception as e:
+            print(e)
+            session.rollback()
+
+
 def clear_and_insert_table(cls, new_data=None, conditions=None):
     """ Принимает класс в качестве аргумента и очищает таблицу базы данных, затем вставляет в нее новые данные
     :param cls: класс
@@ -82,76 +237,147 @@ def clear_and_insert_table(cls, new_data=None, conditions=None):
             session.rollback()
 
 
+def _copy_value(value):
+    """Записывает значение в текстовом формате COPY: пустое значение - ``\\N``, спецсимволы экранируются"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _row_to_object(cls, columns, row):
+    """Собирает из строки значений объект таблицы для вставки через ORM"""
+    obj = cls()
+    for column, value in zip(columns, row):
+        setattr(obj, column, value)
+    return obj
+
+
+def _use_copy(bind):
+    """Проверяет, пишутся ли выходные таблицы через COPY: выбран ``Serialize.output_writer = "copy"`` и БД - PostgreSQL"""
+    return Serialize.output_writer == "copy" and bind.dialect.name == "postgresql"
+
+
+def _copy_rows(connection, cls, columns, rows):
+    """Передает строки в таблицу одной командой ``COPY FROM STDIN`` через psycopg2-соединение ``connection``"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {cls.__table__.name} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def copy_insert_table(cls, columns, rows, conditions=None):
+    """ Очищает таблицу по условию и вставляет строки одной командой ``COPY FROM STDIN`` в той же транзакции.
+    Если БД не PostgreSQL, выбран ``Serialize.output_writer = "orm"`` или COPY не прошел,
+    строки вставляются через ORM в ``clear_and_insert_table``
+    :param cls: класс
+    :param columns: названия столбцов в порядке значений строк
+    :type columns: tuple [str]
+    :param rows: строки значений
+    :type rows: list [tuple]
+    :param conditions: условие для очистки
+    :type conditions: bool
+    :return: выгружает данные в БД
+    """
+    if _use_copy(engine):
+        try:
+            with engine.begin() as connection:
+                stmt = delete(cls) if conditions is None else delete(cls).where(conditions)
+                connection.execute(stmt)
+                _copy_rows(connection, cls, columns, rows)
+            return
+        except Exception as e:
+            print(e)
+
+    clear_and_insert_table(cls, [_row_to_object(cls, columns, row) for row in rows], conditions)
+
+
+def write_rows(connection, cls, columns, rows):
+    """ Вставляет строки в таблицу внутри уже открытой транзакции соединения, не очищая таблицу:
+    командой ``COPY FROM STDIN`` или, как в ``copy_insert_table``, через ORM
+    :param connection: соединение с открытой транзакцией
+    :type connection: sqlalchemy.Connection
+    :param cls: класс
+    :param columns: названия столбцов в порядке значений строк
+    :type columns: tuple [str]
+    :param rows: строки значений
+    :type rows: list [tuple]
+    :return: None
+    """
+    if not rows:
+        return
+    if _use_copy(connection):
+        _copy_rows(connection, cls, columns, rows)
+        return
+    # Сессия присоединяется к транзакции соединения и не завершает ее
+    with Session(bind=connection) as session:
+        session.add_all(_row_to_object(cls, columns, row) for row in rows)
+        session.flush()
+
+
 def convert_pair_steps_to_db(step, plan_id, id_pair):
-    """Преобразовывает объекты пар в формат, совместимый с БД, в экземпляр класса PairsSteps.
+    """Преобразовывает шаг пары в строку таблицы PairsSteps в порядке ``PAIRS_STEPS_COLUMNS``.
     :param step: шаг
     :type step: Steps
     :param plan_id: номер плана
     :type plan_id: int
     :param id_pair: идентификатор пары
     :type id_pair: int
-    :return: список шагов
+    :return: строка значений
+    :rtype: tuple
     """
-    cls = PairsSteps
-    if Serialize.is_week:
-        cls = PairsStepsWeek
-    db_pair = cls()
-    copy_all_same_attrs(db_pair, step)
-    db_pair.id_pair = id_pair
-    db_pair.plan_id = plan_id
-
-    return db_pair
+    return (step.id_position, step.sequence_num, step.id_workplace, id_pair, step.start_date, step.end_date, plan_id,
+            step.step_num, step.shift)
 
 
 def convert_positions_to_db(position, plan_id):
-    """Преобразовывает объекты позиции в формат, совместимый с БД, в экземпляр класса PositionsOutput.
+    """Преобразовывает позицию в строку таблицы PositionsOutput в порядке ``POSITIONS_OUTPUT_COLUMNS``.
     :param position: список позиций
     :type position: Positions
     :param plan_id: номер цифрового двойника
     :type plan_id: int
-    :return: список позиций
+    :return: строка значений
+    :rtype: tuple
     """
-    cls = PositionsOutput
-    if Serialize.is_week:
-        cls = PositionsOutputWeek
-    db_positions = cls(
-
-        prod_position_id=position.id,
-        freeze=position.freeze,
-        start_date=position.start_date,
-        end_date=position.end_date,
-        plan_id=plan_id,
-        status=position.status
-    )
-    return db_positions
+    return position.id, position.freeze, position.start_date, position.end_date, plan_id, position.status
 
 
-def save_steps_to_db(positions, plan_id):
+def save_steps_to_db(positions, plan_id, keep_ids=None):
     """Сохранение данных в таблицу 'pairs_steps' в БД.
     :param positions: список позиций
     :type positions: list [Positions]
     :param plan_id: номер цифрового двойника
     :type plan_id: int
+    :param keep_ids: позиции, шаги которых остаются в плане, остальные шаги плана заменяются
+    :type keep_ids: set[int] | None
     :return: выгружает список шагов в БД
     """
     db_pairs = []
     for position in positions:
         for pair in position.pairs:
-            for step in pair.steps:
-                db_pairs.append(convert_pair_steps_to_db(step, plan_id, pair.id))
+            for id_pair, step in pair.expand_lot():
+                db_pairs.append(convert_pair_steps_to_db(step, plan_id, id_pair))
     cls = PairsSteps
     if Serialize.is_week:
         cls = PairsStepsWeek
     condition = cls.plan_id == plan_id # задаем условие для очистки таблицы
-    clear_and_insert_table(cls, db_pairs, condition) # передаем класс, список пар, условие для очистки таблицы
+    if keep_ids:
+        condition = and_(condition, cls.id_position.not_in(keep_ids))
+    copy_insert_table(cls, PAIRS_STEPS_COLUMNS, db_pairs, condition) # передаем класс, столбцы, строки шагов, условие для очистки таблицы
 
 
-def save_positions_to_db(positions, plan_id):
+def save_positions_to_db(positions, plan_id, keep_ids=None):
     """Сохранение данных в таблицу 'PositionsOutput' в БД.
     :param positions: список позиций
     :type positions: list [Positions]
     :param plan_id: номер цифрового двойника
     :type plan_id: int
+    :param keep_ids: позиции, строки которых остаются в плане, остальные строки плана заменяются
+    :type keep_ids: set[int] | None
     :return: выгружает обновленный список позиций в БД
     """
     db_positions = []
@@ -161,22 +387,16 @@ def save_positions_to_db(positions, plan_id):
     if Serialize.is_week:
         cls = PositionsOutputWeek
     condition = cls.plan_id == plan_id # задаем условие для очистки таблицы
-    clear_and_insert_table(cls, db_positions, condition) # передаем класс, список заказов, условие для очистки таблицы
+    if keep_ids:
+        condition = and_(condition, cls.prod_position_id.not_in(keep_ids))
+    copy_insert_table(cls, POSITIONS_OUTPUT_COLUMNS, db_positions, condition) # передаем класс, столбцы, строки заказов, условие для очистки таблицы
 
 
 def save_daily_shift_quota_to_db(daily_shift_quota:list[tuple]):
-    obj_list = []
-    for quota_details in daily_shift_quota:
-        quota = DailyShiftQuota()
-        quota.responsible = quota_details.worker_name
-        quota.workplace_id = quota_details.id_workplace
-        quota.operation = quota_details.operation_name
-        quota.quota = quota_details.quota
-        quota.start_date = quota_details.start
-        quota.end_date = quota_details.end
-        quota.id_position = quota_details.id_position
-        obj_list.append(quota)
-    clear_and_insert_table(DailyShiftQuota, obj_list)
+    rows = [(quota_details.worker_name, quota_details.id_workplace, quota_details.operation_name, quota_details.quota,
+             quota_details.start, quota_details.end, quota_details.id_position)
+            for quota_details in daily_shift_quota]
+    copy_insert_table(DailyShiftQuota, DAILY_SHIFT_QUOTA_COLUMNS, rows)
 
 
 def save_plan_to_db(plan_id, cnt_suc, perc_suc, cnt_pr_or):
@@ -194,19 +414,32 @@ def save_plan_to_db(plan_id, cnt_suc, perc_suc, cnt_pr_or):
         session.commit()
 
 
-def save_positions_pairs(positions, pos_cls):
+def get_last_plan_id():
+    """Возвращает номер последнего плана, в который сохраняется результат, или 1, если планов еще нет"""
     if Serialize.is_week:
         cls = PlansWeek
     else:
         cls = Plans
     plans = get_table_data(cls)
     if not plans:
-        plan_id = 1
-    else:
-        plan_id = max([plan.id for plan in plans])
+        return 1
+    return max([plan.id for plan in plans])
+
+
+def save_positions_pairs(positions, pos_cls, keep_ids=None, writer=None):
+    """Сохраняет шаги и позиции в последний план, а для трехмесячного плана - еще длительности и итоги плана.
+    Строки позиций из ``keep_ids`` остаются в плане, остальные строки плана, в том числе строки позиций,
+    которых больше нет, заменяются переданными.
+    Если шаги уже писались по ходу расстановки через ``writer``, план публикуется его ``finish``,
+    а при ошибке записи сохраняется обычным способом
+    :param writer: потоковая запись плана, начатая до расстановки
+    :type writer: PlanStreamWriter | None
+    """
+    plan_id = writer.plan_id if writer is not None else get_last_plan_id()
     print(f"plan_id {plan_id}")
-    save_steps_to_db(positions, plan_id)
-    save_positions_to_db(positions, plan_id)
+    if writer is None or not writer.finish(positions):
+        save_steps_to_db(positions, plan_id, keep_ids)
+        save_positions_to_db(positions, plan_id, keep_ids)
     if not Serialize.is_week:
         send_duration_to_prod_orders(positions)
         save_plan_to_db(plan_id, pos_cls.count_success, pos_cls.percent_success, pos_cls.count_prod_order)
@@ -0,0 +1,76 @@
+"""
+Разовая миграция схемы уже существующей БД под текущие модели.
+``create_all`` при импорте создает только отсутствующие таблицы, а существующие не трогает, поэтому после
+обновления, в котором у моделей появились новые столбцы или индексы, миграцию нужно один раз запустить перед стартом::
+
+    python -m docs.database.migrations
+"""
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn, CreateIndex, DDL
+
+from docs.database import sync_engine
+from docs.database.model import Base
+from docs.utils import setup_logger
+
+logging = setup_logger(__name__)
+
+
+def add_missing_columns(engine=sync_engine):
+    """
+    Добавляет в существующие таблицы столбцы, появившиеся в моделях позже самих таблиц.
+    Добавляются только столбцы, допускающие пустое значение, остальные нужно добавить вручную
+    :param engine: движок БД
+    :return: None
+    """
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    logging.error(f"в таблице {table.name} нет обязательного столбца {column.name}")
+                    continue
+                column_ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.execute(DDL(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_ddl}"))
+                logging.info(f"в таблицу {table.name} добавлен столбец {column.name}")
+
+
+def add_missing_indexes(engine=sync_engine):
+    """
+    Создает в существующих таблицах индексы, объявленные в моделях позже самих таблиц.
+    В PostgreSQL индексы строятся ``CONCURRENTLY``, чтобы не блокировать запись в большие таблицы
+    вроде ``pair_ks`` и ``pairs_steps``, поэтому каждый индекс создается вне транзакции
+    :param engine: движок БД
+    :return: None
+    """
+    inspector = inspect(engine)
+    concurrently = engine.dialect.name == "postgresql"
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                index_ddl = str(CreateIndex(index).compile(dialect=engine.dialect))
+                if concurrently:
+                    index_ddl = index_ddl.replace("INDEX", "INDEX CONCURRENTLY", 1)
+                connection.execute(DDL(index_ddl))
+                logging.info(f"в таблице {table.name} создан индекс {index.name}")
+
+
+def migrate(engine=sync_engine):
+    """Приводит схему существующей БД к текущим моделям"""
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+
+
+if __name__ == '__main__':
+    migrate()
@@ -20,7 +20,7 @@ class Base(DeclarativeBase):
 class WorkerCalendarDB(Base):
     __tablename__ = "worker_calendar"
 
-    calendar_id: Mapped[int]
+    calendar_id: Mapped[int] = mapped_column(index=True)
     date_start: Mapped[datetime]
     date_end: Mapped[datetime]
     duration: Mapped[float]
@@ -42,7 +42,7 @@ class WorkerDB(Base):
 class MachineCalendarDB(Base):
     __tablename__ = "machine_calendar"
 
-    calendar_id: Mapped[int]
+    calendar_id: Mapped[int] = mapped_column(index=True)
     date_start: Mapped[datetime]
     date_end: Mapped[datetime]
     duration: Mapped[float]
@@ -132,14 +132,14 @@ class ProdOrder(Base):
     __tablename__ = "prod_order"
 
     client_order_id: Mapped[int]
-    plan_id: Mapped[int]
+    plan_id: Mapped[int] = mapped_column(index=True)
     quantity: Mapped[int]
     sole: Mapped[str]
     tie: Mapped[str]
     priority: Mapped[int]
     model_name: Mapped[str]
     freeze: Mapped[bool]
-    prod_order_id: Mapped[int]
+    prod_order_id: Mapped[int] = mapped_column(index=True)
     duration_h: Mapped[float]
 
 
@@ -176,13 +176,13 @@ class PairsSteps(Base):
         self.step_num = None
         self.shift = None
 
-    id_position: Mapped[int]
+    id_position: Mapped[int] = mapped_column(index=True)
     sequence_num: Mapped[int]
     id_workplace: Mapped[int]
     id_pair: Mapped[int]
     start_date: Mapped[datetime | None]
     end_date: Mapped[datetime | None]
-    plan_id: Mapped[int]
+    plan_id: Mapped[int] = mapped_column(index=True)
     step_num: Mapped[int]
     shift: Mapped[int]
 
@@ -200,13 +200,13 @@ class PairsStepsWeek(Base):
         self.step_num = None
         self.shift = None
 
-    id_position: Mapped[int]
+    id_position: Mapped[int] = mapped_column(index=True)
     sequence_num: Mapped[int]
     id_workplace: Mapped[int]
     id_pair: Mapped[int]
     start_date: Mapped[datetime | None]
     end_date: Mapped[datetime | None]
-    plan_id: Mapped[int]
+    plan_id: Mapped[int] = mapped_column(index=True)
     step_num: Mapped[int]
     shift: Mapped[int]
 
@@ -218,7 +218,7 @@ class PositionsOutput(Base):
     freeze: Mapped[bool | None] = mapped_column(default=False)
     start_date: Mapped[datetime | None]
     end_date: Mapped[datetime | None]
-    plan_id: Mapped[int]
+    plan_id: Mapped[int] = mapped_column(index=True)
     status: Mapped[str]
 
 
@@ -229,7 +229,7 @@ class PositionsOutputWeek(Base):
     freeze: Mapped[bool | None] = mapped_column(default=False)
     start_date: Mapped[datetime | None]
     end_date: Mapped[datetime | None]
-    plan_id: Mapped[int]
+    plan_id: Mapped[int] = mapped_column(index=True)
     status: Mapped[str]
 
 
@@ -242,6 +242,10 @@ class OptimizeParamsBase(Base):
     is_positions_coeffs: Mapped[bool]
     workload_calendar: Mapped[float]
     digital_twin: Mapped[int]
+    lot_size: Mapped[int | None]  # пар в партии трехмесячного плана, пусто - каждая пара отдельно
+    multi_start: Mapped[int | None]  # случайных вариантов жадной расстановки, пусто - одна обычная расстановка
+    time_budget: Mapped[float | None]  # секунд на все варианты расстановки
+    improve_budget: Mapped[float | None]  # секунд на улучшение плана локальным поиском, пусто - без улучшения
 
 
 class OptimizeParams(OptimizeParamsBase):
@@ -283,7 +287,7 @@ class ThreeMonthPositions(Base):
 
     start_date: Mapped[datetime | None]
     end_date: Mapped[datetime | None]
-    plan_id: Mapped[int]
+    plan_id: Mapped[int] = mapped_column(index=True)
 
 
 class WeeklyPositions(Base):
@@ -309,7 +313,7 @@ class WeeklyPositions(Base):
 class PairsKS(Base):
     __tablename__ = "pair_ks"
 
-    id_position: Mapped[int]
+    id_position: Mapped[int] = mapped_column(index=True)
     status: Mapped[str]
     current_step: Mapped[int]
 
@@ -375,7 +379,7 @@ class PlansWeek(Base):
 class PosStrings(Base):
     __tablename__ = "position_strings"
 
-    prod_order_id: Mapped[int]
+    prod_order_id: Mapped[int] = mapped_column(index=True)
     category: Mapped[str]
     color: Mapped[str]
 
@@ -392,6 +396,14 @@ class DailyShiftQuota(Base):
     id_position: Mapped[int]
 
 
+class PositionDurationCache(Base):
+    __tablename__ = "position_duration_cache"
+
+    key: Mapped[str] = mapped_column(index=True)  # хэш шагов, количества и границ позиции
+    version_key: Mapped[str]  # хэш версий календарей, рабочих мест, аварий и техкарт
+    duration_h: Mapped[float]
+
+
 try:
     """Создание таблицы, если какая-то отсутствует"""
     Base.metadata.create_all(bind=sync_engine)
@@ -0,0 +1,132 @@
+import queue
+import threading
+
+from sqlalchemy import delete, and_
+
+from docs.database import sync_engine as engine, PairsSteps, PositionsOutput, PairsStepsWeek, PositionsOutputWeek
+from docs.database import Serialize
+from docs.database.db_loads import (write_rows, convert_pair_steps_to_db, convert_positions_to_db,
+                                    PAIRS_STEPS_COLUMNS, POSITIONS_OUTPUT_COLUMNS)
+
+
+class PlanStreamWriter:
+    """
+    Пишет шаги плана в БД по ходу расстановки. Шаги каждой позиции превращаются в строки, как только позиция
+    зафиксирована в календаре, а фоновый поток пишет их пачками по ``chunk_size`` строк.
+    Все пишется в одной транзакции: старые строки плана удаляются в ее начале, а коммит происходит в ``finish``
+    вместе с позициями, поэтому читатели видят либо прошлый план целиком, либо новый. Транзакция и блокировки
+    удаленных строк держатся от первой позиции до конца расстановки.
+    Сами шаги остаются у позиций: запись только идет параллельно с расстановкой, а не после нее,
+    поэтому писать так имеет смысл только тогда, когда шаги позиции больше не меняются после ее расстановки.
+    Поток запускается при первой записи.
+
+    Пример::
+
+        with PlanStreamWriter(plan_id) as writer:
+            create_plan(positions, on_placed=writer.put)
+            writer.finish(positions)
+    """
+
+    def __init__(self, plan_id, keep_ids=None, chunk_size=50000, max_pending=256):
+        """
+        :param plan_id: номер плана, в который пишутся строки
+        :type plan_id: int
+        :param keep_ids: позиции, строки которых остаются в плане, остальные строки плана заменяются
+        :type keep_ids: set[int] | None
+        :param chunk_size: строк шагов в одной записи
+        :type chunk_size: int
+        :param max_pending: позиций в очереди, после которых расстановка ждет запись
+        :type max_pending: int
+        """
+        self.plan_id = plan_id
+        self.keep_ids = keep_ids
+        self.chunk_size = chunk_size
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._positions_rows = None
+        self._error = None
+        self._done = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self._done:
+            self.abort()
+
+    def _tables(self):
+        if Serialize.is_week:
+            return PairsStepsWeek, PositionsOutputWeek
+        return PairsSteps, PositionsOutput
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        steps_cls, positions_cls = self._tables()
+        steps_condition = steps_cls.plan_id == self.plan_id
+        positions_condition = positions_cls.plan_id == self.plan_id
+        if self.keep_ids:
+            steps_condition = and_(steps_condition, steps_cls.id_position.not_in(self.keep_ids))
+            positions_condition = and_(positions_condition, positions_cls.prod_position_id.not_in(self.keep_ids))
+        queue_closed = False
+        try:
+            with engine.connect() as connection, connection.begin() as transaction:
+                connection.execute(delete(steps_cls).where(steps_condition))
+                chunk = []
+                while (rows := self._queue.get()) is not None:
+                    chunk.extend(rows)
+                    if len(chunk) >= self.chunk_size:
+                        write_rows(connection, steps_cls, PAIRS_STEPS_COLUMNS, chunk)
+                        chunk = []
+                queue_closed = True
+                write_rows(connection, steps_cls, PAIRS_STEPS_COLUMNS, chunk)
+
+                # Без строк позиций запись отменена
+                if self._positions_rows is None:
+                    transaction.rollback()
+                    return
+                connection.execute(delete(positions_cls).where(positions_condition))
+                write_rows(connection, positions_cls, POSITIONS_OUTPUT_COLUMNS, self._positions_rows)
+        except Exception as e:
+            print(e)
+            self._error = e
+            # Разбираем очередь до конца, чтобы расстановка не ждала запись
+            while not queue_closed and self._queue.get() is not None:
+                pass
+
+    def put(self, position):
+        """
+        Отдает на запись шаги позиции, которые больше не изменятся
+        :param position: позиция
+        :type position: Positions
+        :rtype: None
+        """
+        if self._error is not None or (self.keep_ids and position.id in self.keep_ids):
+            return
+        self._start()
+        self._queue.put([convert_pair_steps_to_db(step, self.plan_id, id_pair)
+                         for pair in position.pairs for id_pair, step in pair.expand_lot()])
+
+    def finish(self, positions):
+        """
+        Дописывает шаги, записывает позиции и публикует план одним коммитом
+        :param positions: позиции, которые сохраняются в ``positions_output``
+        :type positions: list[Positions]
+        :returns: ``True``, если план опубликован, ``False`` - если запись не удалась и транзакция откатилась
+        """
+        self._done = True
+        self._positions_rows = [convert_positions_to_db(position, self.plan_id) for position in positions]
+        self._start()
+        self._queue.put(None)
+        self._thread.join()
+        return self._error is None
+
+    def abort(self):
+        """Отменяет запись: транзакция откатывается и в БД остается прошлый план"""
+        self._done = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
@@ -67,6 +67,8 @@ def process_message(message, queue):
         start_date = datetime(year=start_date.year, month=start_date.month, day=start_date.day, hour=0)
         Serialize.start_date = start_date
         Serialize.command = command
+        Serialize.calendar_backend = data.get("calendar_backend", "dict")
+        Serialize.output_writer = data.get("output_writer", "copy")
         q = []
 
         match Serialize.get_command():
@@ -74,7 +76,8 @@ def process_message(message, queue):
                 print(f"Запуск {Serialize.get_command()}")
                 from docs.optimizer import three_month_start
                 plan_id = data.get("digital_twin")
-                three_month_start(plan_id)
+                three_month_start(plan_id, incremental=data.get("incremental", False),
+                                  warm_start=data.get("warm_start", False))
                 msg_out = "three_month_done"
                 q = ["krai_out"]
                 print("очистка")
@@ -82,7 +85,7 @@ def process_message(message, queue):
                 print(f"Запуск {Serialize.get_command()}")
                 from docs.optimizer import week_start
                 plan_id = data.get("digital_twin")
-                week_start(plan_id)
+                week_start(plan_id, warm_start=data.get("warm_start", False))
                 msg_out = "week_done"
                 q = "week_out"
                 print("очистка")
@@ -1,11 +1,26 @@
+import hashlib
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
 from datetime import timedelta, datetime, date
+from functools import lru_cache
+from heapq import heappop, heappush
 
-from docs.database import SortCriteria, get_table_data, Serialize
+from docs.database import (SortCriteria, get_table_data, Serialize, get_duration_version_key, load_duration_cache,
+                           save_duration_cache, reset_forked_connections)
 from docs.classes import Pairs, WorkPlaces, Steps, Positions
+from docs.classes.usage_store import from_micros, secs_to_micros, to_micros
 from docs.utils import print_blue, copy_all_same_attrs
 
 
+space_tuple = namedtuple("space_tuple", "start end dur shift changeover color", defaults=(0, None))
+
+CHANGEOVER_SECS = 300
+CHANGEOVER_MICROS = CHANGEOVER_SECS * 10 ** 6
+
+
 def sorted_positions(positions):
     """
     Cортирует позиции по указанным критериям и направлениям.
@@ -17,8 +32,8 @@ def sorted_positions(positions):
     sort_criteria = sorted(criteria, key=lambda x: x.priority)
     # cортировка по именам критериев
     positions = sorted(positions, key=lambda x: (
-        # Сначала проверяем freeze
-            (not getattr(x, 'freeze'),) +
+        # Сначала проверяем freeze, затем позиции из сохраненного плана
+            (not getattr(x, 'freeze'), not getattr(x, 'from_plan', False)) +
             # Затем сортируем по остальным критериям
             tuple(
                 getattr(x, criterion.name) if not criterion.reverse else -getattr(x, criterion.name)
@@ -116,67 +131,54 @@ def split_step(step, split_data):
     return splitted_steps
 
 
-def _get_prioritized_workplaces(group_id, preferred_worker):
-    workplaces = WorkPlaces()
-    """Получает и сортирует рабочие места с учётом предпочтительного работника"""
-    all_wp = workplaces.get_workplaces(group_id)
-    if preferred_worker is None:
-        return all_wp
-
-    preferred = [wp for wp in all_wp
-                if workplaces.get_worker_by_workplace(wp) == preferred_worker]
-    remaining = [wp for wp in all_wp if wp not in preferred]
-    return preferred + remaining
-
-
 def _initialize_wp_data(all_wp):
     """Инициализирует структуры данных для отслеживания времени"""
     return ({wp: 0 for wp in all_wp},
             {wp: [] for wp in all_wp})
 
 
-def _is_valid_space(prev_end, space):
-    """Проверяет, подходит ли временной промежуток для обработки"""
-    return prev_end < space["end"]
+def _space_to_dict(space):
+    """Переводит выбранный промежуток из микросекунд в словарь с ``datetime`` для записи в шаги и календари"""
+    return {
+        "start": from_micros(space.start),
+        "end": from_micros(space.end),
+        "dur": space.dur,
+        "shift": space.shift,
+        "changeover": space.changeover,
+        "color": space.color
+    }
 
 
 def _adjust_final_space(choosen_spaces, wp_id, step_duration, start, current_wp_time_total):
     """Корректирует последний добавленный промежуток"""
-    last_index = len(choosen_spaces[wp_id]) - 1
     extra_time = current_wp_time_total - step_duration
-    req_dur = choosen_spaces[wp_id][last_index]["dur"] - extra_time
-    end = start + timedelta(seconds=req_dur)
+    req_dur = choosen_spaces[wp_id][-1].dur - extra_time
+    end = start + secs_to_micros(req_dur)
 
-    choosen_spaces[wp_id][last_index].update({
-        "end": end,
-        "dur": req_dur
-    })
+    choosen_spaces[wp_id][-1] = choosen_spaces[wp_id][-1]._replace(end=end, dur=req_dur)
 
 
-def _handle_changeover(workplaces, step, choosen_spaces, wp_id, start, space):
+def _handle_changeover(workplaces, step, choosen_spaces, wp_id, start, space_start, space_end):
     """Обрабатывает время переналадки оборудования"""
     if not Serialize.is_week or step.color is None:
         return True
 
-    changeover_time_secs = 300
-    prev_color = workplaces.get_nearest_color(wp_id, start)
+    prev_color = workplaces.get_nearest_color(wp_id, from_micros(start))
 
     if prev_color is None or step.color == prev_color:
-        choosen_spaces[wp_id][-1]["changeover"] = 0
-        choosen_spaces[wp_id][-1]["color"] = step.color
+        choosen_spaces[wp_id][-1] = choosen_spaces[wp_id][-1]._replace(changeover=0, color=step.color)
         return True
 
-    start_with_changeover = max(space["start"], start - timedelta(seconds=changeover_time_secs))
-    start_with_changeover += timedelta(seconds=changeover_time_secs)
-    end_with_changeover = start_with_changeover + timedelta(seconds=choosen_spaces[wp_id][-1]["dur"])
-
-    if end_with_changeover <= space["end"]:
-        choosen_spaces[wp_id][-1].update({
-            "start": start_with_changeover,
-            "end": end_with_changeover,
-            "changeover": changeover_time_secs,
-            "color": step.color
-        })
+    start_with_changeover = max(space_start, start - CHANGEOVER_MICROS) + CHANGEOVER_MICROS
+    end_with_changeover = start_with_changeover + secs_to_micros(choosen_spaces[wp_id][-1].dur)
+
+    if end_with_changeover <= space_end:
+        choosen_spaces[wp_id][-1] = choosen_spaces[wp_id][-1]._replace(
+            start=start_with_changeover,
+            end=end_with_changeover,
+            changeover=CHANGEOVER_SECS,
+            color=step.color
+        )
         return True
     else:
         choosen_spaces[wp_id].pop()
@@ -184,55 +186,57 @@ def _handle_changeover(workplaces, step, choosen_spaces, wp_id, start, space):
 
 
 def _check_space_sufficiency(step_duration, space_duration, wp_time_total, wp_id,
-                             choosen_spaces, space, shift, start, workplaces, step):
+                             choosen_spaces, space_start, space_end, shift, start, workplaces, step):
     """Проверяет достаточность времени и обрабатывает переналадку"""
     wp_time_total[wp_id] += space_duration
-    choosen_spaces[wp_id].append({
-        "start": start,
-        "end": space["end"],
-        "dur": space_duration,
-        "shift": shift
-    })
+    choosen_spaces[wp_id].append(space_tuple(start, space_end, space_duration, shift))
 
     if wp_time_total[wp_id] >= step_duration:
         _adjust_final_space(choosen_spaces, wp_id, step_duration, start, wp_time_total[wp_id])
-        is_enough_time = _handle_changeover(workplaces, step, choosen_spaces, wp_id, start, space)
+        is_enough_time = _handle_changeover(workplaces, step, choosen_spaces, wp_id, start, space_start, space_end)
         return is_enough_time
 
     return False
 
 
-def _process_production_day(step, prod_day, prev_end,
-                           all_wp, wp_time_total, choosen_spaces):
-    """Обрабатывает один производственный день"""
-    workplaces = WorkPlaces()
-    for shift in workplaces.get_shifts():
-        for wp_id in all_wp:
-            spaces = workplaces.get_free_time(wp_id, prod_day, shift)
-            for space in spaces:
-                if not _is_valid_space(prev_end, space):
-                    continue
-
-                start = max(prev_end, space['start'])
-                space_duration = (space["end"] - start).total_seconds()
-
-                if _check_space_sufficiency(
-                    step.duration, space_duration, wp_time_total, wp_id,
-                    choosen_spaces, space, shift, start, workplaces, step
-                ):
-                    return True
+def _push_workplace_shift(heap, workplaces, wp_id, rank, prod_day, shift, prev_end, step, is_week, next_shifts):
+    """
+    Кладет в кучу обхода свободные промежутки рабочего места за день ``prod_day`` и смену ``shift``,
+    идущие после ``prev_end``, и запрос на просмотр следующей смены этого рабочего места.
+    Смены, в которых у группы не хватает свободного времени, пропускаются по ``next_shifts``
+    """
+    if prod_day > workplaces.max_date():
+        return
+    shifts = workplaces.get_shifts()
+    # В недельном режиме шаг не дробится, поэтому рабочее место без подходящего участка пропускаем сразу
+    if not is_week or workplaces.first_free_run(wp_id, prod_day, shift,
+                                                from_micros(prev_end), step.duration) is not None:
+        for space_start, space_end in workplaces.get_free_spans(wp_id, prod_day, shift):
+            if prev_end >= space_end:
+                continue
+            # Недельный шаг должен поместиться в один промежуток, короткие промежутки ему не подходят
+            if is_week and (space_end - max(prev_end, space_start)) / 10 ** 6 < step.duration:
+                continue
+            heappush(heap, (prod_day, shift, rank, space_start, space_end))
 
-                if Serialize.is_week:
-                    wp_time_total[wp_id] = 0
-                    choosen_spaces[wp_id] = []
-    return False
+    if shift != shifts[-1]:
+        next_shift = next_shifts(prod_day, shifts[shifts.index(shift) + 1])
+    else:
+        next_shift = next_shifts(prod_day + timedelta(days=1), shifts[0])
+    if next_shift is not None:
+        heappush(heap, (*next_shift, rank, 0, 0))
 
 
-def workplaces_spaces_traversing(pair, step, prod_day, prev_step_end, preferred_worker=None):
+def workplaces_spaces_traversing(pair, step, prod_day, prev_step_end, preferred_worker=None, rng=None):
     """
     Функция отбора подходящих промежутков для шага и их выборка.
-    Обход идет пока не выйдем за min(дедлайн, наибольшая дата в календаре машин).
-    Вернет (dict(``machine``: [(``space``, ``shift``)]), bool, datetime)
+    Обход идет пока не выйдем за наибольшую дату в календаре машин.
+    Следующие свободные промежутки всех рабочих мест группы лежат в одной куче с ключом
+    (``день``, ``смена``, ``ранг рабочего места``, ``start``), поэтому промежутки достаются в порядке
+    день -> смена -> рабочее место за логарифм от размера кучи. Запись с ``start`` = 0 - запрос на просмотр
+    смены рабочего места: смена читается из календаря, только когда до нее дошла очередь.
+    Время внутри обхода хранится целыми микросекундами от ``EPOCH``, промежутки - ``space_tuple``.
+    Вернет (dict(``machine``: [``space_tuple``]), bool, datetime)
     :param pair: Пара для которой идет обход.
     :type pair: Pairs
     :param step: Шаг для которого идет обход.
@@ -243,31 +247,65 @@ def workplaces_spaces_traversing(pair, step, prod_day, prev_step_end, preferred_
     :type prev_step_end: datetime
     :param preferred_worker: Предпочтительный работник для выполнения шага.
     :type preferred_worker: int | None
+    :param rng: Генератор случайных чисел: если задан, рабочие места не предпочтительного работника
+     перемешиваются, и среди мест, освободившихся в одну смену, выигрывает случайное
+    :type rng: random.Random | None
     :return: ``choosen_spaces``, ``enough_space``, ``prod_day``
     :rtype: (dict, bool, datetime)
     """
     workplaces = WorkPlaces()
-    all_wp = _get_prioritized_workplaces(step.id_group_machine, preferred_worker)
+    all_wp = workplaces.get_prioritized_workplaces(step.id_group_machine, preferred_worker)
+    if rng is not None:
+        preferred = 0
+        if preferred_worker is not None:
+            preferred = sum(1 for wp in all_wp if workplaces.get_worker_by_workplace(wp) == preferred_worker)
+        remaining = list(all_wp[preferred:])
+        rng.shuffle(remaining)
+        all_wp = all_wp[:preferred] + tuple(remaining)
     wp_time_total, choosen_spaces = _initialize_wp_data(all_wp)
-    enough_space = False
-    prev_step_end = prev_step_end or pair.left_border
+    prev_step_end = to_micros(prev_step_end or pair.left_border)
+
+    is_week = Serialize.is_week
+    # Недельному шагу нужен один промежуток не короче шага, трехмесячному - хоть какое-то свободное время
+    at_least = max(int(step.duration * 10 ** 6) - 1, 1) if is_week else 1
+
+    # Календарь во время обхода не меняется, поэтому ответы сводки группы для всех рабочих мест одни и те же
+    next_shifts = lru_cache(maxsize=None)(
+        lambda cal_date, shift: workplaces.next_free_shift(step.id_group_machine, cal_date, shift, at_least)
+    )
+
+    heap = []
+    first_shift = next_shifts(prod_day, workplaces.get_shifts()[0])
+    if first_shift is not None:
+        heap = [(*first_shift, rank, 0, 0) for rank in range(len(all_wp))]
+    while heap:
+        space_day, shift, rank, space_start, space_end = heappop(heap)
+        wp_id = all_wp[rank]
+        if not space_start:
+            _push_workplace_shift(heap, workplaces, wp_id, rank, space_day, shift, prev_step_end, step,
+                                  is_week, next_shifts)
+            continue
 
-    while not enough_space and prod_day <= workplaces.max_date():
-        enough_space = _process_production_day(
-            step, prod_day, prev_step_end, all_wp,
-            wp_time_total, choosen_spaces
-        )
+        start = prev_step_end if prev_step_end > space_start else space_start
+        space_duration = (space_end - start) / 10 ** 6
+
+        if _check_space_sufficiency(
+            step.duration, space_duration, wp_time_total, wp_id,
+            choosen_spaces, space_start, space_end, shift, start, workplaces, step
+        ):
+            return {wp_id: choosen_spaces[wp_id]}, True, space_day
 
-        if not enough_space:
-            prod_day += timedelta(days=1)
+        if is_week:
+            wp_time_total[wp_id] = 0
+            choosen_spaces[wp_id] = []
 
-    return choosen_spaces, enough_space, prod_day
+    return choosen_spaces, False, max(prod_day, workplaces.max_date() + timedelta(days=1))
 
 
-def find_space_for_step(pair, step, prod_day, prev_step_end):
+def find_space_for_step(pair, step, prod_day, prev_step_end, rng=None):
     """
     Ищет промежутки в работе рабочих мест. Возвращает словарь подходящих по длительности промежутков, идущих
-    после предыдущего шага, словарь промежутков: смен к которым они относятся, день производства.
+    после предыдущего шага, для выбранного рабочего места, само рабочее место, день производства и конец шага.
     :param pair: Объект ``Pairs``.
     :type pair: Pairs
     :param step: Объект ``Steps``.
@@ -276,8 +314,10 @@ def find_space_for_step(pair, step, prod_day, prev_step_end):
     :type prod_day: date
     :param prev_step_end: ``datetime`` конец обработки предыдущего ``step`` этой ``pair``
     :type prev_step_end: datetime | None
-    :returns: ``dict(id_machine: space)``, ``dict(space: shift)``, ``prod_day``, ``min_end``
-    :rtype: (dict, dict, date, datetime)
+    :param rng: Генератор случайных чисел для случайного выбора среди равноценных рабочих мест
+    :type rng: random.Random | None
+    :returns: ``dict(id_workplace: [space])``, ``id_workplace``, ``prod_day``, ``min_end``
+    :rtype: (dict, int, date, datetime)
     """
     # Если есть предыдущий шаг, берем работника, который его выполнил
     preferred_worker = None
@@ -289,25 +329,112 @@ def find_space_for_step(pair, step, prod_day, prev_step_end):
 
     # обход в поиске подходящий промежутков
     choosen_spaces, enough_space, prod_day = workplaces_spaces_traversing(pair, step, prod_day, prev_step_end,
-                                                                          preferred_worker=preferred_worker)
-    # choosen_spaces = {machine: [((s, e, d), shift)]}
+                                                                          preferred_worker=preferred_worker, rng=rng)
+    # choosen_spaces = {workplace: [space_tuple]}
 
     spaces_for_cal = None
     min_wp = None
     min_end = None
     if enough_space:
         # выбираем рабочее место с самым ранним временем окончания
-        for wp_id in choosen_spaces:
-            if min_end and choosen_spaces[wp_id] and choosen_spaces[wp_id][-1]["end"] < min_end:
-                min_end = choosen_spaces[wp_id][-1]["end"]
+        for wp_id, spaces in choosen_spaces.items():
+            if spaces and (min_end is None or spaces[-1].end < min_end):
+                min_end = spaces[-1].end
                 min_wp = wp_id
-            elif not min_end and choosen_spaces[wp_id]:
-                min_end = choosen_spaces[wp_id][-1]["end"]
-                min_wp = wp_id
-        spaces_for_cal = choosen_spaces
+        # в datetime переводим только промежутки выбранного рабочего места
+        spaces_for_cal = {min_wp: [_space_to_dict(space) for space in choosen_spaces[min_wp]]}
+        min_end = from_micros(min_end)
     return spaces_for_cal, min_wp, prod_day, min_end
 
 
+def _lacks_capacity(position, workplaces) -> bool:
+    """
+    Быстрая проверка перед подробным поиском: хватит ли позиции свободного времени групп оборудования
+    от левой границы ее пар до конца горизонта.
+    Первый шаг пары ставится вплотную ко второму без проверки свободного времени, поэтому в сумму спроса
+    группы он не входит, но ему, как и любому шагу, нужно хотя бы столько свободного времени группы, сколько он длится
+    :param position: Позиция, которую собираемся ставить
+    :type position: Positions
+    :param workplaces: Рабочие места
+    :type workplaces: WorkPlaces
+    :returns: ``True``, если какой-то группе оборудования заведомо не хватит свободного времени
+    :rtype: bool
+    """
+    if not position.pairs:
+        return False
+    total_demand = {}
+    max_step = {}
+    for pair in position.pairs:
+        for step in pair.steps:
+            if getattr(step, "finished", False):
+                continue
+            duration = secs_to_micros(step.duration)
+            group = step.id_group_machine
+            max_step[group] = max(max_step.get(group, 0), duration)
+            if step.step_num > 1:
+                total_demand[group] = total_demand.get(group, 0) + duration
+
+    first_date = min(pair.left_border for pair in position.pairs).date()
+    for group, duration in max_step.items():
+        capacity = workplaces.period_capacity_micros(group, first_date, workplaces.max_date())
+        if capacity is not None and capacity < max(duration, total_demand.get(group, 0)):
+            return True
+    return False
+
+
+def _reuse_previous_spaces(previous_steps, pair, step, prod_day, prev_step_end):
+    """
+    Проверяет, можно ли оставить шаг там же, где он стоял в прошлом плане: то же рабочее место группы шага,
+    начало не раньше конца предыдущего шага, прежние промежутки целиком свободны в календаре,
+    их суммарная длительность равна длительности шага, а в недельном плане шаг не требует переналадки.
+    Возвращает то же, что ``find_space_for_step``, или ``None``, если шаг нужно искать заново
+    :param previous_steps: {(``id_pair``, ``step_num``): [шаги прошлого плана по возрастанию начала]}
+    :type previous_steps: dict
+    :param pair: Объект ``Pairs``.
+    :type pair: Pairs
+    :param step: Объект ``Steps``.
+    :type step: Steps
+    :param prod_day: День, с которого искали бы промежутки
+    :type prod_day: date
+    :param prev_step_end: Конец предыдущего шага этой пары
+    :type prev_step_end: datetime | None
+    :returns: ``dict(id_workplace: [space])``, ``id_workplace``, ``prod_day``, ``min_end`` или ``None``
+    """
+    pieces = previous_steps.get((pair.id, step.step_num))
+    if not pieces:
+        return None
+    workplaces = WorkPlaces()
+    id_workplace = pieces[0].id_workplace
+    if id_workplace not in workplaces.get_workplaces(step.id_group_machine):
+        return None
+    if Serialize.is_week and len(pieces) > 1:
+        return None
+    if pieces[0].start_date < (prev_step_end or pair.left_border):
+        return None
+
+    spaces = []
+    for piece in pieces:
+        if piece.id_workplace != id_workplace or piece.start_date >= piece.end_date:
+            return None
+        start, end = to_micros(piece.start_date), to_micros(piece.end_date)
+        free_spans = workplaces.get_free_spans(id_workplace, piece.start_date.date(), piece.shift)
+        if not any(space_start <= start and end <= space_end for space_start, space_end in free_spans):
+            return None
+        spaces.append({"start": piece.start_date, "end": piece.end_date,
+                       "dur": (piece.end_date - piece.start_date).total_seconds(), "shift": piece.shift})
+    if abs(sum(space["dur"] for space in spaces) - step.duration) > 1e-3:
+        return None
+
+    if Serialize.is_week and step.color is not None:
+        prev_color = workplaces.get_nearest_color(id_workplace, pieces[0].start_date)
+        if prev_color is not None and prev_color != step.color:
+            return None
+        spaces[0].update({"changeover": 0, "color": step.color})
+
+    prod_day = max(prod_day, pieces[-1].start_date.date() - timedelta(days=1))
+    return {id_workplace: spaces}, id_workplace, prod_day, pieces[-1].end_date
+
+
 def update_position_dates(positions):
     """
     Устанавливает даты начала и конца для каждой позиции
@@ -349,62 +476,148 @@ def print_stat(positions, cnt_positions):
           f'Встало идеально - {100 - (quar_cnt + ddl_cnt) / cnt_positions * 100:.2f}%')
 
 
-def calc_pos_duration(positions):
+def _simulate_position_duration(position):
     """
-    Рассчитывает длительность каждой позиции, если вся мощьность производства будет направлена на нее
-    :param positions:
-    :param start_date:
-    :return:
+    Ставит позицию в пустой от нее календарь, чтобы узнать начало и конец ее производства,
+    и возвращает календарь в прежнее состояние
+    :param position: Копия позиции, шаги и пары которой можно менять
+    :type position: Positions
+    :return: {``start``: datetime | None, ``end``: datetime | None}
+    :rtype: dict
     """
+    dates = {'start': None, 'end': None}
+    workplaces = WorkPlaces()
+    workplaces.set_calendar_copy()
+    for pair in position.pairs:
+        main_prod_day = pair.left_border.date()
+        days_to_next_monday = (7 - main_prod_day.weekday()) % 7
+        main_prod_day += timedelta(days=days_to_next_monday)
+        new_steps = []
+        placed = False
+        prev_step_end = None
+        if not pair.steps:
+            continue
+        # Партия ставится как одна пара, длительность шагов которой умножена на количество пар, как в ``make_lot``
+        lot_size = len(pair.lot) if pair.lot else 1
+        for step in position.steps:
+            step.duration = step.original_duration * lot_size
+            spaces_for_cal, choosen_wp, prod_day, step_end = find_space_for_step(pair, step, main_prod_day,
+                                                                                 prev_step_end)
+            if spaces_for_cal:
+                prev_step_end = step_end
+                placed = True
+                workplaces.add_machine_usage(choosen_wp,
+                                             spaces_for_cal[choosen_wp],
+                                             pair.id_boots,
+                                             position.id
+                                             )
+                if not dates['start']:
+                    dates['start'] = spaces_for_cal[choosen_wp][0]['start']
+                dates['end'] = spaces_for_cal[choosen_wp][-1]['end']
+            else:
+                placed = False
+                break
+        if placed:
+            pair.steps = new_steps
+        else:
+            print(f'pos {position.id} не смогли рассчитать')
+            break
+    workplaces.calendar_rollback()
+    return dates
+
+
+# Позиции, длительность которых считают дочерние процессы. Процессы получают их вместе с календарем при fork
+_duration_positions = []
+
+
+def _simulate_positions_chunk(indices):
+    """Считает в дочернем процессе даты позиций ``_duration_positions`` с заданными номерами"""
+    return [(_duration_positions[idx].id, _simulate_position_duration(_duration_positions[idx]))
+            for idx in indices]
+
+
+def _duration_cache_key(position):
+    """
+    Возвращает хэш всего, от чего в самой позиции зависит расчет ее длительности:
+    модели, количества, шагов техкарты, границ и размеров партий пар, а также вида календаря
+    :param position: Позиция
+    :type position: Positions
+    :rtype: str
+    """
+    key = (
+        Serialize.start_date,
+        Serialize.calendar_backend,
+        position.model_name,
+        position.tie,
+        position.sole,
+        position.quantity,
+        [(step.id, step.original_duration, step.id_group_machine, step.sequence_num) for step in position.steps],
+        [(pair.left_border, bool(pair.steps), len(pair.lot) if pair.lot else 1) for pair in position.pairs],
+    )
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+def calc_pos_duration(positions, workers=None, use_cache=True, version_key=None, cached=None):
+    """
+    Рассчитывает длительность каждой позиции, если вся мощьность производства будет направлена на нее.
+    Позиции считаются независимо друг от друга на одном и том же календаре, поэтому при доступном ``fork``
+    они делятся между процессами ``ProcessPoolExecutor``, которые получают готовый календарь от родителя.
+    Посчитанные длительности сохраняются в ``PositionDurationCache`` и при тех же календарях, техкартах
+    и позиции берутся оттуда без расчета
+    :param positions: список позиций
+    :param workers: количество процессов, по умолчанию - количество ядер, 1 - считать в текущем процессе
+    :param use_cache: брать и сохранять длительности в ``PositionDurationCache``
+    :param version_key: версия кэша из ``get_duration_version_key``, прочитанная заранее вместе с остальными
+     входными данными, по умолчанию читается здесь
+    :param cached: сохраненные длительности этой версии из ``load_duration_cache``, по умолчанию читаются здесь
+    :return: {``id_position``: {``start``, ``end``, ``dur``}}
+    """
+    global _duration_positions
     SECS_AT_HOUR = 3600
     print_blue('Расчет длительности позиций')
     tmp = deepcopy(positions)
     tmp = sorted_positions(tmp)
 
-
+    if use_cache and version_key is None:
+        version_key = get_duration_version_key()
+    if cached is None:
+        cached = load_duration_cache(version_key) if use_cache else {}
+    cache_keys = {}
     pos_dates = {}
+    to_simulate = []
     for position in tmp:
         pos_dates[position.id] = {'start': None, 'end': None}
         if position.status == Serialize.get_pos_status('data') or not position.pairs or position.freeze or position.duration_h:
             continue
-        workplaces = WorkPlaces()
-        workplaces.set_calendar_copy()
-        for pair in position.pairs:
-            main_prod_day = pair.left_border.date()
-            days_to_next_monday = (7 - main_prod_day.weekday()) % 7
-            main_prod_day += timedelta(days=days_to_next_monday)
-            new_steps = []
-            placed = False
-            prev_step_end = None
-            if not pair.steps:
+        if use_cache:
+            cache_keys[position.id] = _duration_cache_key(position)
+            if cache_keys[position.id] in cached:
+                pos_dates[position.id]['dur'] = cached[cache_keys[position.id]]
                 continue
-            for step in position.steps:
-                step.duration = step.original_duration
-                spaces_for_cal, choosen_wp, prod_day, step_end = find_space_for_step(pair, step, main_prod_day,
-                                                                                     prev_step_end)
-                if spaces_for_cal:
-                    prev_step_end = step_end
-                    placed = True
-                    workplaces.add_machine_usage(choosen_wp,
-                                                 spaces_for_cal[choosen_wp],
-                                                 pair.id_boots,
-                                                 position.id
-                                                 )
-                    if not pos_dates[position.id]['start']:
-                        pos_dates[position.id]['start'] = spaces_for_cal[choosen_wp][0]['start']
-                    pos_dates[position.id]['end'] = spaces_for_cal[choosen_wp][-1]['end']
-                else:
-                    placed = False
-                    break
-            if placed:
-                pair.steps = new_steps
-            else:
-                print(f'pos {position.id} не смогли рассчитать')
-                break
-        workplaces.calendar_rollback()
+        to_simulate.append(position)
+
+    workers = min(workers or os.cpu_count() or 1, len(to_simulate))
+    if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+        _duration_positions = to_simulate
+        chunks = [range(i, len(to_simulate), workers) for i in range(workers)]
+        try:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"),
+                                     initializer=reset_forked_connections) as executor:
+                for chunk_dates in executor.map(_simulate_positions_chunk, chunks):
+                    for id_position, dates in chunk_dates:
+                        pos_dates[id_position] = dates
+        finally:
+            _duration_positions = []
+    else:
+        for position in to_simulate:
+            pos_dates[position.id] = _simulate_position_duration(position)
+
     for position in positions:
         end = pos_dates[position.id]['end']
         start = pos_dates[position.id]['start']
+        if 'dur' in pos_dates[position.id]:
+            print(f'pos {position.id} из сохраненных', pos_dates[position.id]['dur'])
+            continue
         if not end:
             if position.duration_h:
                 print(f'pos {position.id} уже подсчитан', position.duration_h)
@@ -413,117 +626,179 @@ def calc_pos_duration(positions):
             continue
         pos_dates[position.id]['dur'] = (end - start).total_seconds() / SECS_AT_HOUR
         print(f'pos {position.id}', pos_dates[position.id]['dur'])
+
+    if use_cache:
+        calculated = {cache_keys[position.id]: pos_dates[position.id]['dur'] for position in to_simulate
+                      if 'dur' in pos_dates[position.id]}
+        if calculated:
+            save_duration_cache(version_key, calculated)
     print_blue('Расчет окончен')
     return pos_dates
 
 
-def create_plan(positions):
+def place_position(position, previous_steps=None, rng=None) -> bool:
+    """
+    Ставит все пары позиции в календарь. Транзакцию календаря открывает и откатывает вызывающий:
+    если позиция не встала, в календаре остаются записи ее поставленных пар, а сами пары получают
+    исходные шаги
+    :param position: Позиция
+    :type position: Positions
+    :param previous_steps: шаги прошлого плана для теплого старта
+    :type previous_steps: dict | None
+    :param rng: генератор случайных чисел для случайного варианта расстановки
+    :type rng: random.Random | None
+    :returns: ``True``, если встали все пары позиции
+    """
+    end_of_period = Serialize.start_date + timedelta(days=90)
+    workplaces = WorkPlaces()
+    position_copy = position.get_copy()
+    for pair in position.pairs:
+        # находим датавремя для каждого из шагов в календаре, в которое можем вставить эту пару
+        prod_day = pair.left_border.date()
+        new_steps = []
+        placed = False
+        min_start = None
+        prev_step_end = None
+        for step in pair.steps:
+            if getattr(step, "finished", False):
+                continue
+            # обход в поиске дней
+            previous = None
+            if previous_steps:
+                previous = _reuse_previous_spaces(previous_steps, pair, step, prod_day, prev_step_end)
+            if previous:
+                spaces_for_cal, choosen_wp, prod_day, step_end = previous
+            else:
+                spaces_for_cal, choosen_wp, prod_day, step_end = find_space_for_step(pair, step, prod_day,
+                                                                                     prev_step_end, rng)
+            # переменная для шагов
+            if spaces_for_cal:
+                prev_step_end = step_end
+                placed = True
+                if step.step_num == 1:
+                    prev_step = step
+                    prev_wp = choosen_wp
+                    continue
+                if step.step_num == 2:
+                    prev_shift = spaces_for_cal[choosen_wp][0]['shift']
+                    prev_end = spaces_for_cal[choosen_wp][0]['start']
+                    prev_start = prev_end - timedelta(seconds=prev_step.duration)
+                    sp = [{'start': prev_start, 'end': prev_end, 'dur': prev_step.duration, 'shift': prev_shift}]
+                    workplaces.add_machine_usage(prev_wp, sp, pair.id_boots, position.id)
+                    prev_step.id_workplace = prev_wp
+                    new_steps.extend(split_step(prev_step, sp))
+
+                step.id_workplace = choosen_wp
+                separated_step = split_step(step, spaces_for_cal[choosen_wp])
+                new_steps.extend(separated_step)
+
+                """Ищем минимальную дату начала шага"""
+                if step.step_num > 1 and not min_start:
+                        min_start = spaces_for_cal[choosen_wp][0]["start"]
+
+                """Если минимальная дата шага вышла за наши 3 месяца, 
+                то ставим метку, что мы не поставили эту позицию"""
+                if pair == position.pairs[0] and min_start > end_of_period:
+                    placed = False
+                    break
+
+                workplaces.add_machine_usage(choosen_wp,
+                                             spaces_for_cal[choosen_wp],
+                                              pair.id_boots,
+                                              position.id
+                                              )
+            else:
+                placed = False
+                break
+        if placed:
+            pair.steps = new_steps
+        else:
+            # Пары, которые уже успели поставить, получают обратно исходные шаги
+            position.pairs = position_copy.pairs
+            print('\t\t -не встал', prod_day.day, prod_day.month)
+            return False
+    return True
+
+
+def _perturb_order(positions, rng, spread=3.0):
+    """
+    Случайно сдвигает позиции в отсортированном списке в среднем на ``spread / 2`` мест.
+    Замороженные позиции и позиции из сохраненного плана остаются впереди
+    """
+    keys = {position.id: idx + rng.uniform(0, spread) for idx, position in enumerate(positions)}
+    return sorted(positions, key=lambda x: (not x.freeze, not x.from_plan, keys[x.id]))
+
+
+def _plan_position(position, workplaces, previous_steps=None, rng=None):
+    """Ставит одну позицию в план и выставляет ей статус, как это делает ``create_plan`` для каждой позиции"""
+    # Позиции из сохраненного плана закрепляются так же, как замороженные, но в итогах плана считаются вставшими
+    if position.freeze or position.from_plan:
+        workplaces.freeze_position(position)
+        if position.status == Serialize.get_pos_status('data'):
+            return
+        if position.end_date > position.deadline:
+            position.status = Serialize.get_pos_status('deadline')
+        else:
+            position.status = Serialize.get_pos_status('chosen')
+            if position.from_plan:
+                Positions.count_success += 1
+        return
+    if position.status == Serialize.get_pos_status('data'):
+        print('\t\t -не встал')
+        return
+    if not position.pairs:
+        print(f'{position.id} - нет пар')
+    if _lacks_capacity(position, workplaces):
+        position.status = Serialize.get_pos_status("calendar")
+        print('\t\t -не встал, не хватает свободного времени оборудования')
+        return
+
+    workplaces.set_calendar_copy()
+    if not place_position(position, previous_steps, rng):
+        workplaces.calendar_rollback()
+        position.status = Serialize.get_pos_status("calendar")
+    workplaces.calendar_commit()
+
+    if not position.status and position.pairs[-1].steps[-1].end_date > position.deadline:
+        position.status = Serialize.get_pos_status("deadline")
+
+    if not position.status:
+        position.status = Serialize.get_pos_status("chosen")
+        Positions.count_success += 1
+
+
+def create_plan(positions, previous_steps=None, rng=None, on_placed=None):
     """
     Создает производственный план с учетом всех ограничений производства
     :param positions: список позиций
     :type positions: list[Positions]
-    :param start_date: Начало периода
-    :type start_date: datetime
+    :param previous_steps: шаги прошлого плана для теплого старта: шаг, который можно оставить на прежнем месте,
+     ставится туда без поиска
+    :type previous_steps: dict | None
+    :param rng: генератор случайных чисел для случайного варианта жадной расстановки: порядок позиций слегка
+     перемешивается, а среди равноценных рабочих мест выбирается случайное
+    :type rng: random.Random | None
+    :param on_placed: вызывается с каждой позицией, как только ее шаги окончательно зафиксированы в календаре,
+     например ``PlanStreamWriter.put``
+    :type on_placed: Callable[[Positions], None] | None
     :return:
     """
-    end_of_period = Serialize.start_date + timedelta(days=90)
-
     sort = sorted_positions
     if Serialize.is_week:
         sort = week_pos_sort
     positions = sort(positions)
+    if rng is not None:
+        positions = _perturb_order(positions, rng)
 
-    total_hours = 0.0
     cnt_positions = 0
     workplaces = WorkPlaces()
     for position in positions:
         Positions.count_prod_order += 1
         cnt_positions += 1
         print(f'position {cnt_positions}  id:{position.id}')
-        if position.freeze:
-            workplaces.freeze_position(position)
-            if position.status == Serialize.get_pos_status('data'):
-                continue
-            if position.end_date > position.deadline:
-                position.status = Serialize.get_pos_status('deadline')
-            else:
-                position.status = Serialize.get_pos_status('chosen')
-            continue
-        if position.status == Serialize.get_pos_status('data'):
-            print('\t\t -не встал')
-            continue
-        if not position.pairs:
-            print(f'{position.id} - нет пар')
-
-        position_copy = position.get_copy()
-        workplaces.set_calendar_copy()
-        for pair in position.pairs:
-            # находим датавремя для каждого из шагов в календаре, в которое можем вставить эту пару
-            prod_day = pair.left_border.date()
-            new_steps = []
-            placed = False
-            min_start = None
-            prev_step_end = None
-            for step in pair.steps:
-                if getattr(step, "finished", False):
-                    continue
-                # обход в поиске дней
-                spaces_for_cal, choosen_wp, prod_day, step_end = find_space_for_step(pair, step, prod_day,
-                                                                                     prev_step_end)
-                # переменная для шагов
-                if spaces_for_cal:
-                    prev_step_end = step_end
-                    placed = True
-                    if step.step_num == 1:
-                        prev_step = step
-                        prev_wp = choosen_wp
-                        continue
-                    if step.step_num == 2:
-                        prev_shift = spaces_for_cal[choosen_wp][0]['shift']
-                        prev_end = spaces_for_cal[choosen_wp][0]['start']
-                        prev_start = prev_end - timedelta(seconds=prev_step.duration)
-                        sp = [{'start': prev_start, 'end': prev_end, 'dur': prev_step.duration, 'shift': prev_shift}]
-                        workplaces.add_machine_usage(prev_wp, sp, pair.id_boots, position.id)
-                        prev_step.id_workplace = prev_wp
-                        new_steps.extend(split_step(prev_step, sp))
-
-                    step.id_workplace = choosen_wp
-                    separated_step = split_step(step, spaces_for_cal[choosen_wp])
-                    new_steps.extend(separated_step)
-
-                    """Ищем минимальную дату начала шага"""
-                    if step.step_num > 1 and not min_start:
-                            min_start = spaces_for_cal[choosen_wp][0]["start"]
-
-                    """Если минимальная дата шага вышла за наши 3 месяца, 
-                    то ставим метку, что мы не поставили эту позицию"""
-                    if pair == position.pairs[0] and min_start > end_of_period:
-                        placed = False
-                        break
-
-                    workplaces.add_machine_usage(choosen_wp,
-                                                 spaces_for_cal[choosen_wp],
-                                                  pair.id_boots,
-                                                  position.id
-                                                  )
-                else:
-                    placed = False
-                    break
-            if placed:
-                pair.steps = new_steps
-            else:
-                position = position_copy
-                workplaces.calendar_rollback()
-                position.status = Serialize.get_pos_status("calendar")
-                print('\t\t -не встал', prod_day.day, prod_day.month)
-                break
-
-        if not position.status and position.pairs[-1].steps[-1].end_date > position.deadline:
-            position.status = Serialize.get_pos_status("deadline")
-
-        if not position.status:
-            position.status = Serialize.get_pos_status("chosen")
-            Positions.count_success += 1
+        _plan_position(position, workplaces, previous_steps, rng)
+        if on_placed is not None:
+            on_placed(position)
     if Positions.count_prod_order:
         Positions.percent_success = int((Positions.count_success / Positions.count_prod_order) * 100)
     else:
@@ -2,7 +2,7 @@ from datetime import timedelta, datetime
 from sqlalchemy import and_
 
 from docs.classes import WorkPlaces, Steps, Positions
-from docs.database import get_table_data, TechCard, Serialize, get_table_first, OptimizeParams
+from docs.database import get_table_data, get_table_rows, TechCard, Serialize, get_table_first, OptimizeParams
 from docs.utils import print_red, copy_all_same_attrs, print_blue
 
 
@@ -59,7 +59,7 @@ def check_steps_wp(period):
     all_dates = get_weekdays_in_range(period)
     set_worker, set_machine = set(), set()
     impossible_steps = []
-    tech_cards: list[TechCard] = get_table_data(TechCard, and_(TechCard.id > 0, TechCard.id_group_machine > 0))
+    tech_cards = get_table_rows(TechCard, conditions=and_(TechCard.id > 0, TechCard.id_group_machine > 0))
     for tech_card in tech_cards:
         step = Steps()
         copy_all_same_attrs(step, tech_card)
@@ -114,7 +114,7 @@ def check_machine_and_worker_schedule(id, all_dates, object_type):
     recorded_dates = set()
     workplaces = WorkPlaces()
     calendar = workplaces.worker_calendar.calendar if object_type == 'Работник' else workplaces.machine_calendar.calendar
-    for key, value in calendar[id].items():
+    for key, value in calendar[id].template_items():
         recorded_dates.add(key[0])
         time_total = value['time_total']
         if time_total <= 0:
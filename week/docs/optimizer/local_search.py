@@ -0,0 +1,143 @@
+import time
+
+from docs.database import Serialize
+from docs.classes import WorkPlaces, Positions
+from docs.optimizer.create_prod_plan import place_position, update_position_dates, _lacks_capacity
+from docs.utils import print_blue
+
+
+def plan_score(positions) -> tuple[int, int, float]:
+    """
+    Оценка плана для сравнения вариантов: больше вставших в срок позиций, затем больше вставших вообще,
+    затем меньше суммарное опоздание в часах
+    :param positions: Список позиций после ``create_plan``
+    :type positions: list[Positions]
+    """
+    chosen = Serialize.get_pos_status("chosen")
+    deadline = Serialize.get_pos_status("deadline")
+    on_time = sum(1 for position in positions if position.status == chosen)
+    late = [position for position in positions if position.status == deadline]
+    lateness = sum((position.end_date - position.deadline).total_seconds() / 3600 for position in late
+                   if position.end_date and position.deadline)
+    return on_time, on_time + len(late), -lateness
+
+
+def _machine_groups(position) -> set:
+    """Возвращает группы машин, на которых стоят шаги позиции"""
+    return {step.id_group_machine for step in position.steps}
+
+
+def _victims(target, positions, limit):
+    """
+    Подбирает позиции, которые можно подвинуть ради ``target``: вставшие в срок, не закрепленные,
+    стоящие на тех же группах машин внутри окна ``target`` от левой границы до срока.
+    Первыми идут позиции с наибольшим запасом до своего срока
+    """
+    chosen = Serialize.get_pos_status("chosen")
+    groups = _machine_groups(target)
+    window_end = target.deadline or target.right_border
+    victims = []
+    for position in positions:
+        if position is target or position.status != chosen or position.freeze or position.from_plan:
+            continue
+        if not position.end_date or not position.deadline or position.deadline <= position.end_date:
+            continue
+        if position.start_date > window_end or position.end_date < target.left_border:
+            continue
+        if groups.isdisjoint(_machine_groups(position)):
+            continue
+        victims.append(position)
+    victims.sort(key=lambda x: x.deadline - x.end_date, reverse=True)
+    return victims[:limit]
+
+
+def _replace(positions):
+    """
+    Снимает позиции с расстановки и ставит заново в заданном порядке. Календарь меняется внутри уже открытой
+    транзакции, поэтому при неудаче вызывающий откатывает все разом
+    """
+    workplaces = WorkPlaces()
+    for position in positions:
+        workplaces.release_position(position)
+        position.reset_pairs()
+    for position in positions:
+        if _lacks_capacity(position, workplaces) or not place_position(position):
+            position.status = Serialize.get_pos_status("calendar")
+            continue
+        update_position_dates([position])
+        if position.end_date > position.deadline:
+            position.status = Serialize.get_pos_status("deadline")
+        else:
+            position.status = Serialize.get_pos_status("chosen")
+
+
+def _try_move(target, victim) -> bool:
+    """
+    Пробует поставить ``target`` раньше ``victim``: обе позиции снимаются и ставятся заново в обратном порядке.
+    Ход оценивается только по этим двум позициям, а откатывается по журналу отмены календаря,
+    поэтому остальной план не пересчитывается
+    :returns: ``True``, если ход улучшил план и принят
+    """
+    moved = (target, victim)
+    before = plan_score(moved)
+    # Шаги пар меняются на месте, поэтому сохраняем и список пар, и шаги каждой пары
+    saved = [(position.pairs, [pair.steps for pair in position.pairs], position.status, position.start_date,
+              position.end_date) for position in moved]
+
+    workplaces = WorkPlaces()
+    workplaces.set_calendar_copy()
+    _replace(moved)
+    if plan_score(moved) > before:
+        workplaces.calendar_commit()
+        return True
+
+    workplaces.calendar_rollback()
+    for position, (pairs, steps, status, start_date, end_date) in zip(moved, saved):
+        for pair, pair_steps in zip(pairs, steps):
+            pair.steps = pair_steps
+        position.pairs, position.status, position.start_date, position.end_date = pairs, status, start_date, end_date
+    return False
+
+
+def improve_plan(positions, time_budget, candidates=5):
+    """
+    Улучшает готовый план локальным поиском: для каждой позиции, вставшей с опозданием или не вставшей,
+    перебирает до ``candidates`` вставших в срок позиций на тех же группах машин и пробует поставить
+    опаздывающую позицию раньше. Ход принимается, если по двум затронутым позициям ``plan_score`` вырос.
+    Поиск останавливается через ``time_budget`` секунд.
+    Улучшается только трехмесячный план: в недельном переставленная позиция меняет цвет предыдущего шага
+    и переналадки у всех позиций, стоящих после нее на тех же машинах, а ход оценивается только по двум позициям
+    :param positions: список позиций после ``create_plan``
+    :type positions: list[Positions]
+    :param time_budget: ограничение времени в секундах
+    :type time_budget: float
+    :param candidates: сколько позиций пробовать подвинуть ради одной опаздывающей
+    :type candidates: int
+    :rtype: None
+    """
+    if Serialize.is_week:
+        return
+    deadline_end = time.monotonic() + time_budget
+    late = (Serialize.get_pos_status("deadline"), Serialize.get_pos_status("calendar"))
+    chosen = Serialize.get_pos_status("chosen")
+    targets = [position for position in positions
+               if position.status in late and position.pairs and not position.freeze and not position.from_plan]
+    targets.sort(key=lambda x: x.right_border)
+
+    before = plan_score(positions)
+    on_time = sum(1 for position in positions if position.status == chosen)
+    moves = 0
+    for target in targets:
+        if time.monotonic() >= deadline_end:
+            break
+        for victim in _victims(target, positions, candidates):
+            if time.monotonic() >= deadline_end:
+                break
+            if _try_move(target, victim):
+                moves += 1
+                break
+
+    Positions.count_success += sum(1 for position in positions if position.status == chosen) - on_time
+    if Positions.count_prod_order:
+        Positions.percent_success = int((Positions.count_success / Positions.count_prod_order) * 100)
+    print_blue(f'Улучшение плана: принято ходов {moves}, {before} -> {plan_score(positions)}')
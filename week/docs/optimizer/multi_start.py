@@ -0,0 +1,123 @@
+import contextlib
+import io
+import multiprocessing
+import os
+import time
+from random import Random
+
+from docs.classes import Positions, WorkPlaces
+from docs.database import reset_forked_connections, Serialize
+from docs.optimizer.create_prod_plan import create_plan
+from docs.optimizer.local_search import improve_plan, plan_score
+from docs.utils import print_blue
+
+
+# Позиции, шаги прошлого плана и время на улучшение, которые дочерние процессы получают вместе с календарем при fork
+_variant_positions = []
+_variant_previous_steps = None
+_variant_improve_budget = None
+
+
+def _run_variant(seed):
+    """
+    Строит в дочернем процессе один вариант плана на унаследованном от родителя календаре.
+    Вариант с ``seed`` = 0 - обычная детерминированная расстановка.
+    Вывод варианта копится в буфере и возвращается вместе с результатом, чтобы родитель напечатал вывод лучшего
+    """
+    rng = Random(seed) if seed else None
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        create_plan(_variant_positions, _variant_previous_steps, rng)
+        if _variant_improve_budget:
+            improve_plan(_variant_positions, _variant_improve_budget)
+    totals = (Positions.count_success, Positions.percent_success, Positions.count_prod_order)
+    return seed, plan_score(_variant_positions), _variant_positions, totals, log.getvalue()
+
+
+def _apply_best_variant(positions):
+    """
+    Повторяет в календаре родителя записи лучшего варианта: варианты строятся в дочерних процессах,
+    и без этого календарь родителя остался бы в состоянии до расстановки. Замороженные позиции и позиции
+    из сохраненного плана закрепляются, как в ``create_plan``, шаги остальных вставших позиций записываются
+    теми же промежутками, что и при расстановке. Переналадки недельного плана в шагах не хранятся,
+    поэтому в календарь не попадают
+    :param positions: позиции лучшего варианта
+    :type positions: list[Positions]
+    :rtype: None
+    """
+    workplaces = WorkPlaces()
+    placed = (Serialize.get_pos_status("chosen"), Serialize.get_pos_status("deadline"))
+    for position in sorted(positions, key=lambda x: (not x.freeze, not x.from_plan)):
+        if position.freeze or position.from_plan:
+            workplaces.freeze_position(position)
+        elif position.status in placed:
+            for pair in position.pairs:
+                for step in pair.steps:
+                    space = {'start': step.start_date, 'end': step.end_date, 'shift': step.shift, 'color': step.color}
+                    workplaces.add_machine_usage(step.id_workplace, [space], pair.id_boots, position.id)
+
+
+def create_plan_multi_start(positions, starts, time_budget=None, previous_steps=None, workers=None,
+                            improve_budget=None, writer=None):
+    """
+    Строит ``starts`` вариантов жадной расстановки в отдельных процессах, каждый на своей копии календаря,
+    и оставляет лучший по ``plan_score``. Нулевой вариант - обычный ``create_plan``, остальные - со слегка
+    перемешанным порядком позиций и случайным выбором среди равноценных рабочих мест.
+    Варианты, не успевшие за ``time_budget`` секунд, отбрасываются, но хотя бы один вариант дожидается.
+    Без ``fork`` строится только обычный вариант в текущем процессе.
+    После выбора печатается вывод лучшего варианта, а его шаги закрепляются в календаре текущего процесса
+    :param positions: список позиций, после вызова в нем лежат позиции лучшего варианта
+    :type positions: list[Positions]
+    :param starts: количество вариантов
+    :type starts: int
+    :param time_budget: ограничение времени на все варианты в секундах
+    :type time_budget: float | None
+    :param previous_steps: шаги прошлого плана для теплого старта
+    :type previous_steps: dict | None
+    :param workers: количество процессов, по умолчанию - количество ядер
+    :type workers: int | None
+    :param improve_budget: секунд на улучшение каждого варианта локальным поиском ``improve_plan``
+    :type improve_budget: float | None
+    :param writer: потоковая запись плана в БД по ходу расстановки. Используется только при одном варианте
+     без улучшения: в остальных случаях окончательные шаги известны лишь в конце и план сохраняется обычным способом
+    :type writer: PlanStreamWriter | None
+    :rtype: None
+    """
+    global _variant_positions, _variant_previous_steps, _variant_improve_budget
+    if starts <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        if improve_budget:
+            create_plan(positions, previous_steps)
+            improve_plan(positions, improve_budget)
+        else:
+            create_plan(positions, previous_steps, on_placed=writer.put if writer is not None else None)
+        return
+
+    print_blue(f'Расстановка {starts} вариантов')
+    deadline = time.monotonic() + time_budget if time_budget else None
+    _variant_positions, _variant_previous_steps, _variant_improve_budget = positions, previous_steps, improve_budget
+    pool = multiprocessing.get_context("fork").Pool(min(workers or os.cpu_count() or 1, starts),
+                                                    initializer=reset_forked_connections)
+    try:
+        pending = [pool.apply_async(_run_variant, (seed,)) for seed in range(starts)]
+        results = []
+        while pending:
+            # Пока нет ни одного варианта, ждем обычный вариант без ограничения времени
+            timeout = None if deadline is None or not results else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+            pending[0].wait(timeout)
+            ready = [result for result in pending if result.ready()]
+            results.extend(result.get() for result in ready)
+            pending = [result for result in pending if result not in ready]
+    finally:
+        pool.terminate()
+        pool.join()
+        _variant_positions, _variant_previous_steps, _variant_improve_budget = [], None, None
+
+    seed, score, best_positions, totals, log = max(results, key=lambda result: (result[1], -result[0]))
+    print(log, end="")
+    print_blue(f'Построено вариантов: {len(results)}, лучший - {seed}: {score}')
+    _apply_best_variant(best_positions)
+    positions[:] = best_positions
+    Positions.positions = positions
+    Positions.count_success, Positions.percent_success, Positions.count_prod_order = totals
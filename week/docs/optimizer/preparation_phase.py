@@ -1,8 +1,10 @@
+from collections import defaultdict
+
 from sqlalchemy import and_
 
-from docs.classes import Positions
+from docs.classes import Positions, WorkPlaces
 from docs.classes.steps_class import Steps
-from docs.database import get_table_data, PairsSteps, PairsStepsWeek, Serialize
+from docs.database import get_table_data, PairsSteps, PairsStepsWeek, PositionsOutput, PositionsOutputWeek, Serialize
 
 
 def set_frozen_data(positions, plan_id):
@@ -51,3 +53,120 @@ def set_frozen_data(positions, plan_id):
         for pair in frozen_positions[position_id].pairs:
             pair.steps = sorted(pair.steps, key=lambda x: x.step_num)
         frozen_positions[position_id].calc_start_end()
+
+
+def _planned_pairs(position, pairs_steps):
+    """
+    Собирает пары позиции из шагов сохраненного плана. Шаги проверяются по текущим календарям так же,
+    как при теплом старте: рабочее место существует, шаг лежит в горизонте планирования и его промежуток
+    целиком свободен - после аварии или правки календаря позицию нужно ставить заново
+    :param position: позиция
+    :type position: Positions
+    :param pairs_steps: {``id_pair``: [``PairsSteps``]} сохраненного плана этой позиции
+    :type pairs_steps: dict
+    :return: список пар или ``None``, если план позиции не совпадает с ее текущими парами и шагами
+     или больше не помещается в календари
+    """
+    workplaces = WorkPlaces()
+    pairs = []
+    for pair in position.pairs:
+        lot_size = len(pair.lot or [pair.id])
+        templates = {step.step_num: step for step in pair.steps if not step.finished}
+        for id_pair in pair.lot or [pair.id]:
+            planned_duration = defaultdict(float)
+            steps = []
+            for db_step in sorted(pairs_steps.get(id_pair, []), key=lambda x: (x.step_num, x.start_date)):
+                template = templates.get(db_step.step_num)
+                if template is None or db_step.start_date is None or db_step.start_date < pair.left_border:
+                    return None
+                step = template.get_deepcopy()
+                step.id_workplace = db_step.id_workplace
+                step.start_date = db_step.start_date
+                step.end_date = db_step.end_date
+                step.shift = db_step.shift
+                step.duration = (step.end_date - step.start_date).total_seconds()
+                if step.id_workplace not in workplaces.workplaces:
+                    return None
+                # Первый шаг пары ставится вплотную ко второму без проверки свободного времени, как в create_plan
+                if step.step_num > 1 and (step.start_date < Serialize.start_date
+                                          or step.end_date.date() > workplaces.max_date()
+                                          or not workplaces.is_free_for_step(step)):
+                    return None
+                planned_duration[step.step_num] += step.duration
+                steps.append(step)
+            if planned_duration.keys() != templates.keys():
+                return None
+            for step_num, template in templates.items():
+                if abs(planned_duration[step_num] - template.duration / lot_size) > 1:
+                    return None
+            for step in steps:
+                step.splited = len([x for x in steps if x.step_num == step.step_num]) > 1
+
+            planned_pair = pair.get_copy()
+            planned_pair.id = id_pair
+            planned_pair.lot = None
+            planned_pair.steps = steps
+            planned_pair.set_pair_id()
+            pairs.append(planned_pair)
+    if {pair.id for pair in pairs} != pairs_steps.keys():
+        return None
+    return pairs
+
+
+def set_planned_data(positions, plan_id):
+    """
+    Для инкрементального пересчета: позиции, которые уже встали в сохраненный план и с тех пор не изменились,
+    получают пары и шаги из плана и помечаются ``from_plan`` - в ``create_plan`` они закрепляются в календаре
+    как замороженные. Заново ставить нужно новые, измененные и не вставшие позиции, а также позиции,
+    шаги которых больше не помещаются на прежние места в текущих календарях
+    :param positions: список позиций
+    :type positions: list[Positions]
+    :param plan_id: номер сохраненного плана, в который потом пишется результат
+    :type plan_id: int
+    :return: позиции, которые нужно ставить заново
+    :rtype: list[Positions]
+    """
+    steps_cls, output_cls = PairsSteps, PositionsOutput
+    if Serialize.is_week:
+        steps_cls, output_cls = PairsStepsWeek, PositionsOutputWeek
+    placed_statuses = (Serialize.get_pos_status("chosen"), Serialize.get_pos_status("deadline"))
+    placed_ids = {output.prod_position_id for output in get_table_data(output_cls, output_cls.plan_id == plan_id)
+                  if output.status in placed_statuses}
+
+    candidates = [position for position in positions if position.id in placed_ids and not position.freeze
+                  and position.status != Serialize.get_pos_status("data") and position.pairs]
+    steps_pairs = defaultdict(lambda: defaultdict(list))
+    if candidates:
+        filter_by = and_(steps_cls.id_position.in_([position.id for position in candidates]),
+                         steps_cls.plan_id == plan_id)
+        for db_step in get_table_data(steps_cls, filter_by):
+            steps_pairs[db_step.id_position][db_step.id_pair].append(db_step)
+
+    for position in candidates:
+        pairs = _planned_pairs(position, steps_pairs[position.id])
+        if pairs is None:
+            continue
+        position.pairs = pairs
+        position.from_plan = True
+        position.calc_start_end()
+
+    return [position for position in positions if not position.freeze and not position.from_plan]
+
+
+def get_previous_steps(plan_id):
+    """
+    Выгружает шаги сохраненного плана для теплого старта
+    :param plan_id: номер сохраненного плана, обычно ``get_last_plan_id``
+    :type plan_id: int
+    :return: {(``id_pair``, ``step_num``): [``PairsSteps``] по возрастанию начала}
+    :rtype: dict
+    """
+    cls = PairsSteps
+    if Serialize.is_week:
+        cls = PairsStepsWeek
+    previous_steps = defaultdict(list)
+    for db_step in get_table_data(cls, and_(cls.plan_id == plan_id, cls.start_date != None, cls.end_date != None)):
+        previous_steps[db_step.id_pair, db_step.step_num].append(db_step)
+    for pieces in previous_steps.values():
+        pieces.sort(key=lambda x: x.start_date)
+    return dict(previous_steps)
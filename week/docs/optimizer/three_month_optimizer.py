@@ -1,9 +1,12 @@
+from contextlib import nullcontext
 from datetime import datetime
 
-from docs.optimizer import create_plan, calc_pos_duration
-from docs.database import OptimizeParams, save_positions_pairs, get_table_first, send_duration_to_prod_orders
-from docs.optimizer.preparation_phase import set_frozen_data
+from docs.optimizer import calc_pos_duration
+from docs.database import OptimizeParams, save_positions_pairs, get_table_first, send_duration_to_prod_orders, \
+    input_snapshot, get_last_plan_id, PlanStreamWriter, get_duration_version_key, load_duration_cache
+from docs.optimizer.preparation_phase import set_frozen_data, set_planned_data, get_previous_steps
 from docs.optimizer.data_verification import check_impossible_position
+from docs.optimizer.multi_start import create_plan_multi_start
 from docs.classes import WorkPlaces, Positions
 
 
@@ -17,20 +20,55 @@ from docs.classes import WorkPlaces, Positions
 #     positions.extend(new)
 
 
-def three_month_start(plan_id: int = 0):
+def three_month_start(plan_id: int = 0, incremental: bool = False, warm_start: bool = False):
+    """
+    Строит трехмесячный план.
+    При ``incremental`` позиции, которые уже стоят в сохраненном плане и не изменились, закрепляются в календаре
+    как есть, ставятся только новые, измененные и не вставшие позиции, и в БД перезаписываются только их строки.
+    При ``warm_start`` каждый шаг сначала пробуется на месте из сохраненного плана и ищется заново,
+    только если это место больше не подходит.
+    При ``multi_start`` в параметрах строится несколько случайных вариантов расстановки и сохраняется лучший,
+    при ``improve_budget`` план после расстановки улучшается локальным поиском.
+    При одном варианте без улучшения шаги пишутся в БД фоновым потоком по ходу расстановки и публикуются
+    одним коммитом в конце, иначе план сохраняется целиком после расстановки
+    """
     t1 = datetime.now()
-    workplaces = WorkPlaces()
-    workplaces.reset_calendar()
-    optimize_params = get_table_first(OptimizeParams, conditions=OptimizeParams.id == 1)
-    positions = Positions.get_positions(optimize_params, plan_id)
-    set_frozen_data(positions, plan_id)
-    check_impossible_position(positions)
+    # Все входные данные читаются из одного согласованного снимка БД
+    with input_snapshot():
+        workplaces = WorkPlaces()
+        workplaces.reset_calendar()
+        optimize_params = get_table_first(OptimizeParams, conditions=OptimizeParams.id == 1)
+        positions = Positions.get_positions(optimize_params, plan_id)
+        set_frozen_data(positions, plan_id)
+        check_impossible_position(positions)
+        # Сохраненный план для инкрементального пересчета и теплого старта читается из того же плана,
+        # в который потом пишется результат
+        output_plan_id = get_last_plan_id()
+        to_save = positions
+        if incremental:
+            to_save = set_planned_data(positions, output_plan_id)
+            print(f'Позиций к перестановке: {len(to_save)} из {len(positions)}')
+        previous_steps = get_previous_steps(output_plan_id) if warm_start else None
+        # Кэш длительностей читается здесь же, а считаются и сохраняются длительности уже после снимка
+        duration_version_key = get_duration_version_key()
+        cached_durations = load_duration_cache(duration_version_key)
     #extend_pos_n_time(positions, 10)
-    pos_dates = calc_pos_duration(positions)
+    pos_dates = calc_pos_duration(positions, version_key=duration_version_key, cached=cached_durations)
     Positions.set_duration(pos_dates)
     send_duration_to_prod_orders(positions)
-    create_plan(positions)
-    save_positions_pairs(positions, Positions)
+    to_save_ids = {position.id for position in to_save}
+    # Строки закрепленных позиций остаются в плане, строки исчезнувших из портфеля позиций удаляются
+    keep_ids = {position.id for position in positions} - to_save_ids if incremental else None
+    starts = optimize_params.multi_start or 1
+    # Окончательные шаги по ходу расстановки известны только при одном варианте без улучшения
+    streaming = starts <= 1 and not optimize_params.improve_budget
+    with PlanStreamWriter(output_plan_id, keep_ids) if streaming else nullcontext() as writer:
+        create_plan_multi_start(positions, starts, optimize_params.time_budget,
+                                previous_steps, improve_budget=optimize_params.improve_budget, writer=writer)
+        if incremental:
+            # лучший вариант приходит новыми объектами позиций
+            to_save = [position for position in positions if position.id in to_save_ids]
+        save_positions_pairs(to_save, Positions, keep_ids, writer=writer)
     t2 = datetime.now()
     print(f'{(t2-t1).total_seconds():.2f} секунд')
 
@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 
-from docs.database import get_table_data, ThreeMonthPositions, Serialize
+from sqlalchemy import and_
+
+from docs.database import get_table_rows, ThreeMonthPositions, Serialize
 
 
 #TODO не запутаться в шагах из Steps и шагах из Techcard
@@ -17,9 +19,10 @@ from docs.database import get_table_data, ThreeMonthPositions, Serialize
 # а в недельном мы шаги не дробим
 
 def get_period_positions_ids(plan_id, period=7):
-    positions = get_table_data(ThreeMonthPositions, conditions=ThreeMonthPositions.plan_id == plan_id and
-                                                               ThreeMonthPositions.start_date >= Serialize.start_date and
-                                                               ThreeMonthPositions.start_date <= Serialize.start_date + timedelta(days=period))
+    positions = get_table_rows(ThreeMonthPositions, (ThreeMonthPositions.id,),
+                               and_(ThreeMonthPositions.plan_id == plan_id,
+                                    ThreeMonthPositions.start_date >= Serialize.start_date,
+                                    ThreeMonthPositions.start_date <= Serialize.start_date + timedelta(days=period)))
 
     return [pos.id for pos in positions]
 
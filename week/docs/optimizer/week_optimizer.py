@@ -1,23 +1,35 @@
 from datetime import datetime
 
-from docs.optimizer import create_plan
-from docs.database import OptimizeParamsWeek, save_positions_pairs, get_table_first, save_daily_shift_quota_to_db
-from docs.optimizer.preparation_phase import set_frozen_data
+from docs.database import OptimizeParamsWeek, save_positions_pairs, get_table_first, save_daily_shift_quota_to_db, \
+    input_snapshot, get_last_plan_id
+from docs.optimizer.preparation_phase import set_frozen_data, get_previous_steps
 from docs.optimizer.data_verification import check_impossible_position
 from docs.optimizer.week_funcs import get_period_positions_ids
+from docs.optimizer.multi_start import create_plan_multi_start
 from docs.classes import WorkPlaces, Positions
 
 
-def week_start(plan_id: int = 0):
+def week_start(plan_id: int = 0, warm_start: bool = False):
+    """
+    Строит недельный план.
+    При ``warm_start`` каждый шаг сначала пробуется на месте из сохраненного недельного плана
+    и ищется заново, только если это место больше не подходит.
+    При ``multi_start`` в параметрах строится несколько случайных вариантов расстановки и сохраняется лучший.
+    Локальный поиск ``improve_plan`` недельный план не улучшает, поэтому ``improve_budget`` здесь не используется
+    """
     t1 = datetime.now()
-    workplaces = WorkPlaces()
-    workplaces.reset_calendar()
-    optimize_params = get_table_first(OptimizeParamsWeek, conditions=OptimizeParamsWeek.id == 1)
-    week_ids = get_period_positions_ids(plan_id)
-    positions = Positions.get_positions(optimize_params, plan_id, week_ids)
-    set_frozen_data(positions, plan_id)
-    check_impossible_position(positions)
-    create_plan(positions)
+    # Все входные данные читаются из одного согласованного снимка БД
+    with input_snapshot():
+        workplaces = WorkPlaces()
+        workplaces.reset_calendar()
+        optimize_params = get_table_first(OptimizeParamsWeek, conditions=OptimizeParamsWeek.id == 1)
+        week_ids = get_period_positions_ids(plan_id)
+        positions = Positions.get_positions(optimize_params, plan_id, week_ids)
+        set_frozen_data(positions, plan_id)
+        check_impossible_position(positions)
+        # Как и у трехмесячного плана, теплый старт идет от последнего сохраненного плана
+        previous_steps = get_previous_steps(get_last_plan_id()) if warm_start else None
+    create_plan_multi_start(positions, optimize_params.multi_start or 1, optimize_params.time_budget, previous_steps)
     daily_list = Positions.get_daily_shift_quota()
     save_daily_shift_quota_to_db(daily_list)
     #workplaces.print_changeovers()
@@ -0,0 +1,115 @@
+"""
+Сравнение скорости внутреннего цикла поиска промежутков для шага:
+время в ``datetime`` и промежутки-словари против целых микросекунд и кортежей.
+Запуск: ``python bench_time_engine.py``, подключение к базе не нужно
+"""
+from datetime import datetime, timedelta
+from random import Random
+from timeit import timeit
+
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+SHIFTS = 2000
+USAGES_PER_SHIFT = 12
+STEP_DURATION = 1500.0
+
+
+def make_shifts(seed: int = 1) -> list[list[tuple[datetime, datetime]]]:
+    """Строит свободные промежутки смен машины и работника со случайными занятыми участками"""
+    rnd = Random(seed)
+    day = datetime(2024, 11, 4, 8)
+    shifts = []
+    for _ in range(SHIFTS):
+        moments = sorted(rnd.sample(range(0, 8 * 3600), USAGES_PER_SHIFT * 2))
+        shifts.append([(day + timedelta(seconds=moments[i]), day + timedelta(seconds=moments[i + 1]))
+                       for i in range(0, len(moments), 2)])
+        day += timedelta(days=1)
+    return shifts
+
+
+def scan_datetime(machine, worker, prev_end):
+    """Прежнее представление: пересечение в ``datetime``, словари промежутков, ``total_seconds``"""
+    spaces = []
+    m_idx = w_idx = 0
+    while m_idx < len(machine) and w_idx < len(worker):
+        start = max(machine[m_idx][0], worker[w_idx][0])
+        end = min(machine[m_idx][1], worker[w_idx][1])
+        if start < end:
+            spaces.append({"start": start, "end": end, "dur": (end - start).total_seconds()})
+        if machine[m_idx][1] < worker[w_idx][1]:
+            m_idx += 1
+        else:
+            w_idx += 1
+    total = 0
+    chosen = []
+    for space in spaces:
+        if not prev_end < space["end"]:
+            continue
+        start = max(prev_end, space["start"])
+        duration = (space["end"] - start).total_seconds()
+        total += duration
+        chosen.append({"start": start, "end": space["end"], "dur": duration, "shift": 1})
+        if total >= STEP_DURATION:
+            chosen[-1]["end"] = start + timedelta(seconds=duration - (total - STEP_DURATION))
+            return chosen
+    return None
+
+
+def scan_micros(machine, worker, prev_end):
+    """Новое представление: пересечение в целых микросекундах, промежутки - кортежи"""
+    spaces = []
+    m_idx = w_idx = 0
+    while m_idx < len(machine) and w_idx < len(worker):
+        m_start, m_end = machine[m_idx]
+        w_start, w_end = worker[w_idx]
+        start = m_start if m_start > w_start else w_start
+        end = m_end if m_end < w_end else w_end
+        if start < end:
+            spaces.append((start, end))
+        if m_end < w_end:
+            m_idx += 1
+        else:
+            w_idx += 1
+    total = 0
+    chosen = []
+    for space_start, space_end in spaces:
+        if prev_end >= space_end:
+            continue
+        start = prev_end if prev_end > space_start else space_start
+        duration = (space_end - start) / 10 ** 6
+        total += duration
+        chosen.append((start, space_end, duration, 1))
+        if total >= STEP_DURATION:
+            end = start + timedelta(seconds=duration - (total - STEP_DURATION)) // MICROSECOND
+            chosen[-1] = (start, end, chosen[-1][2], 1)
+            return chosen
+    return None
+
+
+def main():
+    machine_shifts, worker_shifts = make_shifts(1), make_shifts(2)
+    to_micros = lambda moment: (moment - EPOCH) // MICROSECOND
+    machine_micros = [[(to_micros(s), to_micros(e)) for s, e in shift] for shift in machine_shifts]
+    worker_micros = [[(to_micros(s), to_micros(e)) for s, e in shift] for shift in worker_shifts]
+    prev_end = [shift[0][0] + timedelta(minutes=30) for shift in machine_shifts]
+    prev_end_micros = [to_micros(moment) for moment in prev_end]
+
+    def run_datetime():
+        for i in range(SHIFTS):
+            scan_datetime(machine_shifts[i], worker_shifts[i], prev_end[i])
+
+    def run_micros():
+        for i in range(SHIFTS):
+            scan_micros(machine_micros[i], worker_micros[i], prev_end_micros[i])
+
+    number = 20
+    datetime_time = timeit(run_datetime, number=number)
+    micros_time = timeit(run_micros, number=number)
+    print(f"datetime: {datetime_time / number * 1000:.2f} мс на {SHIFTS} смен")
+    print(f"micros:   {micros_time / number * 1000:.2f} мс на {SHIFTS} смен")
+    print(f"ускорение: {datetime_time / micros_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
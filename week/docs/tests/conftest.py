@@ -0,0 +1,71 @@
+from collections import defaultdict
+from datetime import datetime, date, time
+from types import SimpleNamespace
+
+import pytest
+
+from docs.classes import MachineCalendar, WorkPlaces
+from docs.classes.workers_class import WorkersCalendar
+from docs.classes import workplace_class
+from docs.classes.machine_groups_class import machine_groups
+from docs.classes.calendar_base_class import CalendarBase
+from docs.classes.lazy_calendar import LazyCalendar
+from docs.classes.usage_store import UsageStore
+from docs.database import Serialize
+
+
+@pytest.fixture
+def machine_calendar(request, monkeypatch):
+    """
+    Календарь оборудования с одной машиной 1 и одной сменой 01.11.2024 с 09:00 до 18:00.
+    Параметр фикстуры - ``Serialize.calendar_backend``, по умолчанию ``dict``
+    """
+    monkeypatch.setattr(Serialize, "calendar_backend", getattr(request, "param", "dict"))
+    monkeypatch.setattr(Serialize, "start_date", datetime(2024, 11, 1))
+    calendar = MachineCalendar()
+    template = {(date(2024, 11, 1), 1): CalendarBase._shift_data(datetime(2024, 11, 1, 9),
+                                                                datetime(2024, 11, 1, 18))}
+    calendar.calendar = {1: LazyCalendar(template, None)}
+    calendar.undo_log = None
+    calendar.changed_shifts = set()
+    calendar.color_timeline = defaultdict(UsageStore)
+    return calendar
+
+
+def shift_calendar(shifts):
+    """Календарь одного объекта из {(``дата``, ``смена``): (``начало``, ``конец``)}"""
+    return LazyCalendar({key: CalendarBase._shift_data(start, end) for key, (start, end) in shifts.items()}, None)
+
+
+@pytest.fixture
+def workplaces(machine_calendar, monkeypatch):
+    """
+    Рабочие места группы оборудования 1 без БД: место 1 - машина 1 и работник 1, место 2 - машина 2 и работник 2,
+    место 3 - машина 2 и работник 1. Машины работают 01.11 и 02.11.2024 с 09:00 до 18:00,
+    работники - в первую смену с 09:00 до 13:00 и во вторую с 14:00 до 18:00. Режим - трехмесячный оптимизатор
+    """
+    monkeypatch.setattr(Serialize, "command", "three_month")
+    days = (date(2024, 11, 1), date(2024, 11, 2))
+    machine_calendar.calendar = {
+        id_machine: shift_calendar({(day, 1): (datetime.combine(day, time(9)), datetime.combine(day, time(18)))
+                                    for day in days})
+        for id_machine in (1, 2)}
+    monkeypatch.setattr(machine_calendar, "max_date", datetime(2024, 11, 2))
+
+    worker_calendar = WorkersCalendar()
+    worker_shifts = {}
+    for day in days:
+        worker_shifts[day, 1] = (datetime.combine(day, time(9)), datetime.combine(day, time(13)))
+        worker_shifts[day, 2] = (datetime.combine(day, time(14)), datetime.combine(day, time(18)))
+    monkeypatch.setattr(worker_calendar, "calendar", {id_worker: shift_calendar(worker_shifts) for id_worker in (1, 2)})
+    monkeypatch.setattr(worker_calendar, "undo_log", None)
+    monkeypatch.setattr(worker_calendar, "changed_shifts", set())
+
+    rows = [SimpleNamespace(id=1, machine_id=1, worker_id=1),
+            SimpleNamespace(id=2, machine_id=2, worker_id=2),
+            SimpleNamespace(id=3, machine_id=2, worker_id=1)]
+    monkeypatch.setattr(workplace_class, "get_table_data", lambda *args, **kwargs: rows)
+    monkeypatch.setattr(machine_groups, "machine_groups", {1: [1, 2]})
+    monkeypatch.setattr(machine_groups, "machines", {1: [1], 2: [1]})
+    monkeypatch.setattr(WorkPlaces, "_instance", None)
+    return WorkPlaces()
@@ -0,0 +1,88 @@
+from datetime import datetime, date
+
+import pytest
+
+
+def shift_state(calendar):
+    """Все, что транзакция должна вернуть смене 01.11.2024 машины 1"""
+    return (list(calendar.get_machine_usage(1, date(2024, 11, 1), 1)),
+            calendar.get_free_time(1, date(2024, 11, 1), 1),
+            calendar.get_time_usage(1, date(2024, 11, 1), 1),
+            calendar.get_version(1, date(2024, 11, 1), 1),
+            calendar.get_free_micros(1, date(2024, 11, 1), 1),
+            list(calendar.color_timeline[1]))
+
+
+def add_usage(calendar, start_hour, end_hour, id_position, color):
+    calendar.add_machine_usage(1, date(2024, 11, 1), 1, (datetime(2024, 11, 1, start_hour),
+                                                         datetime(2024, 11, 1, end_hour), None, id_position, color))
+
+
+@pytest.fixture
+def filled_calendar(machine_calendar):
+    """Смена с использованиями позиций 7 и 8 вперемешку"""
+    add_usage(machine_calendar, 9, 10, 7, "red")
+    add_usage(machine_calendar, 11, 12, 8, "blue")
+    add_usage(machine_calendar, 13, 14, 7, "red")
+    return machine_calendar
+
+
+@pytest.mark.parametrize('machine_calendar', ['dict', 'bitmap'], indirect=True)
+def test_rollback_inserts(filled_calendar):
+    before = shift_state(filled_calendar)
+
+    filled_calendar.begin()
+    add_usage(filled_calendar, 10, 11, 9, "green")
+    add_usage(filled_calendar, 15, 17, 9, "green")
+    filled_calendar.rollback()
+
+    assert shift_state(filled_calendar) == before
+    assert filled_calendar.undo_log is None
+
+
+def test_commit_keeps_inserts(filled_calendar):
+    filled_calendar.begin()
+    add_usage(filled_calendar, 10, 11, 9, "green")
+    filled_calendar.commit()
+    filled_calendar.rollback()
+
+    assert len(filled_calendar.get_machine_usage(1, date(2024, 11, 1), 1)) == 4
+    assert filled_calendar.get_last_color(1, datetime(2024, 11, 1, 11)) == "green"
+
+
+@pytest.mark.parametrize('machine_calendar', ['dict', 'bitmap'], indirect=True)
+def test_remove_position_usage(filled_calendar):
+    assert filled_calendar.remove_position_usage(1, date(2024, 11, 1), 1, 7)
+
+    assert [usage.position_id for usage in filled_calendar.get_machine_usage(1, date(2024, 11, 1), 1)] == [8]
+    assert filled_calendar.get_free_time(1, date(2024, 11, 1), 1) == [
+        (datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 11), 7200.0),
+        (datetime(2024, 11, 1, 12), datetime(2024, 11, 1, 18), 21600.0),
+    ]
+    assert filled_calendar.get_time_usage(1, date(2024, 11, 1), 1) == 3600.0
+    assert filled_calendar.get_free_micros(1, date(2024, 11, 1), 1) == 8 * 3600 * 10 ** 6
+    # Цвет после убранных шагов берется у оставшегося использования
+    assert [usage.position_id for usage in filled_calendar.color_timeline[1]] == [8]
+    assert filled_calendar.get_last_color(1, datetime(2024, 11, 1, 10, 30)) is None
+    assert filled_calendar.get_last_color(1, datetime(2024, 11, 1, 15)) == "blue"
+
+
+def test_remove_unknown_position(filled_calendar):
+    before = shift_state(filled_calendar)
+
+    assert not filled_calendar.remove_position_usage(1, date(2024, 11, 1), 1, 12345)
+    assert shift_state(filled_calendar) == before
+
+
+@pytest.mark.parametrize('machine_calendar', ['dict', 'bitmap'], indirect=True)
+def test_rollback_remove_position_usage(filled_calendar):
+    before = shift_state(filled_calendar)
+
+    filled_calendar.begin()
+    assert filled_calendar.remove_position_usage(1, date(2024, 11, 1), 1, 7)
+    add_usage(filled_calendar, 9, 11, 9, "green")
+    filled_calendar.rollback()
+
+    assert shift_state(filled_calendar) == before
+    assert filled_calendar.get_last_color(1, datetime(2024, 11, 1, 10, 30)) == "red"
+    assert filled_calendar.get_last_color(1, datetime(2024, 11, 1, 15)) == "red"
@@ -0,0 +1,48 @@
+from random import Random
+
+import pytest
+
+from docs.classes.capacity_tree import CapacityTree
+
+
+def linear_find_first(values, slot, at_least):
+    """Первый подходящий слот простым перебором"""
+    for idx in range(slot, len(values)):
+        if values[idx] >= at_least:
+            return idx
+    return None
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('count', [1, 2, 7, 64, 100])
+def test_find_first_matches_linear_scan(seed, count):
+    rnd = Random(seed)
+    values = [rnd.randrange(0, 100) for _ in range(count)]
+    tree = CapacityTree(values)
+    for _ in range(50):
+        slot = rnd.randrange(count)
+        values[slot] = rnd.randrange(0, 100)
+        tree.update(slot, values[slot])
+        for at_least in (0, 1, 50, 99, 100):
+            start = rnd.randrange(count + 1)
+            assert tree.find_first(start, at_least) == linear_find_first(values, start, at_least)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_rollback_restores_answers(seed):
+    """Откат по журналу прежних значений слотов, как в ``WorkPlaces.calendar_rollback``, возвращает ответы"""
+    rnd = Random(seed)
+    values = [rnd.randrange(0, 100) for _ in range(50)]
+    tree = CapacityTree(values)
+    before = [[tree.find_first(slot, at_least) for at_least in range(0, 101, 10)] for slot in range(51)]
+
+    log = []
+    for _ in range(30):
+        slot = rnd.randrange(50)
+        log.append((slot, tree.value(slot)))
+        tree.update(slot, rnd.randrange(0, 100))
+    for slot, value in reversed(log):
+        tree.update(slot, value)
+
+    assert [tree.value(slot) for slot in range(50)] == values
+    assert [[tree.find_first(slot, at_least) for at_least in range(0, 101, 10)] for slot in range(51)] == before
@@ -0,0 +1,77 @@
+from datetime import datetime, date, timedelta
+from random import Random
+
+import pytest
+
+
+def reference_free_time(period, usages):
+    """Свободные промежутки смены, как их считал календарь на списках: пересчет по всем использованиям смены"""
+    free_time = []
+    free_end, end_shift = period
+    for start_usage, end_usage in sorted(usages):
+        if start_usage == free_end:
+            free_end = end_usage
+        else:
+            free_time.append((free_end, start_usage, (start_usage - free_end).total_seconds()))
+            free_end = end_usage
+    if free_end < end_shift:
+        free_time.append((free_end, end_shift, (end_shift - free_end).total_seconds()))
+    return free_time
+
+
+def add_usages(calendar, usages):
+    for start, end in usages:
+        calendar.add_machine_usage(1, date(2024, 11, 1), 1, (start, end, None, None, None))
+
+
+@pytest.mark.parametrize(
+    'usages',
+    [   #Использование в середине смены
+        [(datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 11))],
+        #Использования у начала и у конца смены
+        [(datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 11)),
+         (datetime(2024, 11, 1, 14), datetime(2024, 11, 1, 18))],
+        #Вся смена
+        [(datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 18))],
+        #Встык друг к другу и вразнобой
+        [(datetime(2024, 11, 1, 16), datetime(2024, 11, 1, 17)),
+         (datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 11)),
+         (datetime(2024, 11, 1, 14), datetime(2024, 11, 1, 15)),
+         (datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 10)),
+         (datetime(2024, 11, 1, 13), datetime(2024, 11, 1, 14))],
+        #Пересекающиеся использования - свободное время пересчитывается целиком
+        [(datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 12)),
+         (datetime(2024, 11, 1, 11), datetime(2024, 11, 1, 13))],
+        #Смена без использований
+        [],
+    ]
+)
+def test_split_matches_reference(machine_calendar, usages):
+    add_usages(machine_calendar, usages)
+    period = machine_calendar.get_period(1, date(2024, 11, 1), 1)
+
+    assert machine_calendar.get_free_time(1, date(2024, 11, 1), 1) == reference_free_time(period, usages)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_inserts_match_reference(machine_calendar, seed):
+    """После каждой вставки свободное время, его сумма и занятое время совпадают с пересчетом с нуля"""
+    rnd = Random(seed)
+    shift_start = datetime(2024, 11, 1, 9)
+    moments = sorted(rnd.sample(range(0, 9 * 3600), 30))
+    usages = [(shift_start + timedelta(seconds=moments[i]), shift_start + timedelta(seconds=moments[i + 1]))
+              for i in range(0, len(moments), 2)]
+    rnd.shuffle(usages)
+    period = machine_calendar.get_period(1, date(2024, 11, 1), 1)
+
+    inserted = []
+    for usage in usages:
+        add_usages(machine_calendar, [usage])
+        inserted.append(usage)
+        free_time = reference_free_time(period, inserted)
+
+        assert machine_calendar.get_free_time(1, date(2024, 11, 1), 1) == free_time
+        assert machine_calendar.get_free_micros(1, date(2024, 11, 1), 1) == \
+               sum(duration for _, _, duration in free_time) * 10 ** 6
+        assert machine_calendar.get_time_usage(1, date(2024, 11, 1), 1) == \
+               pytest.approx(sum((end - start).total_seconds() for start, end in inserted))
@@ -0,0 +1,72 @@
+from datetime import datetime, date
+from types import SimpleNamespace
+
+import pytest
+
+from docs.classes import Pairs, Positions, Steps
+from docs.optimizer.preparation_phase import _planned_pairs
+
+
+def make_position():
+    """Позиция из одной пары с двумя шагами по часу на группе машин 1"""
+    steps = []
+    for num in (1, 2):
+        step = Steps()
+        step.id = num
+        step.step_num = num
+        step.sequence_num = num
+        step.id_group_machine = 1
+        step.duration = step.original_duration = 3600.0
+        steps.append(step)
+
+    position = Positions()
+    position.id = 1
+    position.model_name = 1
+    position.quantity = 1
+    position.steps = steps
+    position.left_border = datetime(2024, 11, 1, 9)
+    position.right_border = datetime(2024, 11, 30, 18)
+    pair = Pairs()
+    pair.set_pair_attrs(position, 1)
+    pair.set_steps(steps)
+    position.pairs = [pair]
+    return position
+
+
+def saved_steps(id_workplace=1, day=1):
+    """Шаги сохраненного плана: 09:00-10:00 и 10:00-11:00 в первую смену"""
+    return {1: [SimpleNamespace(step_num=num, id_workplace=id_workplace, shift=1,
+                                start_date=datetime(2024, 11, day, 8 + num),
+                                end_date=datetime(2024, 11, day, 9 + num)) for num in (1, 2)]}
+
+
+def test_kept_steps_still_fit(workplaces):
+    pairs = _planned_pairs(make_position(), saved_steps())
+
+    assert [(step.id_workplace, step.start_date) for step in pairs[0].steps] == [
+        (1, datetime(2024, 11, 1, 9)), (1, datetime(2024, 11, 1, 10))]
+
+
+@pytest.mark.parametrize('machine_calendar', ['dict', 'bitmap'], indirect=True)
+def test_machine_interval_taken(workplaces):
+    """После аварии или правки календаря промежуток шага занят - позицию нужно ставить заново"""
+    workplaces.machine_calendar.add_machine_usage(1, date(2024, 11, 1), 1, (
+        datetime(2024, 11, 1, 10, 30), datetime(2024, 11, 1, 12), None, None, None))
+
+    assert _planned_pairs(make_position(), saved_steps()) is None
+
+
+def test_worker_shift_removed(workplaces):
+    del workplaces.worker_calendar.calendar[1].template[date(2024, 11, 1), 1]
+
+    assert _planned_pairs(make_position(), saved_steps()) is None
+
+
+def test_workplace_deleted(workplaces):
+    del workplaces.workplaces[1]
+
+    assert _planned_pairs(make_position(), saved_steps()) is None
+
+
+def test_steps_beyond_horizon(workplaces):
+    assert _planned_pairs(make_position(), saved_steps(day=3)) is None
@@ -0,0 +1,135 @@
+from datetime import datetime, date
+
+import pytest
+
+from docs.classes import Pairs, Positions, Steps
+from docs.database import Serialize
+from docs.optimizer.local_search import improve_plan, _replace, _try_move
+
+
+def make_position(id_position, deadline, durations=(600, 7 * 3600)):
+    """Позиция из одной пары с шагами заданной длительности в секундах на группе машин 1"""
+    steps = []
+    for num, duration in enumerate(durations, start=1):
+        step = Steps()
+        step.id = num
+        step.step_num = num
+        step.sequence_num = num
+        step.id_group_machine = 1
+        step.duration = step.original_duration = duration
+        steps.append(step)
+
+    position = Positions()
+    position.id = id_position
+    position.model_name = id_position
+    position.quantity = 1
+    position.freeze = False
+    position.steps = steps
+    position.left_border = datetime(2024, 11, 1, 9)
+    position.right_border = datetime(2024, 11, 2, 18)
+    position.deadline = deadline
+    pair = Pairs()
+    pair.set_pair_attrs(position, 1)
+    pair.set_steps(steps)
+    position.pairs = [pair]
+    return position
+
+
+def calendar_state(workplaces):
+    """Использования и свободное время всех смен календарей оборудования и работников"""
+    state = []
+    for calendar in (workplaces.machine_calendar, workplaces.worker_calendar):
+        for id_obj, obj_calendar in sorted(calendar.calendar.items()):
+            for cal_date, shift in sorted(obj_calendar.template):
+                state.append((id_obj, cal_date, shift,
+                              [(usage.start, usage.end, usage.position_id)
+                               for usage in calendar.get_machine_usage(id_obj, cal_date, shift)],
+                              calendar.get_free_spans(id_obj, cal_date, shift)))
+    return state
+
+
+def steps_state(positions):
+    return [[(step.id_workplace, step.start_date, step.end_date) for pair in position.pairs for step in pair.steps]
+            for position in positions]
+
+
+@pytest.fixture
+def one_worker(workplaces, monkeypatch):
+    """Работник 2 занят весь горизонт, поэтому вместе с ним занята и машина 2: свободно только место 1"""
+    monkeypatch.setattr(Positions, "count_success", 0)
+    monkeypatch.setattr(Positions, "count_prod_order", 0)
+    for day in (1, 2):
+        for shift, (start, end) in ((1, (9, 13)), (2, (14, 18))):
+            workplaces.add_machine_usage(2, [{"start": datetime(2024, 11, day, start),
+                                              "end": datetime(2024, 11, day, end),
+                                              "dur": (end - start) * 3600, "shift": shift}], None, 100)
+    return workplaces
+
+
+def plan(victim_deadline):
+    """
+    Опоздавшая позиция 2 стоит после позиции 1: обе занимают по 7 часов 10 минут на месте 1,
+    позиция 1 кончается 01.11 в 17:10, позиция 2 - только 02.11 в 16:20 при сроке 01.11 18:00
+    """
+    victim = make_position(1, victim_deadline)
+    target = make_position(2, datetime(2024, 11, 1, 18))
+    _replace([victim, target])
+    assert victim.status == Serialize.get_pos_status("chosen")
+    assert target.status == Serialize.get_pos_status("deadline")
+    return victim, target
+
+
+@pytest.mark.parametrize('machine_calendar', ['dict', 'bitmap'], indirect=True)
+def test_late_position_moved_ahead(one_worker):
+    victim, target = plan(victim_deadline=datetime(2024, 11, 2, 18))
+
+    improve_plan([victim, target], time_budget=60)
+
+    assert victim.status == target.status == Serialize.get_pos_status("chosen")
+    assert target.start_date == datetime(2024, 11, 1, 9)
+    assert target.end_date == datetime(2024, 11, 1, 17, 10)
+    assert victim.start_date == datetime(2024, 11, 1, 17, 10)
+    assert one_worker.machine_calendar.undo_log is None
+    assert Positions.count_success == 1
+
+
+@pytest.mark.parametrize('machine_calendar', ['dict', 'bitmap'], indirect=True)
+def test_worse_move_rolled_back(one_worker):
+    """Запаса у позиции 1 меньше, чем она опоздает после хода: ход откатывается целиком"""
+    victim, target = plan(victim_deadline=datetime(2024, 11, 1, 17, 30))
+    calendar_before = calendar_state(one_worker)
+    steps_before = steps_state((victim, target))
+    dates_before = [(position.status, position.start_date, position.end_date) for position in (victim, target)]
+    capacity_before = one_worker.period_capacity_micros(1, date(2024, 11, 1), date(2024, 11, 2))
+
+    assert not _try_move(target, victim)
+
+    assert calendar_state(one_worker) == calendar_before
+    assert steps_state((victim, target)) == steps_before
+    assert [(position.status, position.start_date, position.end_date) for position in (victim, target)] == dates_before
+    assert one_worker.period_capacity_micros(1, date(2024, 11, 1), date(2024, 11, 2)) == capacity_before
+    assert one_worker.machine_calendar.undo_log is None
+
+
+def test_release_position(one_worker):
+    """Снятая позиция освобождает календари, и на ее место встает следующая"""
+    empty = calendar_state(one_worker)
+    victim, target = plan(victim_deadline=datetime(2024, 11, 2, 18))
+
+    one_worker.release_position(victim)
+    one_worker.release_position(target)
+
+    assert calendar_state(one_worker) == empty
+    _replace([target])
+    assert target.start_date == datetime(2024, 11, 1, 9)
+
+
+def test_week_plan_not_improved(one_worker, monkeypatch):
+    victim, target = plan(victim_deadline=datetime(2024, 11, 2, 18))
+    steps_before = steps_state((victim, target))
+    monkeypatch.setattr(Serialize, "command", "week")
+
+    improve_plan([victim, target], time_budget=60)
+
+    assert steps_state((victim, target)) == steps_before
+    assert target.status == Serialize.get_pos_status("deadline")
@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from docs.classes import Pairs, Positions, Steps
+from docs.optimizer import create_prod_plan
+
+
+def make_position(quantity, durations=(600.0, 900.0, 300.0)):
+    """Позиция из ``quantity`` пар с шагами заданной длительности на одной группе машин"""
+    steps = []
+    for num, duration in enumerate(durations, start=1):
+        step = Steps()
+        step.id = num
+        step.step_num = num
+        step.sequence_num = num
+        step.id_group_machine = 1
+        step.duration = step.original_duration = duration
+        steps.append(step)
+
+    position = Positions()
+    position.id = 1
+    position.model_name = 1
+    position.quantity = quantity
+    position.steps = steps
+    position.left_border = datetime(2024, 11, 4, 9)
+    position.right_border = datetime(2024, 11, 30, 18)
+    position.pairs = []
+    for id_pair in range(1, quantity + 1):
+        pair = Pairs()
+        pair.set_pair_attrs(position, id_pair)
+        pair.set_steps(steps)
+        position.pairs.append(pair)
+    return position
+
+
+def place(pair, start, pieces_by_step):
+    """Расставляет шаги пары подряд от ``start``, разбивая шаг на куски по долям из ``pieces_by_step``"""
+    placed = []
+    for step in pair.steps:
+        for share in pieces_by_step.get(step.step_num, (1.0,)):
+            piece = step.get_deepcopy()
+            piece.duration = step.duration * share
+            piece.start_date = start
+            piece.end_date = start + timedelta(seconds=piece.duration)
+            piece.id_workplace = 1
+            start = piece.end_date
+            placed.append(piece)
+    pair.steps = placed
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 4])
+@pytest.mark.parametrize('pieces_by_step', [{}, {2: (0.5, 0.5)}, {1: (0.1, 0.6, 0.3), 3: (0.75, 0.25)}])
+def test_expand_lot_round_trip(size, pieces_by_step):
+    """Шаги партии делятся между ее парами поровну, по порядку и без дыр"""
+    position = make_position(size)
+    lot = Pairs.make_lot(position.pairs)
+    place(lot, datetime(2024, 11, 4, 9), pieces_by_step)
+
+    expanded = lot.expand_lot()
+
+    assert sorted({id_pair for id_pair, _ in expanded}) == [pair.id for pair in position.pairs]
+    for step in position.steps:
+        lot_pieces = [piece for piece in lot.steps if piece.step_num == step.step_num]
+        pair_pieces = [piece for _, piece in expanded if piece.step_num == step.step_num]
+        # Куски пар идут подряд и покрывают куски партии целиком
+        assert pair_pieces[0].start_date == lot_pieces[0].start_date
+        assert pair_pieces[-1].end_date == lot_pieces[-1].end_date
+        assert sum(piece.duration for piece in pair_pieces) == pytest.approx(step.duration * size)
+        for id_pair in lot.lot:
+            duration = sum(piece.duration for piece_pair, piece in expanded
+                           if piece_pair == id_pair and piece.step_num == step.step_num)
+            assert duration == pytest.approx(step.original_duration)
+
+
+def test_expand_lot_not_placed():
+    position = make_position(4)
+    lot = Pairs.make_lot(position.pairs)
+
+    expanded = lot.expand_lot()
+
+    assert len(expanded) == 4 * len(position.steps)
+    assert all(step.start_date is None for _, step in expanded)
+    assert [step.duration for id_pair, step in expanded if id_pair == 1] == [600.0, 900.0, 300.0]
+
+
+class SingleMachine:
+    """Одна машина, на которой шаги идут друг за другом без перерывов"""
+
+    def __init__(self):
+        self.free_from = datetime(2024, 11, 4, 9)
+
+    def set_calendar_copy(self):
+        pass
+
+    def calendar_rollback(self):
+        pass
+
+    def add_machine_usage(self, id_workplace, spaces, id_boots, id_position):
+        self.free_from = spaces[-1]['end']
+
+    def find_space_for_step(self, pair, step, prod_day, prev_step_end, rng=None):
+        start = max(self.free_from, prev_step_end or self.free_from)
+        end = start + timedelta(seconds=step.duration)
+        return {1: [{'start': start, 'end': end}]}, 1, prod_day, end
+
+
+@pytest.mark.parametrize('lot_size', [2, 3, 4, 8])
+def test_simulated_duration_with_lots(monkeypatch, lot_size):
+    """Партии дают ту же длительность позиции, что и поштучная расстановка пар"""
+    results = []
+    for size in (None, lot_size):
+        machine = SingleMachine()
+        monkeypatch.setattr(create_prod_plan, "WorkPlaces", lambda: machine)
+        monkeypatch.setattr(create_prod_plan, "find_space_for_step", machine.find_space_for_step)
+        position = make_position(8)
+        if size:
+            monkeypatch.setattr(Positions, "positions", [position])
+            Positions.set_lots(size)
+        results.append(create_prod_plan._simulate_position_duration(position))
+
+    assert results[0]['end'] - results[0]['start'] == timedelta(seconds=8 * 1800)
+    assert results[1] == results[0]
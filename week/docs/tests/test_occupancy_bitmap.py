@@ -0,0 +1,84 @@
+from datetime import datetime, date, timedelta
+from random import Random
+
+import pytest
+
+from docs.classes.occupancy_bitmap import OccupancyBitmap
+
+
+def random_usages(seed, count=10):
+    """Непересекающиеся использования смены 09:00-18:00, выровненные по минутам, в случайном порядке"""
+    rnd = Random(seed)
+    shift_start = datetime(2024, 11, 1, 9)
+    minutes = sorted(rnd.sample(range(0, 9 * 60), count * 2))
+    usages = [(shift_start + timedelta(minutes=minutes[i]), shift_start + timedelta(minutes=minutes[i + 1]))
+              for i in range(0, len(minutes), 2)]
+    rnd.shuffle(usages)
+    return usages
+
+
+def dict_first_free_run(free_time, after, duration):
+    """Первый свободный участок по промежуткам календаря на словарях"""
+    for start, end, _ in free_time:
+        start = max(start, after)
+        if (end - start).total_seconds() >= duration:
+            return start
+    return None
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_free_time_matches_dict_calendar(machine_calendar, seed):
+    bitmap = OccupancyBitmap(datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 18))
+    for start, end in random_usages(seed):
+        bitmap.occupy(start, end)
+        machine_calendar.add_machine_usage(1, date(2024, 11, 1), 1, (start, end, None, None, None))
+
+    assert bitmap.free_time() == machine_calendar.get_free_time(1, date(2024, 11, 1), 1)
+    assert bitmap.free_spans() == machine_calendar.get_free_spans(1, date(2024, 11, 1), 1)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_first_free_run_matches_dict_calendar(machine_calendar, seed):
+    bitmap = OccupancyBitmap(datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 18))
+    for start, end in random_usages(seed):
+        bitmap.occupy(start, end)
+        machine_calendar.add_machine_usage(1, date(2024, 11, 1), 1, (start, end, None, None, None))
+    free_time = machine_calendar.get_free_time(1, date(2024, 11, 1), 1)
+
+    rnd = Random(seed)
+    for _ in range(20):
+        after = datetime(2024, 11, 1, 9) + timedelta(minutes=rnd.randrange(9 * 60))
+        duration = rnd.randrange(1, 120) * 60
+        assert bitmap.first_free_run(after, duration) == dict_first_free_run(free_time, after, duration)
+
+
+@pytest.mark.parametrize('machine_calendar', ['bitmap'], indirect=True)
+def test_bitmap_backend_rollback(machine_calendar):
+    """Календарь на битовых картах отдает то же свободное время и откатывает вставки"""
+    machine_calendar.add_machine_usage(1, date(2024, 11, 1), 1,
+                                       (datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 11), None, None, None))
+    before = machine_calendar.get_free_time(1, date(2024, 11, 1), 1)
+
+    machine_calendar.begin()
+    for start, end in random_usages(1):
+        if start >= datetime(2024, 11, 1, 11) or end <= datetime(2024, 11, 1, 10):
+            machine_calendar.add_machine_usage(1, date(2024, 11, 1), 1, (start, end, None, None, None))
+    machine_calendar.rollback()
+
+    assert before == [(datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 10), 3600.0),
+                      (datetime(2024, 11, 1, 11), datetime(2024, 11, 1, 18), 25200.0)]
+    assert machine_calendar.get_free_time(1, date(2024, 11, 1), 1) == before
+
+
+def test_intersect():
+    """Свободен только слот, свободный в обеих сменах, в пределах общего периода"""
+    machine = OccupancyBitmap(datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 18))
+    worker = OccupancyBitmap(datetime(2024, 11, 1, 8), datetime(2024, 11, 1, 17))
+    machine.occupy(datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 11))
+    worker.occupy(datetime(2024, 11, 1, 12), datetime(2024, 11, 1, 13))
+
+    assert machine.intersect(worker).free_time() == [
+        (datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 10), 3600.0),
+        (datetime(2024, 11, 1, 11), datetime(2024, 11, 1, 12), 3600.0),
+        (datetime(2024, 11, 1, 13), datetime(2024, 11, 1, 17), 14400.0),
+    ]
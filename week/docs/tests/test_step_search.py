@@ -0,0 +1,205 @@
+import random
+from datetime import datetime, date, timedelta
+
+import pytest
+
+from docs.classes import Pairs, Positions, Steps
+from docs.classes.usage_store import from_micros, to_micros
+from docs.optimizer.create_prod_plan import workplaces_spaces_traversing, find_space_for_step, _lacks_capacity, \
+    place_position
+
+
+def make_position(durations, quantity=1):
+    """Позиция из ``quantity`` пар с шагами заданной длительности в секундах на группе машин 1"""
+    steps = []
+    for num, duration in enumerate(durations, start=1):
+        step = Steps()
+        step.id = num
+        step.step_num = num
+        step.sequence_num = num
+        step.id_group_machine = 1
+        step.duration = step.original_duration = duration
+        steps.append(step)
+
+    position = Positions()
+    position.id = 1
+    position.model_name = 1
+    position.quantity = quantity
+    position.steps = steps
+    position.left_border = datetime(2024, 11, 1, 9)
+    position.right_border = datetime(2024, 11, 2, 18)
+    position.pairs = []
+    for id_pair in range(1, quantity + 1):
+        pair = Pairs()
+        pair.set_pair_attrs(position, id_pair)
+        pair.set_steps(steps)
+        position.pairs.append(pair)
+    return position
+
+
+def occupy(workplaces, id_workplace, start, end, shift, id_position=100):
+    workplaces.add_machine_usage(id_workplace, [{"start": start, "end": end, "dur": (end - start).total_seconds(),
+                                                 "shift": shift}], None, id_position)
+
+
+def fill_randomly(workplaces, rng, count):
+    """Занимает ``count`` случайных отрезков с точностью до минуты в свободном времени рабочих мест"""
+    for id_position in range(100, 100 + count):
+        id_workplace = rng.choice(sorted(workplaces.workplaces))
+        cal_date = date(2024, 11, rng.choice((1, 2)))
+        shift = rng.choice(workplaces.get_shifts())
+        spans = workplaces.get_free_spans(id_workplace, cal_date, shift)
+        if not spans:
+            continue
+        space_start, space_end = rng.choice(spans)
+        minutes = (space_end - space_start) // (60 * 10 ** 6)
+        if minutes < 1:
+            continue
+        first = rng.randrange(minutes)
+        last = rng.randint(first + 1, min(minutes, first + 120))
+        occupy(workplaces, id_workplace, from_micros(space_start) + timedelta(minutes=first),
+               from_micros(space_start) + timedelta(minutes=last), shift, id_position)
+
+
+def brute_force_spaces(workplaces, duration, prod_day, prev_end, preferred_worker=None):
+    """
+    Эталон трехмесячного поиска: день за днем, смена за сменой, по рабочим местам группы 1 (сначала места
+    предпочтительного работника) копит свободные промежутки после ``prev_end``, пока одному месту не хватит
+    на шаг. Возвращает рабочее место и промежутки (``начало``, ``конец``, ``смена``) или ``None``
+    """
+    order = sorted(workplaces.wp_by_group[1], key=lambda wp: workplaces.workplaces[wp]["worker"] != preferred_worker)
+    need = duration * 10 ** 6
+    prev_end = to_micros(prev_end)
+    chosen = {wp: [] for wp in order}
+    cal_date = prod_day
+    while cal_date <= workplaces.max_date():
+        for shift in workplaces.get_shifts():
+            for wp in order:
+                for space_start, space_end in workplaces.get_free_spans(wp, cal_date, shift):
+                    if prev_end >= space_end:
+                        continue
+                    start = max(space_start, prev_end)
+                    collected = sum(end - begin for begin, end, _ in chosen[wp])
+                    if collected + space_end - start >= need:
+                        chosen[wp].append((start, start + need - collected, shift))
+                        return wp, [(from_micros(begin), from_micros(end), shift) for begin, end, shift in chosen[wp]]
+                    chosen[wp].append((start, space_end, shift))
+        cal_date += timedelta(days=1)
+    return None
+
+
+def found(spaces_for_cal, id_workplace):
+    return [(space["start"], space["end"], space["shift"]) for space in spaces_for_cal[id_workplace]]
+
+
+@pytest.mark.parametrize('machine_calendar', ['dict', 'bitmap'], indirect=True)
+@pytest.mark.parametrize('seed', range(15))
+def test_find_space_matches_brute_force(workplaces, seed):
+    rng = random.Random(seed)
+    fill_randomly(workplaces, rng, rng.randint(0, 40))
+    duration = rng.choice((600, 3600, 4 * 3600, 7 * 3600, 11 * 3600, 20 * 3600))
+    prev_end = rng.choice((None, datetime(2024, 11, 1, rng.randint(9, 17), rng.randrange(60))))
+    position = make_position((600, duration))
+    pair, step = position.pairs[0], position.pairs[0].steps[1]
+    preferred_worker = None
+    if rng.random() < 0.5:
+        pair.steps[0].id_workplace = rng.choice((1, 2, 3))
+        preferred_worker = workplaces.get_worker_by_workplace(pair.steps[0].id_workplace)
+
+    spaces_for_cal, id_workplace, prod_day, min_end = find_space_for_step(pair, step, date(2024, 11, 1), prev_end)
+
+    expected = brute_force_spaces(workplaces, duration, date(2024, 11, 1), prev_end or pair.left_border,
+                                  preferred_worker)
+    if expected is None:
+        assert spaces_for_cal is None
+        assert prod_day == date(2024, 11, 3)
+    else:
+        assert id_workplace == expected[0]
+        assert found(spaces_for_cal, id_workplace) == expected[1]
+        assert min_end == expected[1][-1][1]
+
+
+def test_step_split_across_shifts(workplaces):
+    """Шаг длиннее смены работника собирается из промежутков первой и второй смен, обеденный перерыв пропускается"""
+    occupy(workplaces, 1, datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 11), 1)
+    pair = make_position((600, 6 * 3600)).pairs[0]
+
+    choosen_spaces, enough_space, prod_day = workplaces_spaces_traversing(pair, pair.steps[1], date(2024, 11, 1),
+                                                                          None)
+
+    assert enough_space
+    assert prod_day == date(2024, 11, 1)
+    # Смены обходятся раньше рабочих мест: место 1 набирает 6 часов во второй смене раньше, чем места 2 и 3
+    assert list(choosen_spaces) == [1]
+    assert [(from_micros(space.start), from_micros(space.end), space.shift) for space in choosen_spaces[1]] == [
+        (datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 10), 1),
+        (datetime(2024, 11, 1, 11), datetime(2024, 11, 1, 13), 1),
+        (datetime(2024, 11, 1, 14), datetime(2024, 11, 1, 17), 2),
+    ]
+
+
+def test_step_spans_several_spaces(workplaces):
+    """Шаг собирается из нескольких промежутков одного места вокруг занятого времени и продолжается на следующий день"""
+    for id_workplace in (1, 2):
+        occupy(workplaces, id_workplace, datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 12), 1)
+        occupy(workplaces, id_workplace, datetime(2024, 11, 1, 14), datetime(2024, 11, 1, 18), 2)
+    occupy(workplaces, 3, datetime(2024, 11, 1, 14), datetime(2024, 11, 1, 17), 2)
+    pair = make_position((600, 3 * 3600)).pairs[0]
+
+    spaces_for_cal, id_workplace, prod_day, min_end = find_space_for_step(pair, pair.steps[1], date(2024, 11, 1),
+                                                                          None)
+
+    # Машина 2 занята местом 2, поэтому у места 3 свободно только то же время, что и у места 2
+    assert id_workplace == 1
+    assert found(spaces_for_cal, 1) == [
+        (datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 10), 1),
+        (datetime(2024, 11, 1, 12), datetime(2024, 11, 1, 13), 1),
+        (datetime(2024, 11, 2, 9), datetime(2024, 11, 2, 10), 1),
+    ]
+    assert min_end == datetime(2024, 11, 2, 10)
+
+
+@pytest.mark.parametrize('previous_workplace, expected', [(None, 2), (2, 2), (3, 3)])
+def test_preferred_worker(workplaces, previous_workplace, expected):
+    """Шаг достается работнику предыдущего шага пары, даже если по порядку мест первым идет другое место"""
+    # Машина 1 занята в первую смену, работник 1 свободен и может работать на машине 2 местом 3
+    workplaces.machine_calendar.add_machine_usage(1, date(2024, 11, 1), 1, (
+        datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 13), None, 100, None))
+    pair = make_position((600, 3600)).pairs[0]
+    pair.steps[0].id_workplace = previous_workplace
+
+    spaces_for_cal, id_workplace, _, _ = find_space_for_step(pair, pair.steps[1], date(2024, 11, 1), None)
+
+    assert id_workplace == expected
+    assert found(spaces_for_cal, expected) == [(datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 10), 1)]
+
+
+def placed(workplaces, position):
+    """Ставит позицию и откатывает календарь, возвращает, встала ли она"""
+    workplaces.set_calendar_copy()
+    try:
+        return place_position(position)
+    finally:
+        workplaces.calendar_rollback()
+
+
+@pytest.mark.parametrize('quantity, fits', [(2, True), (3, False)])
+def test_lacks_capacity_at_the_limit(workplaces, quantity, fits):
+    """Две пары по 15 часов почти исчерпывают 32 часа работников группы и встают, третья уже не помещается"""
+    position = make_position((3600, 15 * 3600), quantity)
+
+    assert _lacks_capacity(position, workplaces) == (not fits)
+    assert placed(workplaces, position) == fits
+
+
+@pytest.mark.parametrize('machine_calendar', ['dict', 'bitmap'], indirect=True)
+@pytest.mark.parametrize('seed', range(30))
+def test_lacks_capacity_never_rejects_fitting_position(workplaces, seed):
+    rng = random.Random(seed)
+    fill_randomly(workplaces, rng, rng.randint(0, 60))
+    durations = [rng.choice((600, 3600, 3 * 3600, 6 * 3600, 12 * 3600)) for _ in range(rng.randint(1, 3))]
+    position = make_position(durations, rng.randint(1, 3))
+
+    lacks = _lacks_capacity(position, workplaces)
+
+    assert not (lacks and placed(workplaces, position))
@@ -0,0 +1,60 @@
+from bisect import insort
+from datetime import datetime, timedelta
+from random import Random
+
+import pytest
+
+from docs.classes.usage_store import UsageStore, machine_usage_tuple
+
+
+def random_usages(seed, count=50):
+    """Использования со случайными, в том числе совпадающими, временами, ботинками, позициями и цветами"""
+    rnd = Random(seed)
+    day = datetime(2024, 11, 1, 9)
+    usages = []
+    for _ in range(count):
+        start = day + timedelta(minutes=rnd.randrange(0, 540, 15))
+        end = start + timedelta(minutes=rnd.choice((15, 30, 45)))
+        usages.append(machine_usage_tuple(start, end, rnd.choice((None, 1, "boots")), rnd.choice((None, 7, 8)),
+                                          rnd.choice((None, "red", "blue"))))
+    return usages
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_matches_sorted_list(seed):
+    """Хранилище ведет себя как список использований, отсортированный по (``start``, ``end``)"""
+    store = UsageStore()
+    reference = []
+    for usage in random_usages(seed):
+        idx = store.insert(usage)
+        insort(reference, usage, key=lambda x: (x.start, x.end))
+
+        assert store[idx] == usage
+        assert list(store) == reference
+    assert list(store.intervals()) == [(x.start, x.end) for x in reference]
+    assert len(store) == len(reference)
+
+
+def test_delete_and_copy():
+    store = UsageStore()
+    usages = random_usages(1, 10)
+    for usage in usages:
+        store.insert(usage)
+    store_copy = store.copy()
+
+    del store[0]
+
+    assert len(store) == len(usages) - 1
+    assert len(store_copy) == len(usages)
+    assert list(store_copy)[1:] == list(store)
+
+
+def test_bisect():
+    store = UsageStore()
+    store.insert((datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 11), None, None, None))
+    store.insert((datetime(2024, 11, 1, 12), datetime(2024, 11, 1, 13), None, None, None))
+
+    assert store.bisect(datetime(2024, 11, 1, 9), datetime(2024, 11, 1, 9)) == 0
+    assert store.bisect(datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 11)) == 1
+    assert store.bisect(datetime(2024, 11, 1, 11), datetime(2024, 11, 1, 11)) == 1
+    assert store.bisect(datetime(2024, 11, 1, 18), datetime(2024, 11, 1, 18)) == 2